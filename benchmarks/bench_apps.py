@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+🏁 Offline throughput benchmark for the Modal apps
+Runs each FastAPI app in-process (Modal functions executed locally, Volumes
+and Dicts in memory) against stand-ins: the fake Gemini model and the local
+stub servers (fixture sites with imprint pages and logos, gmaps and
+imprint-reader backends). Every scenario runs in a fresh subprocess so its
+peak RSS is its own. The JSON report is meant to be diffed across commits:
+
+    python benchmarks/bench_apps.py --output bench-main.json
+    python benchmarks/bench_apps.py --output bench-branch.json --compare bench-main.json
+
+    python benchmarks/bench_apps.py --scenarios freestyle --scale 1000 --latency 0.5 --rate-limit-rate 0.02
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from typing import Any, Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "modal_apps"))
+sys.path.insert(0, BENCH_DIR)
+
+# Default items per request for each scenario
+SCENARIOS = {
+    "freestyle": 200,
+    "keyword-kombat": 50,
+    "crawl4logo": 10,
+    "crawl4imprint": 50,
+    "gmaps": 20,
+    "contacts": 20,
+}
+REQUIRED_MODULES = {
+    "crawl4logo": ["bs4", "PIL", "fake_useragent", "aiohttp"],
+    "contacts": ["aiohttp"],
+    "gmaps": ["aiohttp"],
+}
+COMPARED_FIELDS = ("items_per_s", "p50_ms", "p95_ms", "p99_ms", "peak_rss_mb")
+
+
+class _LocalRemote:
+    """Stand-in for Function.remote: runs the function body in this process"""
+
+    def __init__(self, function):
+        self.function = function
+
+    def __call__(self, *args, **kwargs):
+        return self.function.local(*args, **kwargs)
+
+    async def aio(self, *args, **kwargs):
+        return await self.function.local(*args, **kwargs)
+
+
+class _LocalRemoteGen:
+    """Stand-in for Function.remote_gen of generator functions"""
+
+    def __init__(self, function):
+        self.function = function
+
+    def __call__(self, *args, **kwargs):
+        return self.function.local(*args, **kwargs)
+
+    def aio(self, *args, **kwargs):
+        return self.function.local(*args, **kwargs)
+
+
+class _MemoryDict:
+    def __init__(self):
+        self.data: Dict[Any, Any] = {}
+        self.put = self._method(lambda key, value: self.data.__setitem__(key, value))
+        self.get = self._method(lambda key, default=None: self.data.get(key, default))
+
+    @staticmethod
+    def _method(fn: Callable):
+        class Method:
+            def __call__(self, *args, **kwargs):
+                return fn(*args, **kwargs)
+
+            async def aio(self, *args, **kwargs):
+                return fn(*args, **kwargs)
+
+        return Method()
+
+
+class _MemoryVolume:
+    def __init__(self):
+        self.commit = _MemoryDict._method(lambda: None)
+        self.reload = _MemoryDict._method(lambda: None)
+
+
+def run_modal_locally(module):
+    """Point every Modal function, Dict and Volume of an app module at in-process stand-ins"""
+    import modal
+
+    for name, value in list(vars(module).items()):
+        if isinstance(value, modal.Function):
+            value.remote = _LocalRemote(value)
+            value.remote_gen = _LocalRemoteGen(value)
+        elif isinstance(value, modal.Dict):
+            setattr(module, name, _MemoryDict())
+        elif isinstance(value, modal.Volume):
+            setattr(module, name, _MemoryVolume())
+    if hasattr(module, "CHECKPOINT_DIR"):
+        module.CHECKPOINT_DIR = tempfile.mkdtemp(prefix="bench-checkpoints-")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(pct / 100 * len(ordered))) - 1]
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def scenario_setup(name: str, scale: int, args, sites_url: str):
+    """(module name, path, payload builder for request r, items in a response)"""
+    def site(n: int) -> str:
+        return f"{sites_url}/sites/{n}/"
+
+    if name == "freestyle":
+        columns = ["Company", "Website", "Country", "Industry"]
+        return "loop_over_rows_fastapi_app", "/process", lambda r: {
+            "mode": "freestyle",
+            "headers": columns,
+            "rows": [[f"Company {r}-{i}", site(r * scale + i), "DE", "Software"] for i in range(scale)],
+            "prompt": "Summarize the company and score its fit from 0 to 100.",
+            "request_id": f"bench-{r}",
+        }, lambda out: out.get("processed_count", 0)
+    if name == "keyword-kombat":
+        return "keyword_kombat_frontand_wrapper", "/process", lambda r: {
+            "keywords": [f"keyword {r}-{i}" for i in range(scale)],
+            "company_url": site(r),
+        }, lambda out: out.get("items_processed", 0)
+    if name == "crawl4logo":
+        return "crawl4logo_app", "/process", lambda r: {
+            "urls": [site(r * scale + i) for i in range(scale)],
+        }, lambda out: sum(1 for item in out.get("results", []) if item.get("success"))
+    if name == "crawl4imprint":
+        return "crawl4imprint_frontand_wrapper", "/process", lambda r: {
+            "websites": [site(r * scale + i) for i in range(scale)],
+        }, lambda out: out.get("items_processed", 0)
+    if name == "gmaps":
+        return "gmaps_wrapper", "/process", lambda r: {
+            "locations": [f"Berlin {r}-{i}" for i in range(scale)],
+            "search_terms": ["software"],
+            "max_results": scale * 5,
+        }, lambda out: out.get("items_processed", 0)
+    if name == "contacts":
+        return "crawl4contacts_wrapper", "/process", lambda r: {
+            "companies": [site(r * scale + i) for i in range(scale)],
+            "contact_types": ["email", "phone", "name", "position"],
+        }, lambda out: len({row["company"] for row in out.get("results", []) if not row.get("error")})
+    raise ValueError(f"Unknown scenario: {name}")
+
+
+async def drive(app, path: str, payloads: List[Dict[str, Any]], concurrency: int, count_items: Callable):
+    import httpx
+
+    latencies: List[float] = []
+    items = 0
+    errors: List[str] = []
+    slots = asyncio.Semaphore(max(1, concurrency))
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def one(payload: Dict[str, Any]):
+            nonlocal items
+            async with slots:
+                started = time.perf_counter()
+                response = await client.post(path, json=payload)
+                latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors.append(f"{response.status_code}: {response.text[:200]}")
+                return
+            items += count_items(response.json())
+
+        started = time.perf_counter()
+        await asyncio.gather(*[one(payload) for payload in payloads])
+        wall = time.perf_counter() - started
+    return latencies, items, errors, wall
+
+
+def run_scenario(name: str, args) -> Dict[str, Any]:
+    """Child process: set up stand-ins, drive the app and report"""
+    import fake_gemini
+    from stub_servers import build_gmaps_app, build_imprint_app, build_sites_app, start_stub_thread
+
+    warnings.filterwarnings("ignore")
+    scale = args.scale or SCENARIOS[name]
+    result: Dict[str, Any] = {"scenario": name, "scale": scale, "requests": args.requests}
+    missing = [m for m in REQUIRED_MODULES.get(name, []) if importlib.util.find_spec(m) is None]
+    if missing:
+        return {**result, "skipped": f"missing dependency: {', '.join(missing)}"}
+
+    fake_gemini.install(fake_gemini.FakeGeminiConfig(
+        latency=args.latency, latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, seed=args.seed,
+    ))
+    os.environ.setdefault("GEMINI_API_KEY", "offline-benchmark")
+    stops = []
+    stop, sites_url = start_stub_thread(build_sites_app(latency=args.site_latency, seed=args.seed))
+    stops.append(stop)
+    stop, gmaps_url = start_stub_thread(build_gmaps_app(latency=args.backend_latency, seed=args.seed))
+    stops.append(stop)
+    stop, imprint_url = start_stub_thread(build_imprint_app(latency=args.backend_latency, seed=args.seed))
+    stops.append(stop)
+    os.environ["IMPRINT_BACKEND_URL"] = imprint_url + "/"
+    os.environ["GMAPS_BACKEND_URL"] = gmaps_url + "/search"
+
+    try:
+        import shared_fetch
+
+        # All fixture sites share one host; the production politeness limits would only measure themselves
+        shared_fetch._fetcher = shared_fetch.SharedFetcher(politeness=shared_fetch.HostPoliteness(max_concurrent=64, min_interval=0.0))
+
+        module_name, path, build_payload, count_items = scenario_setup(name, scale, args, sites_url)
+        module = __import__(module_name)
+        run_modal_locally(module)
+        payloads = [build_payload(r) for r in range(args.requests)]
+        baseline = peak_rss_mb()
+        latencies, items, errors, wall = asyncio.run(drive(module.app, path, payloads, args.concurrency, count_items))
+    finally:
+        for stop in stops:
+            stop()
+
+    return {
+        **result,
+        "items": items,
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "wall_s": round(wall, 3),
+        "items_per_s": round(items / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "peak_rss_growth_mb": round(peak_rss_mb() - baseline, 1),
+        "model": fake_gemini.STATS.to_dict(),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=BENCH_DIR).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    """Relative change per scenario and field versus a previous report"""
+    before = {r["scenario"]: r for r in baseline.get("results", [])}
+    deltas = {}
+    for result in report["results"]:
+        old = before.get(result["scenario"])
+        if not old or "skipped" in result or "skipped" in old:
+            continue
+        deltas[result["scenario"]] = {
+            f: round((result[f] - old[f]) / old[f] * 100, 1) if old.get(f) else None for f in COMPARED_FIELDS
+        }
+    return {"baseline_commit": baseline.get("commit"), "change_pct": deltas}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--scale", type=int, default=0, help="items per request (default: per scenario)")
+    parser.add_argument("--requests", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=1, help="concurrent requests")
+    parser.add_argument("--latency", type=float, default=0.05, help="median fake model latency (s)")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of model calls answered with 429")
+    parser.add_argument("--site-latency", type=float, default=0.01)
+    parser.add_argument("--backend-latency", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here as well")
+    parser.add_argument("--compare", help="previous report to compute relative changes against")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_scenario(args.child, args)))
+        return
+
+    report = {"commit": git_commit(), "config": {k: v for k, v in vars(args).items() if k not in ("child", "output", "compare")}, "results": []}
+    child_args = sys.argv[1:]
+    for name in args.scenarios:
+        out = subprocess.run([sys.executable, __file__, *child_args, "--child", name], capture_output=True, text=True)
+        lines = [line for line in out.stdout.splitlines() if line.startswith("{")]
+        if out.returncode != 0 or not lines:
+            report["results"].append({"scenario": name, "failed": (out.stderr or out.stdout)[-1000:]})
+            continue
+        report["results"].append(json.loads(lines[-1]))
+    if args.compare:
+        with open(args.compare) as f:
+            report["comparison"] = compare(report, json.load(f))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
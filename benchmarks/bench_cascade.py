@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+🪜 Model cascade benchmark
+Scores the same keyword list with Keyword Kombat (loop-over-rows'
+kombat_events, fake Gemini models) three ways and reports calls per model,
+cost, wall time, model latency and how many keep/drop decisions at the
+80-point filter differ from the strong model's:
+
+  strong      every keyword on the strong model only
+  cheap       every keyword on the cheap model only
+  cascade     cheap first, strong on invalid answers and scores near 80
+
+The cheap fake model is faster, cheaper, a few points off per keyword and
+occasionally leaves out a field, so cheap-only saves the most but flips
+decisions near the threshold, which the cascade sends up a tier.
+
+    python benchmarks/bench_cascade.py --keywords 200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import warnings
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "modal_apps"))
+sys.path.insert(0, BENCH_DIR)
+
+import fake_gemini  # noqa: E402
+from bench_apps import percentile, run_modal_locally  # noqa: E402
+
+STRONG = "models/gemini-2.5-flash"
+CHEAP = "models/gemini-2.5-flash-lite"
+VARIANTS = {"strong": [STRONG], "cheap": [CHEAP], "cascade": [CHEAP, STRONG]}
+
+
+async def run_variant(module, keywords, models, margin: int):
+    fake_gemini.STATS.__init__()
+    request = module.KeywordKombatRequest(
+        keywords=keywords,
+        company_url="https://example.de",
+        cluster_keywords=False,
+        model_cascade=models,
+        escalation_margin=margin,
+    )
+    started = time.perf_counter()
+    done = None
+    async for event in module.kombat_events(request):
+        if event["event"] == "done":
+            done = event
+    elapsed = time.perf_counter() - started
+    return done, elapsed, dict(fake_gemini.STATS.calls_by_model), list(fake_gemini.STATS.latencies)
+
+
+def decisions_differ(results, keywords, threshold: int) -> int:
+    """Keywords whose keep/drop at the threshold differs from a noise-free score"""
+    kept = {r["Keyword"] for r in results if r.get("RelevanceScore", 0) >= threshold}
+    return sum(1 for kw in keywords if (kw in kept) != (fake_gemini.true_score(kw) >= threshold))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keywords", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="strong model latency in seconds")
+    parser.add_argument("--cheap-speed", type=float, default=0.4, help="cheap model latency factor")
+    parser.add_argument("--cheap-noise", type=int, default=6, help="cheap model score error, +/- points")
+    parser.add_argument("--cheap-invalid", type=float, default=0.05, help="share of cheap answers missing a field")
+    parser.add_argument("--margin", type=int, default=None, help="escalation margin around 80 (default: the app's)")
+    parser.add_argument("--variants", default=",".join(VARIANTS))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fake_gemini.install(fake_gemini.FakeGeminiConfig(
+        latency=args.latency,
+        latency_sigma=0.3,
+        seed=args.seed,
+        model_speed={CHEAP: args.cheap_speed},
+        model_score_noise={CHEAP: args.cheap_noise},
+        model_invalid_rate={CHEAP: args.cheap_invalid},
+    ))
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+    warnings.filterwarnings("ignore")
+    import loop_over_rows_fastapi_app as module
+
+    run_modal_locally(module)
+    margin = args.margin if args.margin is not None else module.KOMBAT_ESCALATION_MARGIN
+    threshold = module.HIGH_CONFIDENCE_SCORE
+    keywords = [f"keyword {i}" for i in range(args.keywords)]
+
+    report = {"config": vars(args), "variants": []}
+    for name in args.variants.split(","):
+        done, elapsed, calls, latencies = asyncio.run(run_variant(module, keywords, VARIANTS[name], margin))
+        report["variants"].append({
+            "variant": name,
+            "calls": calls,
+            "cost_usd": round(done["usage"]["cost_usd"], 5),
+            "wall_s": round(elapsed, 2),
+            "model_p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "model_p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "kept": len(done["results"]),
+            "decisions_differ": decisions_differ(done["results"], keywords, threshold),
+            "cascade": done.get("cascade"),
+        })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+🗜️ Request/response compression benchmark
+Builds a freestyle upload of roughly --mb megabytes (the legacy `data`
+layout the frontend sends) and reports, per encoding (identity, gzip and
+zstd where installed):
+
+  codec       compressed size, compress and decompress time
+  transfer    modeled upload + download time at a few link speeds, codec time included
+  roundtrip   the sheet POSTed through CompressionMiddleware to an echo app that
+              returns it as results, i.e. one request/response pair as it crosses
+              the wire (four times per run through the unified proxy)
+
+    python benchmarks/bench_compression.py --mb 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import warnings
+import zlib
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "modal_apps"))
+sys.path.insert(0, BENCH_DIR)
+
+from bench_row_ingestion import build_payload, synthetic_sheet  # noqa: E402
+
+LINKS_MBIT = [10, 50, 200]
+
+
+def sheet_payload(target_mb: float, columns: int, seed: int) -> bytes:
+    """A `data` upload of about target_mb megabytes"""
+    probe = len(build_payload("data", *synthetic_sheet(1000, columns, seed)))
+    rows = max(1, int(target_mb * 1e6 / probe * 1000))
+    return build_payload("data", *synthetic_sheet(rows, columns, seed)).encode("utf-8")
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def decompress(body: bytes, encoding: str) -> bytes:
+    import http_compression
+
+    if encoding == "gzip":
+        return zlib.decompress(body, wbits=31)
+    return http_compression.zstandard.ZstdDecompressor().decompress(body, max_output_size=1 << 31)
+
+
+def codec_report(payload: bytes, encodings, repeat: int):
+    from http_compression import compress_body
+
+    report = []
+    for encoding in encodings:
+        if encoding == "identity":
+            report.append({"encoding": encoding, "wire_mb": round(len(payload) / 1e6, 2), "ratio": 1.0, "compress_ms": 0.0, "decompress_ms": 0.0})
+            continue
+        body = compress_body(payload, encoding)
+        assert decompress(body, encoding) == payload
+        report.append({
+            "encoding": encoding,
+            "wire_mb": round(len(body) / 1e6, 2),
+            "ratio": round(len(payload) / len(body), 1),
+            "compress_ms": round(best_of(lambda: compress_body(payload, encoding), repeat) * 1000, 1),
+            "decompress_ms": round(best_of(lambda: decompress(body, encoding), repeat) * 1000, 1),
+        })
+    return report
+
+
+def transfer_report(codecs):
+    """Upload plus download of the same body at each link speed, codec time included"""
+    report = []
+    for codec in codecs:
+        row = {"encoding": codec["encoding"]}
+        for mbit in LINKS_MBIT:
+            wire_s = 2 * codec["wire_mb"] * 8 / mbit
+            codec_s = 2 * (codec["compress_ms"] + codec["decompress_ms"]) / 1000
+            row[f"{mbit}mbit_s"] = round(wire_s + codec_s, 2)
+        report.append(row)
+    return report
+
+
+def build_echo_app():
+    """Parses the upload and returns every row as a result, like a freestyle run"""
+    from fastapi import FastAPI, Request
+    from fast_json import use_fast_json
+    from http_compression import add_compression
+
+    app = FastAPI()
+    use_fast_json(app)
+    add_compression(app)
+
+    @app.post("/process")
+    async def process(request: Request):
+        payload = await request.json()
+        return {"success": True, "results": [{"row_key": k, "values": v} for k, v in payload["data"].items()]}
+
+    return app
+
+
+async def roundtrip(app, payload: bytes, encoding: str, repeat: int):
+    import httpx
+    from http_compression import compress_body
+
+    body = payload if encoding == "identity" else compress_body(payload, encoding)
+    headers = {"Content-Type": "application/json", "Accept-Encoding": encoding}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    best, response_bytes = float("inf"), 0
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            async with client.stream("POST", "/process", content=body, headers=headers) as resp:
+                raw = b"".join([chunk async for chunk in resp.aiter_raw()])
+            if resp.status_code != 200:
+                raise RuntimeError(f"HTTP {resp.status_code}")
+            # The client decodes too, as it would on the other end of the wire
+            if resp.headers.get("content-encoding"):
+                raw = decompress(raw, resp.headers["content-encoding"])
+            json.loads(raw)
+            best = min(best, time.perf_counter() - started)
+            response_bytes = int(resp.headers.get("content-length") or 0) or len(raw)
+    return {
+        "encoding": encoding,
+        "request_mb": round(len(body) / 1e6, 2),
+        "response_mb": round(response_bytes / 1e6, 2),
+        "in_process_s": round(best, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=float, default=10.0, help="upload size")
+    parser.add_argument("--columns", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import http_compression
+
+    warnings.filterwarnings("ignore")
+    encodings = ["identity", *reversed(http_compression.supported_encodings())]
+    payload = sheet_payload(args.mb, args.columns, args.seed)
+    report = {"upload_mb": round(len(payload) / 1e6, 2), "config": vars(args)}
+    if http_compression.zstandard is None:
+        report["skipped"] = {"zstd": "missing dependency: zstandard"}
+
+    report["codec"] = codec_report(payload, encodings, args.repeat)
+    report["transfer"] = transfer_report(report["codec"])
+    app = build_echo_app()
+    report["roundtrip"] = [asyncio.run(roundtrip(app, payload, encoding, args.repeat)) for encoding in encodings]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
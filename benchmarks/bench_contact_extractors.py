@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+📇 Contact extractor benchmark
+Runs the single-pass extractor over fixture pages and reports pages/sec and MB/sec.
+With beautifulsoup4 installed, a parse-then-scan-per-type baseline is reported too.
+
+    python benchmarks/bench_contact_extractors.py --pages 20000
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "modal_apps"))
+
+from stub_servers import fixture_site_pages  # noqa: E402
+from contact_extractors import extract_contacts, extract_people  # noqa: E402
+
+SCRIPT_BLOB = "<script>" + "var t='0301234567';" * 200 + "</script>"
+SOCIAL_LINKS = "".join(
+    f'<a href="https://www.{host}/company-{i}/">{host}</a>'
+    for i, host in enumerate(["linkedin.com/company", "xing.com/pages", "twitter.com", "instagram.com"])
+)
+
+
+def corpus(pages: int) -> list:
+    base = []
+    for n in range(max(1, pages // 6)):
+        for page in fixture_site_pages(n).values():
+            base.append(page.replace("</main>", SOCIAL_LINKS + SCRIPT_BLOB + "</main>"))
+    return (base * (pages // len(base) + 1))[:pages]
+
+
+def bench(name: str, pages: list, extract) -> dict:
+    size = sum(len(page.encode("utf-8")) for page in pages)
+    start = time.perf_counter()
+    found = 0
+    for page in pages:
+        found += extract(page)
+    elapsed = time.perf_counter() - start
+    return {
+        "extractor": name,
+        "pages": len(pages),
+        "mb": round(size / 1e6, 2),
+        "elapsed_s": round(elapsed, 3),
+        "pages_per_s": round(len(pages) / elapsed, 1),
+        "mb_per_s": round(size / elapsed / 1e6, 2),
+        "contacts_found": found,
+    }
+
+
+def single_pass(page: str) -> int:
+    found = extract_contacts(page)
+    return len(found["email"]) + len(found["phone"]) + len(found["social"])
+
+
+def single_pass_with_people(page: str) -> int:
+    found = extract_contacts(page, with_text=True)
+    return len(found["email"]) + len(found["phone"]) + len(found["social"]) + len(extract_people(found["text"]))
+
+
+def per_type_baseline():
+    """Parse with BeautifulSoup, then scan the text once per contact type"""
+    from bs4 import BeautifulSoup
+
+    patterns = {
+        "email": re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}"),
+        "phone": re.compile(r"(?:\+|00)[1-9][0-9 ()/.-]{6,18}[0-9]|\b0[1-9][0-9 ()/.-]{5,16}[0-9]"),
+        "social": re.compile(r"https?://(?:www\.)?(?:linkedin|xing|twitter|instagram)\.com/\S+"),
+    }
+
+    def extract(page: str) -> int:
+        soup = BeautifulSoup(page, "html.parser")
+        text = soup.get_text("\n") + " ".join(a["href"] for a in soup.find_all("a", href=True))
+        return sum(len(set(pattern.findall(text))) for pattern in patterns.values())
+
+    return extract
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=5000)
+    args = parser.parse_args()
+
+    pages = corpus(args.pages)
+    report = [
+        bench("single_pass", pages, single_pass),
+        bench("single_pass+people", pages, single_pass_with_people),
+    ]
+    try:
+        report.append(bench("bs4_per_type_baseline", pages, per_type_baseline()))
+    except ImportError:
+        pass
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+📇 Crawl4Contacts benchmark
+Crawls N fixture sites from the local stub web server and reports throughput.
+
+    python benchmarks/bench_contacts.py --sites 200 --max-pages 3
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "modal_apps"))
+
+from stub_servers import build_sites_app, start_stub  # noqa: E402
+from crawl4contacts_wrapper import ContactCrawler  # noqa: E402
+from shared_fetch import HostPoliteness, SharedFetcher  # noqa: E402
+
+
+async def run(args) -> dict:
+    runner, base_url = await start_stub(build_sites_app(latency=args.latency))
+    try:
+        crawler = ContactCrawler(
+            contact_types=["email", "phone", "name", "position"],
+            max_pages_per_url=args.max_pages,
+            concurrency=args.concurrency,
+            # All fixture sites share one host, so per-host limits are relaxed
+            fetcher=SharedFetcher(politeness=HostPoliteness(args.concurrency, 0.0))
+        )
+        companies = [f"{base_url}/sites/{n}/" for n in range(args.sites)]
+        start = time.perf_counter()
+        rows = await crawler.crawl(companies)
+        elapsed = time.perf_counter() - start
+    finally:
+        await runner.cleanup()
+
+    with_person = {row["company"] for row in rows if row["name"]}
+    return {
+        "benchmark": "crawl4contacts",
+        "sites": args.sites,
+        "max_pages_per_url": args.max_pages,
+        "elapsed_s": round(elapsed, 3),
+        "sites_per_s": round(args.sites / elapsed, 1),
+        "pages": crawler.pages_fetched,
+        "pages_per_s": round(crawler.pages_fetched / elapsed, 1),
+        "mb_per_s": round(crawler.bytes_fetched / elapsed / 1e6, 2),
+        "rows": len(rows),
+        "sites_with_person": len(with_person),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sites", type=int, default=100)
+    parser.add_argument("--max-pages", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.01)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
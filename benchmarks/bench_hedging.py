@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+🏎️ Hedged model calls benchmark
+Runs a freestyle worker shard and a Keyword Kombat request (loop-over-rows,
+fake Gemini models whose calls occasionally stall for 10x their latency)
+with hedging off and on, and reports the model call latency the rows saw
+(p50/p95/p99), the wall time, the hedge rate and how often the duplicate won.
+
+Both variants call the model asynchronously (hedge=True); "unhedged" just has
+a hedge budget of 0, so the difference is the duplicates alone.
+
+    python benchmarks/bench_hedging.py --rows 2000 --tail-rate 0.03
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import warnings
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "modal_apps"))
+sys.path.insert(0, BENCH_DIR)
+
+import fake_gemini  # noqa: E402
+from bench_apps import percentile, run_modal_locally  # noqa: E402
+
+OBSERVED = []
+
+
+def time_model_calls():
+    """Record every cascade call's latency as the row saw it (hedges included)"""
+    import model_cascade
+
+    agenerate = model_cascade.ModelCascade.agenerate
+
+    async def timed(self, tier, prompt, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await agenerate(self, tier, prompt, *args, **kwargs)
+        finally:
+            OBSERVED.append(time.perf_counter() - started)
+
+    model_cascade.ModelCascade.agenerate = timed
+
+
+async def run_freestyle(module, rows: int, budget: float, rate: float):
+    request = module.FreestyleRequest(
+        headers=["Company", "Country"],
+        rows=[[f"Company {i}", "DE"] for i in range(rows)],
+        prompt="Summarize the company and score its fit from 0 to 100.",
+        request_id=f"bench-hedge-{budget}",
+        hedge=True,
+        hedge_budget=budget,
+    )
+    out = await module.process_rows_chunk.local(request, "bench", rate)
+    return out["metrics"]["counters"], len(out["results"])
+
+
+async def run_kombat(module, keywords: int, budget: float):
+    request = module.KeywordKombatRequest(
+        keywords=[f"keyword {i}" for i in range(keywords)],
+        company_url="https://example.de",
+        cluster_keywords=False,
+        hedge=True,
+        hedge_budget=budget,
+    )
+    async for event in module.kombat_events(request):
+        if event["event"] == "done":
+            return event["metrics"]["counters"], len(event["results"])
+
+
+def measure(name: str, variant: str, run):
+    OBSERVED.clear()
+    fake_gemini.STATS.__init__()
+    started = time.perf_counter()
+    counters, items = asyncio.run(run)
+    elapsed = time.perf_counter() - started
+    calls = counters.get("hedged_calls", 0)
+    return {
+        "app": name,
+        "variant": variant,
+        "items": items,
+        "wall_s": round(elapsed, 2),
+        "call_p50_ms": round(percentile(OBSERVED, 50) * 1000, 1),
+        "call_p95_ms": round(percentile(OBSERVED, 95) * 1000, 1),
+        "call_p99_ms": round(percentile(OBSERVED, 99) * 1000, 1),
+        "call_max_ms": round(max(OBSERVED, default=0) * 1000, 1),
+        "hedges": int(counters.get("hedges", 0)),
+        "hedge_rate": round(counters.get("hedges", 0) / calls, 4) if calls else 0.0,
+        "hedge_wins": int(counters.get("hedge_wins", 0)),
+        "model_calls": fake_gemini.STATS.calls,
+        "cancelled": fake_gemini.STATS.cancelled,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000, help="freestyle rows in the shard")
+    parser.add_argument("--keywords", type=int, default=160, help="Kombat keywords (scored at 8 calls/s)")
+    parser.add_argument("--apps", default="freestyle,kombat")
+    parser.add_argument("--rate", type=float, default=400, help="freestyle worker calls per second")
+    parser.add_argument("--latency", type=float, default=0.1, help="median model latency in seconds")
+    parser.add_argument("--tail-rate", type=float, default=0.03, help="share of calls stalling")
+    parser.add_argument("--tail-factor", type=float, default=10.0)
+    parser.add_argument("--budget", type=float, default=None, help="hedge budget (default: the app's)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fake_gemini.install(fake_gemini.FakeGeminiConfig(
+        latency=args.latency,
+        latency_sigma=0.2,
+        tail_rate=args.tail_rate,
+        tail_factor=args.tail_factor,
+        seed=args.seed,
+    ))
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+    warnings.filterwarnings("ignore")
+    import loop_over_rows_fastapi_app as module
+
+    run_modal_locally(module)
+    time_model_calls()
+    budget = args.budget if args.budget is not None else module.HEDGE_BUDGET
+
+    report = {"config": vars(args), "runs": []}
+    for name in args.apps.split(","):
+        for variant, share in (("unhedged", 0.0), ("hedged", budget)):
+            if name == "freestyle":
+                run = run_freestyle(module, args.rows, share, args.rate)
+            else:
+                run = run_kombat(module, args.keywords, share)
+            report["runs"].append(measure(name, variant, run))
+        unhedged, hedged = report["runs"][-2:]
+        report.setdefault("p99_improvement", {})[name] = (
+            round(1 - hedged["call_p99_ms"] / unhedged["call_p99_ms"], 3) if unhedged["call_p99_ms"] else None
+        )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+⚡ Response serialization benchmark
+Encodes a large response the way the apps used to (response model validated
+on construction, then model_dump_json / json.dumps) and the fast path
+(model_construct plus fast_json.dumps), then decodes the body again with
+json.loads versus fast_json.loads. Each path runs in a fresh subprocess so
+peak RSS above the post-setup baseline is its own.
+
+    python benchmarks/bench_json.py --rows 50000 --logos 200
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "modal_apps"))
+
+CASES = ["freestyle", "logos"]
+PATHS = ["stdlib", "fast"]
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def freestyle_results(rows: int, seed: int = 0):
+    """Freestyle output: one small JSON object per row"""
+    rng = random.Random(seed)
+    return [{
+        "row_key": f"row_{n + 1}",
+        "company": f"Company {n} GmbH",
+        "summary": "B2B software vendor for mid-sized manufacturers in the DACH region. " * rng.randint(1, 3),
+        "score": rng.randint(0, 100),
+        "tags": rng.sample(["saas", "b2b", "dach", "industrial", "ai", "fintech"], 3),
+        "confidence": round(rng.random(), 3),
+    } for n in range(rows)]
+
+
+def logo_results(count: int, kb: int, seed: int = 0):
+    """Logo output: base64 images of roughly `kb` kilobytes each"""
+    rng = random.Random(seed)
+    alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+    chunk = "".join(rng.choice(alphabet) for _ in range(1024))
+    return [{
+        "url": f"https://company-{n}.example",
+        "success": True,
+        "logo_url": f"https://company-{n}.example/logo.png",
+        "logo_base64": chunk * kb,
+        "format": "png",
+        "size": "256x256",
+        "file_size": kb * 768,
+        "method": "html",
+        "processing_time": 0.4,
+        "error": None,
+    } for n in range(count)]
+
+
+def run_path(case: str, path: str, args) -> dict:
+    from fast_json import dumps, loads
+    from gmaps_wrapper import ProcessResponse
+
+    results = freestyle_results(args.rows, args.seed) if case == "freestyle" else logo_results(args.logos, args.logo_kb, args.seed)
+    baseline = peak_rss_mb()
+
+    started = time.perf_counter()
+    if path == "stdlib":
+        if case == "freestyle":
+            # Freestyle returned a plain dict through json.dumps
+            body = json.dumps({"success": True, "results": results, "processed_count": len(results)}, default=str).encode("utf-8")
+        else:
+            body = ProcessResponse(results=results, processing_time=1.0, items_processed=len(results)).model_dump_json().encode("utf-8")
+    else:
+        if case == "freestyle":
+            body = dumps({"success": True, "results": results, "processed_count": len(results)})
+        else:
+            body = dumps(ProcessResponse.model_construct(results=results, processing_time=1.0, items_processed=len(results)))
+    encode_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    decoded = json.loads(body) if path == "stdlib" else loads(body)
+    decode_s = time.perf_counter() - started
+    assert len(decoded["results"]) == len(results)
+
+    return {
+        "case": case,
+        "path": path,
+        "items": len(results),
+        "body_mb": round(len(body) / 1e6, 1),
+        "encode_ms": round(encode_s * 1000, 1),
+        "decode_ms": round(decode_s * 1000, 1),
+        "peak_rss_growth_mb": round(peak_rss_mb() - baseline, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", nargs="+", default=CASES, choices=CASES)
+    parser.add_argument("--rows", type=int, default=50_000, help="freestyle result rows")
+    parser.add_argument("--logos", type=int, default=200)
+    parser.add_argument("--logo-kb", type=int, default=64, help="base64 size per logo")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_path(*args.child, args)))
+        return
+
+    report = []
+    for case in args.cases:
+        by_path = {}
+        for path in PATHS:
+            out = subprocess.run([sys.executable, __file__, *sys.argv[1:], "--child", case, path], capture_output=True, text=True)
+            lines = [line for line in out.stdout.splitlines() if line.startswith("{")]
+            by_path[path] = json.loads(lines[-1]) if lines else {"case": case, "path": path, "failed": out.stderr[-1000:]}
+            report.append(by_path[path])
+        slow, fast = by_path["stdlib"], by_path["fast"]
+        if "failed" not in slow and "failed" not in fast:
+            report.append({
+                "case": case,
+                "encode_speedup": round(slow["encode_ms"] / max(fast["encode_ms"], 0.1), 1),
+                "decode_speedup": round(slow["decode_ms"] / max(fast["decode_ms"], 0.1), 1),
+            })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
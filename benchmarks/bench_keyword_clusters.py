@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+🧩 Keyword clustering benchmark
+Builds an SEO-tool style keyword list (distinct base keywords plus hyphen,
+word-order, case, umlaut, typo and plural variants), clusters it as Kombat
+does before scoring and reports the time, the model calls saved and how many
+clusters wrongly mix different base keywords. Typo variants are deliberately
+left unmerged, so calls_saved stays below calls_saved_ideal.
+
+    python benchmarks/bench_keyword_clusters.py --keywords 50000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "modal_apps"))
+
+from keyword_ranking import CLUSTER_THRESHOLD, KeywordClusters  # noqa: E402
+
+PRODUCTS = ["crm software", "erp system", "lohnbuchhaltung", "zeiterfassung", "warenwirtschaft", "dokumentenmanagement",
+            "projektmanagement tool", "buchhaltungssoftware", "ticketsystem", "personalplanung", "cloud telefonanlage",
+            "seo agentur", "sea agentur", "webdesign agentur", "it dienstleister", "managed services", "datensicherung"]
+MODIFIERS = ["kaufen", "kosten", "vergleich", "anbieter", "test", "kostenlos", "für kmu", "für handwerker", "online",
+             "open source", "preise", "alternative", "mittelstand", "beratung", "einführung", "schulung"]
+CITIES = ["berlin", "hamburg", "münchen", "köln", "frankfurt", "stuttgart", "düsseldorf", "leipzig", "dortmund",
+          "essen", "bremen", "dresden", "hannover", "nürnberg", "duisburg", "bochum", "wuppertal", "bielefeld"]
+
+
+def base_keywords(rng: random.Random, count: int) -> list:
+    seen = set()
+    while len(seen) < count:
+        parts = [rng.choice(PRODUCTS)]
+        if rng.random() < 0.8:
+            parts.append(rng.choice(MODIFIERS))
+        if rng.random() < 0.6:
+            parts.append(rng.choice(CITIES))
+        if rng.random() < 0.3:
+            parts.append(str(rng.randint(2019, 2026)))
+        seen.add(" ".join(parts))
+    return sorted(seen)
+
+
+def variant(rng: random.Random, keyword: str) -> str:
+    words = keyword.split(" ")
+    kind = rng.randrange(6)
+    if kind == 0 and len(words) > 1:
+        i = rng.randrange(len(words) - 1)
+        return " ".join(words[:i] + [words[i] + "-" + words[i + 1]] + words[i + 2:])
+    if kind == 1:
+        rng.shuffle(words)
+        return " ".join(words)
+    if kind == 2:
+        return keyword.title()
+    if kind == 3:
+        return keyword.replace("ü", "ue").replace("ö", "oe").replace("ä", "ae")
+    long_words = [i for i, w in enumerate(words) if len(w) >= 7 and w.isalpha()]
+    if kind == 4 and long_words:
+        i = rng.choice(long_words)
+        w = words[i]
+        j = rng.randrange(1, len(w) - 1)
+        words[i] = w[:j] + w[j + 1:]  # dropped letter
+        return " ".join(words)
+    if long_words:
+        i = rng.choice(long_words)
+        words[i] += "n" if words[i].endswith("e") else "e"
+    return " ".join(words)
+
+
+def synthetic_keywords(total: int, variant_share: float, seed: int):
+    """(keywords, base keyword of each) with roughly variant_share of them variants"""
+    rng = random.Random(seed)
+    bases = base_keywords(rng, max(1, int(total * (1 - variant_share))))
+    keywords, truth = list(bases), list(bases)
+    while len(keywords) < total:
+        base = rng.choice(bases)
+        keywords.append(variant(rng, base))
+        truth.append(base)
+    order = list(range(len(keywords)))
+    rng.shuffle(order)
+    return [keywords[i] for i in order], [truth[i] for i in order]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keywords", type=int, default=50_000)
+    parser.add_argument("--variant-share", type=float, default=0.3)
+    parser.add_argument("--threshold", type=float, default=CLUSTER_THRESHOLD)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    keywords, truth = synthetic_keywords(args.keywords, args.variant_share, args.seed)
+    started = time.perf_counter()
+    clusters = KeywordClusters(keywords, threshold=args.threshold)
+    elapsed = time.perf_counter() - started
+
+    base_of = dict(zip(keywords, truth))
+    mixed = sum(1 for members in clusters.clusters.values() if len({base_of[m] for m in members}) > 1)
+    print(json.dumps({
+        "keywords": len(keywords),
+        "distinct_base_keywords": len(set(truth)),
+        "threshold": args.threshold,
+        "seconds": round(elapsed, 3),
+        "keywords_per_s": round(len(keywords) / elapsed),
+        "clusters": len(clusters.clusters),
+        "calls_saved": clusters.calls_saved,
+        "calls_saved_ideal": len(keywords) - len(set(truth)),
+        "mixed_clusters": mixed,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
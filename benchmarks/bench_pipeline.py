@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+🧬 Enrichment pipeline benchmark
+Runs the imprint, contacts, logo and freestyle wrappers in-process (each
+served over HTTP from its own event loop, against the fixture sites, the
+imprint-reader stub and the fake Gemini model) and enriches the same list
+of startups twice:
+
+  staged     one whole-list request per wrapper, each waiting for the previous
+  pipelined  the enrichment pipeline, rows flowing through per-stage limits
+
+and reports wall time plus when rows become available.
+
+    python benchmarks/bench_pipeline.py --rows 200
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import sys
+import time
+import warnings
+from typing import Any, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "modal_apps"))
+sys.path.insert(0, BENCH_DIR)
+
+from bench_apps import percentile, run_modal_locally  # noqa: E402
+
+STAGE_MODULES = {
+    "imprint": "crawl4imprint_frontand_wrapper",
+    "contacts": "crawl4contacts_wrapper",
+    "logo": "crawl4logo_app",
+    "freestyle": "loop_over_rows_fastapi_app",
+}
+REQUIRED_MODULES = {"logo": ["bs4", "PIL", "fake_useragent"]}
+PROMPT = "Summarize the startup in one sentence and score its fit from 0 to 100."
+
+
+def build_asgi_bridge(asgi_app):
+    """aiohttp app forwarding every POST to an in-process ASGI app"""
+    import httpx
+    from aiohttp import web
+
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=asgi_app), base_url="http://stage", timeout=None)
+
+    async def forward(request: web.Request) -> web.Response:
+        response = await client.post(request.path, content=await request.read(), headers={"Content-Type": "application/json"})
+        return web.Response(body=response.content, status=response.status_code, content_type="application/json")
+
+    bridge = web.Application()
+    bridge.router.add_post("/{path:.*}", forward)
+    return bridge
+
+
+async def post(session, url: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    async with session.post(url, json=body) as resp:
+        if resp.status != 200:
+            raise RuntimeError(f"{url}: HTTP {resp.status} {(await resp.text())[:200]}")
+        return await resp.json()
+
+
+async def run_staged(pipeline, rows: List[Dict[str, Any]], stage_names: List[str]) -> Dict[str, Any]:
+    """Today's flow: each wrapper gets the whole list once the previous one returned"""
+    import aiohttp
+
+    websites = [row["website"] for row in rows]
+    started = time.perf_counter()
+    stage_seconds = {}
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None)) as session:
+        for name in stage_names:
+            stage_started = time.perf_counter()
+            url = pipeline.STAGES[name][0]
+            if name == "imprint":
+                out = await post(session, url, {"websites": websites})
+                for row, result in zip(rows, out["results"]):
+                    row["imprint"] = result
+            elif name == "contacts":
+                out = await post(session, url, {"companies": websites, "contact_types": ["email", "phone", "name", "position"]})
+                for row in rows:
+                    row["contacts"] = [c for c in out["results"] if c["company"] == row["website"]]
+            elif name == "logo":
+                out = await post(session, url, {"urls": websites})
+                for row, result in zip(rows, out["results"]):
+                    row["logo"] = result
+            else:
+                columns = [pipeline.freestyle_columns(row) for row in rows]
+                headers = list(dict.fromkeys(k for c in columns for k in c))
+                out = await post(session, url, {
+                    "mode": "freestyle", "prompt": PROMPT, "headers": headers,
+                    "rows": [[c.get(h, "") for h in headers] for c in columns],
+                    "row_keys": [row["row_key"] for row in rows],
+                })
+            stage_seconds[name] = round(time.perf_counter() - stage_started, 3)
+    wall = time.perf_counter() - started
+    # Nothing is usable before the last stage returned the whole list
+    return {"wall_s": round(wall, 3), "first_row_s": round(wall, 3), "p50_row_s": round(wall, 3), "stage_s": stage_seconds}
+
+
+async def run_pipelined(pipeline, rows: List[Dict[str, Any]], stage_names: List[str], concurrency: int) -> Dict[str, Any]:
+    stages = [pipeline.PipelineStage(name=name, concurrency=concurrency or None, options={"prompt": PROMPT} if name == "freestyle" else {}) for name in stage_names]
+    started = time.perf_counter()
+    ready: List[float] = []
+    failed = 0
+    async for row in pipeline.run_pipeline(rows, stages):
+        ready.append(time.perf_counter() - started)
+        failed += bool(row.get("errors"))
+    wall = time.perf_counter() - started
+    return {
+        "wall_s": round(wall, 3),
+        "first_row_s": round(min(ready), 3),
+        "p50_row_s": round(percentile(ready, 50), 3),
+        "failed_rows": failed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--stages", nargs="+", default=list(STAGE_MODULES), choices=list(STAGE_MODULES))
+    parser.add_argument("--concurrency", type=int, default=0, help="per-stage concurrency (default: the pipeline's)")
+    parser.add_argument("--latency", type=float, default=0.2, help="median fake model latency (s)")
+    parser.add_argument("--site-latency", type=float, default=0.05)
+    parser.add_argument("--backend-latency", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import fake_gemini
+    from stub_servers import build_imprint_app, build_sites_app, start_stub_thread
+
+    warnings.filterwarnings("ignore")
+    fake_gemini.install(fake_gemini.FakeGeminiConfig(latency=args.latency, seed=args.seed))
+    os.environ.setdefault("GEMINI_API_KEY", "offline-benchmark")
+    stops = []
+    stop, sites_url = start_stub_thread(build_sites_app(latency=args.site_latency, seed=args.seed))
+    stops.append(stop)
+    stop, imprint_url = start_stub_thread(build_imprint_app(latency=args.backend_latency, seed=args.seed))
+    stops.append(stop)
+    os.environ["IMPRINT_BACKEND_URL"] = imprint_url + "/"
+
+    report: Dict[str, Any] = {"rows": args.rows, "config": vars(args)}
+    stage_names = []
+    try:
+        import shared_fetch
+
+        def fresh_fetcher():
+            # Empty caches for each run; the production politeness limits would only measure themselves
+            shared_fetch._fetcher = shared_fetch.SharedFetcher(politeness=shared_fetch.HostPoliteness(max_concurrent=64, min_interval=0.0))
+
+        for name in args.stages:
+            missing = [m for m in REQUIRED_MODULES.get(name, []) if importlib.util.find_spec(m) is None]
+            if missing:
+                report.setdefault("skipped_stages", {})[name] = f"missing dependency: {', '.join(missing)}"
+                continue
+            module = __import__(STAGE_MODULES[name])
+            run_modal_locally(module)
+            # Each wrapper gets its own event loop, like its own container
+            stop, stage_url = start_stub_thread(build_asgi_bridge(module.app))
+            stops.append(stop)
+            os.environ[f"{name.upper()}_STAGE_URL"] = f"{stage_url}/process"
+            stage_names.append(name)
+
+        import enrichment_pipeline as pipeline
+
+        def fresh_rows():
+            return [{"website": f"{sites_url}/sites/{n}/", "row_key": str(n)} for n in range(args.rows)]
+
+        report["stages"] = stage_names
+        fresh_fetcher()
+        report["staged"] = asyncio.run(run_staged(pipeline, fresh_rows(), stage_names))
+        fresh_fetcher()
+        report["pipelined"] = asyncio.run(run_pipelined(pipeline, fresh_rows(), stage_names, args.concurrency))
+        report["speedup"] = {
+            k: round(report["staged"][k] / report["pipelined"][k], 2) if report["pipelined"][k] else None
+            for k in ("wall_s", "first_row_s", "p50_row_s")
+        }
+    finally:
+        for stop in stops:
+            stop()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
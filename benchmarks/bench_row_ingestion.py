@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+📊 Peak RSS of loop-over-rows sheet ingestion
+Each ingestion format runs in a fresh subprocess: parse the JSON body,
+validate FreestyleRequest, build the sheet and render every row's prompt
+payload once (as the workers do). Reported as peak RSS above the
+post-import baseline, per 100k rows.
+
+    python benchmarks/bench_row_ingestion.py --rows 100000 --columns 12
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "modal_apps"))
+
+FORMATS = ["legacy", "data", "rows", "csv_data"]
+COUNTRIES = ["DE", "AT", "CH", "FR", "NL", "US", "UK"]
+INDUSTRIES = ["Software", "Manufacturing", "Retail", "Logistics", "Healthcare", "Energy", "Finance"]
+OWNERS = ["anna@crm.example", "lukas@crm.example", "marie@crm.example"]
+
+
+def synthetic_sheet(rows: int, columns: int, seed: int = 0):
+    """CRM-export style sheet: a few unique columns, the rest low-cardinality"""
+    rng = random.Random(seed)
+    headers = ["Company", "Website", "Email", "Country", "Industry", "Owner"] + [f"Field {i}" for i in range(max(0, columns - 6))]
+    body = []
+    for n in range(rows):
+        row = [f"Company {n} GmbH", f"https://company-{n}.example", f"info@company-{n}.example",
+               rng.choice(COUNTRIES), rng.choice(INDUSTRIES), rng.choice(OWNERS)]
+        row += [rng.choice(["yes", "no", "", "unknown"]) for _ in range(len(headers) - 6)]
+        body.append(row[:len(headers)])
+    return headers[:len(body[0])] if body else headers, body
+
+
+def build_payload(fmt: str, headers, body) -> str:
+    payload = {"prompt": "Classify this company.", "headers": headers}
+    if fmt in ("legacy", "data"):
+        payload["data"] = {f"row_{i + 1}": row for i, row in enumerate(body)}
+    elif fmt == "rows":
+        payload["rows"] = body
+    else:
+        out = io.StringIO()
+        csv.writer(out).writerows([headers] + body)
+        payload["csv_data"] = out.getvalue()
+        payload["headers"] = []
+    return json.dumps(payload)
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_format(fmt: str, path: str) -> dict:
+    """Child process: ingest the payload at path and report peak RSS growth"""
+    from loop_over_rows_fastapi_app import FreestyleRequest, load_row_table
+
+    with open(path) as f:
+        raw = f.read()
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    request = FreestyleRequest(**json.loads(raw))
+    del raw
+    rendered = 0
+    if fmt == "legacy":
+        # The pre-RowTable path: items copy, a dict per row, json.dumps per row
+        items = list(request.data.items())
+        for _, values in items:
+            rendered += len(json.dumps({h: v for h, v in zip(request.headers, values)}))
+    else:
+        table = load_row_table(request)
+        if fmt != "data":
+            # The coordinator keeps only the table; the validated source can go
+            request = request.model_copy(update={"rows": None, "csv_data": None})
+        for i in range(len(table)):
+            rendered += len(table.row_json(i))
+    return {
+        "format": fmt,
+        "seconds": round(time.perf_counter() - started, 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "peak_rss_growth_mb": round(peak_rss_mb() - baseline, 1),
+        "rendered_bytes": rendered,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--columns", type=int, default=12)
+    parser.add_argument("--formats", nargs="+", default=FORMATS, choices=FORMATS)
+    parser.add_argument("--child", nargs=2, metavar=("FORMAT", "PAYLOAD"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_format(*args.child)))
+        return
+
+    headers, body = synthetic_sheet(args.rows, args.columns)
+    report = {"rows": args.rows, "columns": len(headers), "results": []}
+    tmp_dir = os.environ.get("TMPDIR", "/tmp")
+    for fmt in args.formats:
+        path = os.path.join(tmp_dir, f"bench_row_ingestion_{fmt}.json")
+        with open(path, "w") as f:
+            f.write(build_payload(fmt, headers, body))
+        out = subprocess.run([sys.executable, __file__, "--child", fmt, path], capture_output=True, text=True, check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        result["payload_mb"] = round(os.path.getsize(path) / 1e6, 1)
+        result["peak_rss_growth_mb_per_100k_rows"] = round(result["peak_rss_growth_mb"] * 100_000 / max(1, args.rows), 1)
+        report["results"].append(result)
+        os.remove(path)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
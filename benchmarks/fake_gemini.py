@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+🤖 Fake Gemini for offline benchmarks
+A stand-in for the google.generativeai module: GenerativeModel.generate_content
+blocks (generate_content_async awaits) for a lognormal latency with an
+optional 10x stall tail (cut off at a request_options timeout), fails or rate-limits (429) at configured rates, and answers freestyle, keyword-kombat and company-research prompts
+with plausible fenced JSON plus usage_metadata. Models can differ in speed,
+score noise and invalid answers (e.g. a fast, sloppier flash-lite tier for
+model cascades). Call install() before the Modal app modules are imported.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+import types
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+_KEYWORD_RE = re.compile(r'Keyword: "(.*?)"')
+_URL_RE = re.compile(r"https?://[^\s]+")
+
+
+@dataclass
+class FakeGeminiConfig:
+    latency: float = 0.2          # median model latency, seconds
+    latency_sigma: float = 0.5    # lognormal spread (0 = fixed latency)
+    error_rate: float = 0.0       # share of calls raising a generic server error
+    rate_limit_rate: float = 0.0  # share of calls raising a 429
+    tail_rate: float = 0.0        # share of calls stalling for tail_factor times their latency
+    tail_factor: float = 10.0
+    seed: int = 0
+    # Per model name: latency factor, +/- points of Kombat score noise, share of answers missing a field
+    model_speed: Dict[str, float] = field(default_factory=dict)
+    model_score_noise: Dict[str, int] = field(default_factory=dict)
+    model_invalid_rate: Dict[str, float] = field(default_factory=dict)
+
+
+@dataclass
+class FakeGeminiStats:
+    calls: int = 0
+    errors: int = 0
+    rate_limited: int = 0
+    cancelled: int = 0
+    timed_out: int = 0
+    latencies: List[float] = field(default_factory=list)
+    calls_by_model: Dict[str, int] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        out = {"calls": self.calls, "errors": self.errors, "rate_limited": self.rate_limited}
+        if self.cancelled:
+            out["cancelled"] = self.cancelled
+        if len(self.calls_by_model) > 1:
+            out["calls_by_model"] = dict(self.calls_by_model)
+        return out
+
+
+class ResourceExhausted(Exception):
+    """Shaped like google.api_core.exceptions.ResourceExhausted"""
+    code = 429
+
+
+class ServerError(Exception):
+    code = 500
+
+
+class DeadlineExceeded(Exception):
+    """Shaped like google.api_core.exceptions.DeadlineExceeded (request_options timeout)"""
+    code = 504
+
+
+class UsageMetadata:
+    def __init__(self, prompt_tokens: int, output_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+
+class FakeResponse:
+    def __init__(self, text: str, prompt: str):
+        self.text = text
+        # Roughly 4 characters per token, like Gemini on mixed German/English text
+        self.usage_metadata = UsageMetadata(max(1, len(prompt) // 4), max(1, len(text) // 4))
+
+
+CONFIG = FakeGeminiConfig()
+STATS = FakeGeminiStats()
+_lock = threading.Lock()
+_rng = random.Random(CONFIG.seed)
+
+
+def _stable_int(text: str) -> int:
+    return int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def true_score(keyword: str) -> int:
+    """The Kombat score a noise-free model gives the keyword"""
+    return 10 + _stable_int(keyword) % 91
+
+
+def answer(prompt: str, model_name: str = "") -> Dict[str, Any]:
+    """Deterministic JSON answer for the prompt shapes used by the apps"""
+    if "RelevanceScore" in prompt:
+        match = _KEYWORD_RE.search(prompt)
+        keyword = match.group(1) if match else "keyword"
+        noise = CONFIG.model_score_noise.get(model_name, 0)
+        # Same keyword and model, same error: a noisy tier is consistently off, not randomly
+        offset = _stable_int(model_name + keyword) % (2 * noise + 1) - noise if noise else 0
+        score = max(10, min(100, true_score(keyword) + offset))
+        return {"Keyword": keyword, "RelevanceScore": score, "Rationale": "Benchmark-Antwort."}
+    if "company_name" in prompt:
+        match = _URL_RE.search(prompt)
+        url = match.group(0) if match else "https://example.com"
+        return {"company_name": url.split("//")[-1].split("/")[0], "company_description": "Software für den Mittelstand.",
+                "industry": "Software", "target_market": "B2B"}
+    digest = _stable_int(prompt)
+    return {"summary": f"Row summary {digest % 1000}", "score": digest % 100, "category": ["A", "B", "C"][digest % 3]}
+
+
+class GenerativeModel:
+    def __init__(self, model_name: str = "models/gemini-2.5-flash", **kwargs):
+        self.model_name = model_name
+
+    def _start(self, prompt: Any):
+        """(prompt text, latency, failure roll, invalid answer) for one call"""
+        prompt = prompt if isinstance(prompt, str) else json.dumps(prompt, default=str)
+        with _lock:
+            STATS.calls += 1
+            STATS.calls_by_model[self.model_name] = STATS.calls_by_model.get(self.model_name, 0) + 1
+            roll = _rng.random()
+            invalid = _rng.random() < CONFIG.model_invalid_rate.get(self.model_name, 0.0)
+            latency = CONFIG.latency * CONFIG.model_speed.get(self.model_name, 1.0)
+            latency *= math.exp(_rng.gauss(0, CONFIG.latency_sigma)) if CONFIG.latency_sigma else 1.0
+            if _rng.random() < CONFIG.tail_rate:
+                latency *= CONFIG.tail_factor
+        return prompt, latency, roll, invalid
+
+    @staticmethod
+    def _timeout(kwargs: Dict[str, Any]) -> Optional[float]:
+        return (kwargs.get("request_options") or {}).get("timeout")
+
+    def _finish(self, prompt: str, latency: float, roll: float, invalid: bool, timeout: Optional[float] = None) -> FakeResponse:
+        if timeout is not None and latency > timeout:
+            with _lock:
+                STATS.timed_out += 1
+            raise DeadlineExceeded(f"504 Deadline of {timeout:.1f}s exceeded")
+        with _lock:
+            STATS.latencies.append(latency)
+            if roll < CONFIG.rate_limit_rate:
+                STATS.rate_limited += 1
+                raise ResourceExhausted("429 Resource has been exhausted (e.g. check quota).")
+            if roll < CONFIG.rate_limit_rate + CONFIG.error_rate:
+                STATS.errors += 1
+                raise ServerError("500 An internal error has occurred.")
+        out = answer(prompt, self.model_name)
+        if invalid:
+            # A required field left out, as weaker models sometimes do
+            out.pop(next(iter(out)))
+        return FakeResponse("```json\n" + json.dumps(out, ensure_ascii=False) + "\n```", prompt)
+
+    def generate_content(self, prompt: Any, **kwargs) -> FakeResponse:
+        call = self._start(prompt)
+        timeout = self._timeout(kwargs)
+        # Blocking, like the real SDK's synchronous generate_content (which gives up at its timeout)
+        time.sleep(min(call[1], timeout) if timeout is not None else call[1])
+        return self._finish(*call, timeout)
+
+    async def generate_content_async(self, prompt: Any, **kwargs) -> FakeResponse:
+        call = self._start(prompt)
+        timeout = self._timeout(kwargs)
+        try:
+            await asyncio.sleep(min(call[1], timeout) if timeout is not None else call[1])
+        except asyncio.CancelledError:
+            with _lock:
+                STATS.cancelled += 1
+            raise
+        return self._finish(*call, timeout)
+
+
+def configure(**kwargs):
+    pass
+
+
+def install(config: Optional[FakeGeminiConfig] = None) -> types.ModuleType:
+    """Register this module as google.generativeai (creating a google package if needed)"""
+    global CONFIG, _rng
+    CONFIG = config or FakeGeminiConfig()
+    _rng = random.Random(CONFIG.seed)
+    module = sys.modules[__name__]
+    google = sys.modules.get("google")
+    if google is None:
+        try:
+            import google  # namespace package from e.g. protobuf
+        except ImportError:
+            google = types.ModuleType("google")
+            google.__path__ = []
+            sys.modules["google"] = google
+    sys.modules["google.generativeai"] = module
+    setattr(google, "generativeai", module)
+    return module
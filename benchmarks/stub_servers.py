@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+🧪 Local stub servers for the Modal apps
+Deterministic stand-ins for the external backends so the wrappers can be
+exercised without Modal credentials or live websites.
+
+    python benchmarks/stub_servers.py gmaps --port 8010
+    GMAPS_BACKEND_URL=http://127.0.0.1:8010/search python modal_apps/gmaps_wrapper.py
+
+    python benchmarks/stub_servers.py sites --port 8011
+    # companies: http://127.0.0.1:8011/sites/0/ ... http://127.0.0.1:8011/sites/N/
+
+    python benchmarks/stub_servers.py imprint --port 8012
+    IMPRINT_BACKEND_URL=http://127.0.0.1:8012/ python modal_apps/crawl4imprint_frontand_wrapper.py
+"""
+
+import argparse
+import asyncio
+import hashlib
+import random
+import re
+import struct
+import threading
+import zlib
+
+from aiohttp import web
+
+
+def build_gmaps_app(latency: float = 0.05, places_per_query: int = 5, error_rate: float = 0.0, seed: int = 0) -> web.Application:
+    """Fake gmaps-fastapi-crawler: deterministic places per query, with overlap between queries"""
+    rng = random.Random(seed)
+
+    async def search(request: web.Request) -> web.Response:
+        body = await request.json()
+        query = body.get("query", "")
+        country_code = body.get("country_code", "US")
+        limit = min(int(body.get("max_results") or places_per_query), places_per_query)
+
+        await asyncio.sleep(latency * (0.5 + rng.random()))
+        if error_rate and rng.random() < error_rate:
+            return web.json_response({"detail": "stub failure"}, status=500)
+
+        # Places are drawn from a small per-country pool so different search
+        # terms for the same location return some of the same businesses.
+        digest = int(hashlib.sha1(query.encode("utf-8")).hexdigest(), 16)
+        pool_size = places_per_query * 3
+        places = []
+        for i in range(limit):
+            n = (digest + i * 7) % pool_size
+            places.append({
+                "place_id": f"{country_code}-{n}",
+                "name": f"Business {n}",
+                "address": f"{n} Stub Street, {country_code}",
+                "phone": f"+49 30 {1000000 + n}",
+                "website": f"https://business-{n}.example",
+                "rating": round(3 + (n % 20) / 10, 1),
+                "review_count": n * 3,
+            })
+        return web.json_response({"results": places})
+
+    app = web.Application()
+    app.router.add_post("/search", search)
+    return app
+
+
+FIRST_NAMES = ["Anna", "Lukas", "Marie", "Jonas", "Sophie", "Felix", "Laura", "Paul", "Julia", "Leon"]
+LAST_NAMES = ["Schmidt", "Müller", "Weber", "Fischer", "Wagner", "Becker", "Hoffmann", "Richter", "Klein", "Wolf"]
+POSITIONS = ["Geschäftsführer", "CEO", "CTO", "Head of Sales", "Co-Founder", "CFO"]
+FILLER = "<p>" + "Wir entwickeln Software für den Mittelstand und begleiten unsere Kunden von der Idee bis zum Betrieb. " * 40 + "</p>"
+
+
+def fixture_site_pages(n: int) -> dict:
+    """Saved-homepage style fixture site n: homepage, contact, imprint, team and filler pages"""
+    domain = f"company-{n}.example"
+    people = [
+        (FIRST_NAMES[(n + i) % len(FIRST_NAMES)], LAST_NAMES[(n * 3 + i) % len(LAST_NAMES)], POSITIONS[(n + i) % len(POSITIONS)])
+        for i in range(3)
+    ]
+    nav = "".join(
+        f'<a href="/sites/{n}/{path}">{label}</a>'
+        for path, label in [("", "Start"), ("produkte", "Produkte"), ("blog/news", "Blog"), ("team", "Team"),
+                            ("kontakt", "Kontakt"), ("impressum", "Impressum")]
+    )
+    team = "".join(f"<div class='member'><h3>{f} {l}</h3><p>{p}</p></div>" for f, l, p in people)
+    first, last, position = people[0]
+
+    def page(title: str, body: str) -> str:
+        return (
+            f"<html><head><title>{title}</title></head><body>"
+            f"<header><img src='/sites/{n}/logo.png' alt='Company {n} logo'><nav>{nav}</nav></header>"
+            f"<main>{body}</main></body></html>"
+        )
+
+    return {
+        "": page(f"Company {n}", f"<h1>Company {n} GmbH</h1>{FILLER}"),
+        "produkte": page("Produkte", FILLER),
+        "blog/news": page("Blog", FILLER),
+        "team": page("Team", f"<h2>Unser Team</h2>{team}"),
+        "kontakt": page("Kontakt", (
+            f"<p>Schreiben Sie uns: <a href='mailto:info@{domain}'>info@{domain}</a></p>"
+            f"<p>{first} {last}, {position}<br>{first.lower()}.{last.lower()}@{domain}</p>"
+            f"<p>Telefon: <a href='tel:+4930{1000000 + n}'>+49 30 {1000000 + n}</a></p>"
+        )),
+        "impressum": page("Impressum", (
+            f"<p>Company {n} GmbH<br>Musterstraße {n}<br>10115 Berlin</p>"
+            f"<p>Geschäftsführer: {first} {last}</p><p>Tel.: 030 {2000000 + n}</p>"
+            f"<p>E-Mail: kontakt@{domain}</p>"
+        )),
+    }
+
+
+def fixture_logo_png(n: int, size: int = 32) -> bytes:
+    """Small deterministic RGBA PNG logo for fixture site n"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    raw = b"".join(
+        b"\x00" + bytes(v for x in range(size) for v in ((x * 8) % 256, (y * 8) % 256, (n * 37) % 256, 255))
+        for y in range(size)
+    )
+    header = struct.pack(">IIBBBBB", size, size, 8, 6, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+def fixture_imprint(url: str) -> dict:
+    """What the imprint-reader backend extracts from a fixture site's Impressum page"""
+    match = re.search(r"/sites/(\d+)", url)
+    if not match:
+        return {"original_url": url, "success": False, "error": "No imprint found"}
+    n = int(match.group(1))
+    first, last = FIRST_NAMES[n % len(FIRST_NAMES)], LAST_NAMES[(n * 3) % len(LAST_NAMES)]
+    return {
+        "original_url": url,
+        "success": True,
+        "imprint_url": url.rstrip("/") + "/impressum",
+        "company_name": f"Company {n} GmbH",
+        "managing_directors": f"{first} {last}",
+        "street": f"Musterstraße {n}",
+        "city": "Berlin",
+        "postal_code": "10115",
+        "country": "Deutschland",
+        "email": f"kontakt@company-{n}.example",
+        "phone": f"+49 30 {2000000 + n}",
+        "website": f"https://company-{n}.example",
+        "registration_number": f"HRB {100000 + n}",
+        "vat_id": f"DE{300000000 + n}",
+    }
+
+
+def build_sites_app(latency: float = 0.01, seed: int = 0) -> web.Application:
+    """Local fixture web server: /sites/<n>/<page> (HTML pages and logo.png) for any number of company sites"""
+    rng = random.Random(seed)
+
+    async def site_page(request: web.Request) -> web.Response:
+        n = int(request.match_info["n"])
+        path = request.match_info.get("path", "").strip("/")
+        await asyncio.sleep(latency * (0.5 + rng.random()))
+        if path == "logo.png":
+            return web.Response(body=fixture_logo_png(n), content_type="image/png")
+        pages = fixture_site_pages(n)
+        if path not in pages:
+            raise web.HTTPNotFound()
+        return web.Response(text=pages[path], content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get(r"/sites/{n:\d+}/{path:.*}", site_page)
+    return app
+
+
+def build_imprint_app(latency: float = 0.5, per_url_latency: float = 0.05, seed: int = 0) -> web.Application:
+    """Fake imprint-reader backend: POST {"urls": [...]} returns one extracted imprint per URL"""
+    rng = random.Random(seed)
+
+    async def extract(request: web.Request) -> web.Response:
+        urls = (await request.json()).get("urls", [])
+        await asyncio.sleep((latency + per_url_latency * len(urls)) * (0.5 + rng.random()))
+        return web.json_response({"results": [fixture_imprint(url) for url in urls]})
+
+    app = web.Application()
+    app.router.add_post("/", extract)
+    return app
+
+
+async def start_stub(app: web.Application, host: str = "127.0.0.1", port: int = 0):
+    """Start a stub app in the running loop; returns (runner, base_url). Port 0 picks a free port."""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{bound_port}"
+
+
+def start_stub_thread(app: web.Application, host: str = "127.0.0.1", port: int = 0):
+    """
+    Serve a stub app from its own event loop thread, so apps that make
+    blocking HTTP calls (requests) can reach it. Returns (stop, base_url).
+    """
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    runner, base_url = asyncio.run_coroutine_threadsafe(start_stub(app, host, port), loop).result()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+    return stop, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("server", choices=["gmaps", "sites", "imprint"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.server == "gmaps":
+        app = build_gmaps_app(latency=args.latency, error_rate=args.error_rate)
+    elif args.server == "imprint":
+        app = build_imprint_app(latency=args.latency)
+    else:
+        app = build_sites_app(latency=args.latency)
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
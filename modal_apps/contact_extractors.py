@@ -0,0 +1,207 @@
+"""
+📇 Contact Extractors - single-pass contact extraction for crawled pages
+All patterns are compiled once per container into one combined regex that
+walks each page exactly once, whatever contact types were requested.
+"""
+
+import html as html_lib
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+# Country calling codes for national-format numbers, by site TLD
+CALLING_CODES = {
+    "de": "49", "at": "43", "ch": "41", "fr": "33", "uk": "44", "ie": "353", "nl": "31", "be": "32",
+    "lu": "352", "it": "39", "es": "34", "pt": "351", "dk": "45", "se": "46", "no": "47", "fi": "358",
+    "pl": "48", "cz": "420", "sk": "421", "hu": "36", "si": "386", "hr": "385", "ro": "40", "bg": "359",
+    "gr": "30", "ee": "372", "lv": "371", "lt": "370",
+}
+DEFAULT_CALLING_CODE = "49"
+
+SOCIAL_HOSTS = {
+    "linkedin.com": "linkedin", "xing.com": "xing", "twitter.com": "twitter", "x.com": "twitter",
+    "facebook.com": "facebook", "instagram.com": "instagram", "github.com": "github", "youtube.com": "youtube",
+}
+
+# Job titles → department, matched case-insensitively in page text
+POSITION_DEPARTMENTS = [
+    (r"co-?founder|mitgr(?:ü|ue)nder(?:in)?|founder|gr(?:ü|ue)nder(?:in)?", "Executive"),
+    (r"ceo|chief executive officer|gesch(?:ä|ae)ftsf(?:ü|ue)hrer(?:in)?|managing director|inhaber(?:in)?|vorstand(?:svorsitzende[rn]?)?", "Executive"),
+    (r"cto|chief technology officer|head of (?:engineering|technology)", "Technology"),
+    (r"cfo|chief financial officer|head of finance", "Finance"),
+    (r"coo|chief operating officer|head of operations", "Operations"),
+    (r"cmo|chief marketing officer|head of marketing", "Marketing"),
+    (r"head of sales|sales director|vertriebsleiter(?:in)?", "Sales"),
+    (r"prokurist(?:in)?|partner", "Executive"),
+]
+
+_BLOCK_TAGS = frozenset({
+    "p", "div", "br", "li", "tr", "td", "th", "h1", "h2", "h3", "h4", "h5", "h6", "section", "article",
+    "header", "footer", "nav", "ul", "ol", "table", "address", "main", "aside", "dd", "dt", "figcaption",
+})
+
+# One alternation, tried left to right at each position:
+#   skip   - scripts, styles and comments are consumed whole
+#   href   - anchors: mailto:/tel:/social links plus the anchor's leading text
+#   tag    - any other tag; block tags become line breaks in the text layer
+#   email  - plain or "[at]"-obfuscated addresses in text
+#   phone  - international (+/00) or national (0...) numbers in text
+_CONTACT_PATTERN = (
+    r"(?<![\w.%+-])(?P<email>[\w.%+-]+(?:@|\s?[\[(]at[\])]\s?)[a-z0-9-]+(?:\.[a-z0-9-]+)*\.[a-z]{2,})"
+    r"|(?<![\w+])(?P<phone>(?:\+|00)[1-9][\d ()/.-]{6,20}\d|0[1-9][\d ()/.-]{5,18}\d)"
+)
+PAGE_RE = re.compile(
+    r"(?P<skip><script\b.*?</script\s*>|<style\b.*?</style\s*>|<!--.*?-->)"
+    r"|<a\s[^>]*?href\s*=\s*[\"']?(?P<href>[^\"'\s>]+)[^>]*>(?P<anchor_text>[^<]{0,80})"
+    r"|<(?P<tag>/?[a-z][a-z0-9]*)[^>]*>"
+    r"|" + _CONTACT_PATTERN,
+    re.IGNORECASE | re.DOTALL,
+)
+# The email and phone alternatives alone, for anchor text (which the href branch consumes)
+_TEXT_CONTACT_RE = re.compile(_CONTACT_PATTERN, re.IGNORECASE)
+_EMAIL_AT_RE = re.compile(r"\s?[\[(]at[\])]\s?", re.IGNORECASE)
+_DATE_RE = re.compile(r"\d{1,2}\.\d{1,2}\.\d{2,4}")
+_TRUNK_PREFIX_RE = re.compile(r"\(0\)")
+_NON_DIGITS_RE = re.compile(r"\D")
+_IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp")
+
+POSITION_RE = re.compile(r"\b(" + "|".join(p for p, _ in POSITION_DEPARTMENTS) + r")\b", re.IGNORECASE)
+_DEPARTMENT_RES = [(re.compile(p, re.IGNORECASE), department) for p, department in POSITION_DEPARTMENTS]
+NAME_RE = re.compile(r"\b([A-ZÄÖÜ][a-zäöüßéè]+(?:[ -](?:von |van |de )?[A-ZÄÖÜ][a-zäöüßéè]+){1,2})\b")
+
+
+def calling_code_for(url: str) -> str:
+    """Country calling code implied by a site's TLD"""
+    host = urlparse(url).hostname or ""
+    return CALLING_CODES.get(host.rsplit(".", 1)[-1], DEFAULT_CALLING_CODE)
+
+
+def normalize_email(raw: str) -> Optional[str]:
+    email = _EMAIL_AT_RE.sub("@", html_lib.unescape(raw).strip()).lower()
+    if email.count("@") != 1 or email.endswith(_IMAGE_SUFFIXES):
+        return None
+    return email
+
+
+def normalize_phone(raw: str, calling_code: str = DEFAULT_CALLING_CODE) -> Optional[str]:
+    """E.164 form of a phone number, or None if it is not plausible as one"""
+    raw = raw.strip()
+    if _DATE_RE.fullmatch(raw):
+        return None
+    digits = _NON_DIGITS_RE.sub("", _TRUNK_PREFIX_RE.sub("", raw))
+    if raw.startswith("+"):
+        e164 = digits
+    elif digits.startswith("00"):
+        e164 = digits[2:]
+    elif digits.startswith("0"):
+        e164 = calling_code + digits[1:]
+    else:
+        return None
+    if not 8 <= len(e164) <= 15:
+        return None
+    return "+" + e164
+
+
+def normalize_social(url: str) -> Optional[str]:
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower()
+    host = host[4:] if host.startswith("www.") else host
+    path = parsed.path.rstrip("/")
+    if host not in SOCIAL_HOSTS or not path or path.count("/") > 3:
+        return None
+    # Share buttons and tracking endpoints are not profiles
+    if any(part in path.lower() for part in ("/share", "/sharer", "/intent", "/plugins", "/tr")):
+        return None
+    return f"https://{host}{path}"
+
+
+def department_for(position: str) -> str:
+    for pattern, department in _DEPARTMENT_RES:
+        if pattern.fullmatch(position):
+            return department
+    return ""
+
+
+def extract_people(text: str) -> List[Dict[str, str]]:
+    """Name/position pairs from text such as 'Max Mustermann, CEO' or 'Geschäftsführer: Max Mustermann'"""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    people: Dict[str, Dict[str, str]] = {}
+    for i, line in enumerate(lines):
+        position_match = POSITION_RE.search(line)
+        if not position_match:
+            continue
+        # The name is usually on the same line, otherwise on the line just before or after
+        for candidate in (line, lines[i - 1] if i else "", lines[i + 1] if i + 1 < len(lines) else ""):
+            names = [n for n in NAME_RE.findall(candidate) if not POSITION_RE.fullmatch(n)]
+            if names:
+                position = position_match.group(1)
+                people.setdefault(names[0], {"name": names[0], "position": position, "department": department_for(position)})
+                break
+    return list(people.values())
+
+
+def extract_contacts(page: str, calling_code: str = DEFAULT_CALLING_CODE, with_text: bool = False) -> Dict[str, Any]:
+    """
+    Walk a page once and collect normalized, deduplicated emails (lowercased),
+    phones (E.164), social profile URLs and anchor links.
+    With with_text=True the visible text (block tags as line breaks) is
+    rebuilt during the same walk, for name/position extraction.
+    """
+    emails: Dict[str, None] = {}
+    phones: Dict[str, None] = {}
+    socials: Dict[str, None] = {}
+    links: List[Tuple[str, str]] = []
+    text: List[str] = []
+    last_end = 0
+
+    def add_contact(kind: str, value: str):
+        normalized = normalize_email(value) if kind == "email" else normalize_phone(value, calling_code)
+        if normalized:
+            (emails if kind == "email" else phones)[normalized] = None
+
+    for match in PAGE_RE.finditer(page):
+        if with_text:
+            text.append(page[last_end:match.start()])
+            last_end = match.end()
+        kind = match.lastgroup
+        if kind == "email" or kind == "phone":
+            value = match.group(kind)
+            add_contact(kind, value)
+            if with_text:
+                text.append(value)
+        elif kind == "tag":
+            if with_text:
+                text.append("\n" if match.group("tag").lstrip("/").lower() in _BLOCK_TAGS else " ")
+        elif kind == "anchor_text" or kind == "href":
+            href = html_lib.unescape(match.group("href"))
+            lowered = href.lower()
+            if lowered.startswith("mailto:"):
+                email = normalize_email(href[7:].split("?")[0])
+                if email:
+                    emails[email] = None
+            elif lowered.startswith("tel:"):
+                phone = normalize_phone(href[4:], calling_code)
+                if phone:
+                    phones[phone] = None
+            else:
+                social = normalize_social(href) if lowered.startswith("http") else None
+                if social:
+                    socials[social] = None
+                links.append((href, match.group("anchor_text").strip()))
+            # "<a href="/kontakt">info@acme.de</a>": contacts in the link text itself
+            for contact in _TEXT_CONTACT_RE.finditer(match.group("anchor_text")):
+                add_contact(contact.lastgroup, contact.group(contact.lastgroup))
+            if with_text:
+                text.append(" " + match.group("anchor_text"))
+    if with_text:
+        text.append(page[last_end:])
+
+    found: Dict[str, Any] = {
+        "email": list(emails),
+        "phone": list(phones),
+        "social": list(socials),
+        "links": links,
+    }
+    if with_text:
+        found["text"] = html_lib.unescape("".join(text))
+    return found
@@ -7,10 +7,23 @@ WITHOUT modifying the production app!
 
 import modal
 import json
-from fastapi import FastAPI, HTTPException
+import re
+import asyncio
+import time
+from urllib.parse import urljoin, urlparse, urldefrag
+from fastapi import BackgroundTasks, FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Callable
+
+from contact_extractors import calling_code_for, extract_contacts, extract_people
+from deadlines import Deadline, within
+from request_metrics import RequestMetrics, add_metrics_route
+from fast_json import use_fast_json
+from http_compression import add_compression
+from profiling import authorize_profile, request_profile
+from shared_fetch import SharedFetcher, get_fetcher
+from webhooks import WebhookNotifier, respond_with_callbacks
 
 # Create a wrapper app that calls the existing production app
 wrapper_app = modal.App("tech-crawl4contacts-frontand-wrapper")
@@ -19,8 +32,20 @@ wrapper_app = modal.App("tech-crawl4contacts-frontand-wrapper")
 image = modal.Image.debian_slim(python_version="3.11").pip_install([
     "fastapi[standard]>=0.100.0",
     "requests>=2.31.0",
-    "pydantic>=2.0.0"
-])
+    "aiohttp>=3.9.0",
+    "pydantic>=2.0.0",
+    "orjson>=3.9.0",
+    "zstandard>=0.22.0"
+]).add_local_python_source("contact_extractors", "deadlines", "request_metrics", "shared_fetch", "webhooks", "fast_json", "http_compression", "profiling")
+
+CONTACT_TYPES = ("email", "phone", "name", "position", "social")
+
+# Sub-pages most likely to list contacts, by path keyword (higher = crawled first)
+CONTACT_PAGE_HINTS = [
+    ("kontakt", 10), ("contact", 10), ("impressum", 9), ("imprint", 9), ("legal-notice", 8),
+    ("team", 8), ("management", 7), ("leadership", 7), ("ueber-uns", 6), ("uber-uns", 6),
+    ("about", 6), ("people", 5), ("unternehmen", 3), ("company", 3)
+]
 
 # FastAPI app for the wrapper
 app = FastAPI(
@@ -37,6 +62,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+add_metrics_route(app)
+use_fast_json(app)
+add_compression(app)
 
 # Request models matching our frontend adapter
 class ProcessRequest(BaseModel):
@@ -45,11 +73,225 @@ class ProcessRequest(BaseModel):
     test_mode: Optional[bool] = False
     enable_google_search: Optional[bool] = False
     config: Optional[Dict[str, Any]] = None
+    # Seconds the whole crawl may take; sites share what is left, and sites cut off or never
+    # started come back as rows with an error
+    deadline_s: Optional[float] = None
+    # Answer 202 at once and POST the signed result to callback_url (one progress POST per crawled site)
+    callback_url: Optional[str] = None
+    progress_callback_url: Optional[str] = None
+    callback_secret: Optional[str] = None
 
 class ProcessResponse(BaseModel):
     results: List[Dict[str, Any]]
     processing_time: float
     items_processed: int
+    # Only with ?timings=true: per-stage timings and counters for this request
+    timings: Optional[Dict[str, Any]] = None
+    # Only with ?profile=cprofile|sample and a valid X-Profile-Token: the crawl's profile
+    profiles: Optional[List[Dict[str, Any]]] = None
+
+def normalize_site_url(company: str) -> Optional[str]:
+    """Crawlable URL for a company entry, or None for bare company names"""
+    company = company.strip()
+    if company.startswith(('http://', 'https://')):
+        return company
+    if "." in company and " " not in company:
+        return f"https://{company}"
+    return None
+
+def rank_contact_links(base_url: str, links: List[Tuple[str, str]]) -> List[str]:
+    """Same-site links ordered by how likely they are to list contacts"""
+    host = urlparse(base_url).netloc.lower()
+    scored: Dict[str, int] = {}
+    for href, anchor_text in links:
+        link = urldefrag(urljoin(base_url, href))[0]
+        parsed = urlparse(link)
+        if parsed.scheme not in ("http", "https") or parsed.netloc.lower() != host:
+            continue
+        haystack = f"{parsed.path} {anchor_text}".lower()
+        score = max((weight for hint, weight in CONTACT_PAGE_HINTS if hint in haystack), default=0)
+        if score and score > scored.get(link, 0):
+            scored[link] = score
+    return sorted(scored, key=lambda link: (-scored[link], len(link)))
+
+class ContactCrawler:
+    """
+    Async multi-page contact crawler sharing one pooled HTTP session across
+    sites. Pages come from the shared fetch cache, which also applies the
+    per-host politeness limits and robots.txt. With a deadline, every site
+    and page fetch is cut to its share of the time left.
+    """
+
+    def __init__(
+        self,
+        contact_types: List[str],
+        max_pages_per_url: int = 3,
+        timeout: float = 60,
+        concurrency: int = 20,
+        fetcher: Optional[SharedFetcher] = None,
+        metrics: Optional[RequestMetrics] = None,
+        on_site_done: Optional[Callable[[Dict[str, Any]], None]] = None,
+        deadline: Optional[Deadline] = None
+    ):
+        requested = {t.strip().lower().rstrip("s") for t in contact_types} & set(CONTACT_TYPES)
+        self.contact_types = requested or set(CONTACT_TYPES)
+        # Names/positions need the page text, which the extractor only rebuilds on request
+        self.wants_people = bool(self.contact_types & {"name", "position"})
+        self.max_pages_per_url = max(1, max_pages_per_url)
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.fetcher = fetcher or get_fetcher()
+        self.metrics = metrics or RequestMetrics("contacts")
+        self.on_site_done = on_site_done
+        self.deadline = deadline or Deadline()
+        self.pages_fetched = 0
+        self.bytes_fetched = 0
+        self.extract_seconds = 0.0
+
+    async def fetch(self, session, url: str) -> Optional[str]:
+        # Each page gets the usual timeout, cut to what is left of the deadline
+        timeout = self.deadline.timeout(self.timeout)
+        with self.metrics.stage("fetch"):
+            entry = await self.fetcher.fetch(session, url, timeout)
+        self.metrics.count("cache_hits" if entry.get("cached") else "calls")
+        if entry["error"]:
+            self.metrics.count("errors")
+            print(f"[contacts] fetch_error url={url} err={entry['error']}")
+        if entry["status"] != 200 or "html" not in (entry["content_type"] or "html"):
+            return None
+        self.pages_fetched += 1
+        self.bytes_fetched += len(entry["body"])
+        return entry["body"].decode("utf-8", errors="replace")
+
+    def extract(self, url: str, html: str) -> Dict[str, Any]:
+        """Single pass over the page for every requested contact type"""
+        started = time.perf_counter()
+        found = extract_contacts(html, calling_code_for(url), with_text=self.wants_people)
+        found["people"] = extract_people(found.pop("text")) if self.wants_people else []
+        elapsed = time.perf_counter() - started
+        self.extract_seconds += elapsed
+        self.metrics.observe("parse", elapsed)
+        return found
+
+    async def crawl_site(self, session, company: str) -> List[Dict[str, Any]]:
+        url = normalize_site_url(company)
+        if not url:
+            return [contact_row(company, "", error="A website URL is required to crawl contacts")]
+
+        homepage = await self.fetch(session, url)
+        if homepage is None:
+            return [contact_row(company, url, error="Website could not be fetched")]
+
+        home_found = self.extract(url, homepage)
+        pages: List[Tuple[str, Dict[str, Any]]] = [(url, home_found)]
+        candidates = [link for link in rank_contact_links(url, home_found["links"]) if link.rstrip("/") != url.rstrip("/")]
+        sub_urls = candidates[:self.max_pages_per_url - 1]
+        sub_pages = await asyncio.gather(*[self.fetch(session, link) for link in sub_urls])
+        pages += [(link, self.extract(link, html)) for link, html in zip(sub_urls, sub_pages) if html]
+
+        emails: Dict[str, str] = {}
+        phones: Dict[str, str] = {}
+        socials: Dict[str, str] = {}
+        people: Dict[str, Dict[str, str]] = {}
+        for page_url, found in pages:
+            for email in found["email"]:
+                emails.setdefault(email, page_url)
+            for phone in found["phone"]:
+                phones.setdefault(phone, page_url)
+            for social in found["social"]:
+                socials.setdefault(social, page_url)
+            for person in found["people"]:
+                people.setdefault(person["name"], {**person, "source_url": page_url})
+
+        # Unrequested contact types are dropped here rather than skipped during the page walk
+        return merge_contacts(
+            company, url,
+            emails if "email" in self.contact_types else {},
+            phones if "phone" in self.contact_types else {},
+            socials if "social" in self.contact_types else {},
+            people if self.wants_people else {},
+            with_position="position" in self.contact_types
+        )
+
+    async def crawl(self, companies: List[str]) -> List[Dict[str, Any]]:
+        import aiohttp
+
+        semaphore = asyncio.Semaphore(max(1, self.concurrency))
+        connector = aiohttp.TCPConnector(limit=max(1, self.concurrency), ttl_dns_cache=300)
+        client_timeout = aiohttp.ClientTimeout(total=self.timeout)
+
+        sites_started = 0
+        sites_done = 0
+
+        async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+            async def bounded(company: str) -> List[Dict[str, Any]]:
+                nonlocal sites_started, sites_done
+                queued = time.perf_counter()
+                async with semaphore:
+                    self.metrics.observe("queue_wait", time.perf_counter() - queued)
+                    try:
+                        # The site's share of the time left, split over the sites not yet started
+                        budget = self.deadline.share(len(companies) - sites_started, self.concurrency, self.timeout * self.max_pages_per_url)
+                        sites_started += 1
+                        rows = await within(self.crawl_site(session, company), budget, "Site crawl")
+                    except Exception as e:
+                        rows = [contact_row(company, normalize_site_url(company) or "", error=f"Crawl failed: {e}")]
+                sites_done += 1
+                if self.on_site_done:
+                    self.on_site_done({"company": company, "sites_done": sites_done, "sites_total": len(companies), "results": rows})
+                return rows
+
+            per_site = await asyncio.gather(*[bounded(company) for company in companies])
+        return [row for rows in per_site for row in rows]
+
+def contact_row(company: str, source_url: str, error: Optional[str] = None, **fields) -> Dict[str, Any]:
+    row = {
+        "company": company,
+        "email": "",
+        "phone": "",
+        "name": "",
+        "position": "",
+        "department": "",
+        "social": "",
+        "source_url": source_url,
+        "confidence": 0.0,
+        "error": error
+    }
+    row.update(fields)
+    return row
+
+def merge_contacts(
+    company: str,
+    url: str,
+    emails: Dict[str, str],
+    phones: Dict[str, str],
+    socials: Dict[str, str],
+    people: Dict[str, Dict[str, str]],
+    with_position: bool = True
+) -> List[Dict[str, Any]]:
+    """One row per person (with their best-matching email), then remaining emails"""
+    phone = next(iter(phones), "")
+    social = ", ".join(socials)
+    unused_emails = dict(emails)
+    rows = []
+    for person in people.values():
+        name_parts = [part.lower() for part in re.split(r"[ -]", person["name"]) if len(part) > 2]
+        email = next((e for e in unused_emails if any(part in e.split("@")[0] for part in name_parts)), "")
+        unused_emails.pop(email, None)
+        rows.append(contact_row(
+            company, person["source_url"],
+            email=email, phone=phone, social=social, name=person["name"],
+            position=person["position"] if with_position else "",
+            department=person["department"] if with_position else "",
+            confidence=0.9 if email else 0.7
+        ))
+    for email, source_url in unused_emails.items():
+        rows.append(contact_row(company, source_url, email=email, phone=phone, social=social, confidence=0.5))
+    if not rows and (phone or social):
+        rows.append(contact_row(company, phones.get(phone) or url, phone=phone, social=social, confidence=0.4))
+    if not rows:
+        rows.append(contact_row(company, url, error="No contacts found"))
+    return rows
 
 @app.get("/")
 async def health_check():
@@ -62,15 +304,26 @@ async def health_check():
     }
 
 @app.post("/process")
-async def process_contacts(request: ProcessRequest) -> ProcessResponse:
+async def process_contacts(
+    request: ProcessRequest,
+    background_tasks: BackgroundTasks,
+    timings: bool = False,
+    profile: Optional[str] = None,
+    x_profile_token: Optional[str] = Header(None)
+) -> ProcessResponse:
     """
     Frontend-compatible /process endpoint
-    Transforms frontend request to match existing crawl4contacts-v2 format
+    With callback_url the crawl runs after a 202 answer and its result is POSTed
     """
-    import time
-    import requests
-    
+    notifier = WebhookNotifier.from_request("contacts", request)
+    profile_mode = authorize_profile(profile, x_profile_token)
+    return await respond_with_callbacks(notifier, background_tasks, lambda: run_contacts(request, timings, notifier, profile_mode))
+
+async def run_contacts(request: ProcessRequest, timings: bool, notifier: WebhookNotifier, profile: Optional[str] = None):
+    """Transforms frontend request to match existing crawl4contacts-v2 format"""
     start_time = time.time()
+    metrics = RequestMetrics("contacts")
+    profiler = None
     
     try:
         # Transform companies list to URLs (add https:// if needed)
@@ -83,8 +336,7 @@ async def process_contacts(request: ProcessRequest) -> ProcessResponse:
                 # The existing app can handle both URLs and company names
                 urls.append(company)
         
-        # Prepare request for existing crawl4contacts app
-        # Using the /extract endpoint which is synchronous
+        # Crawl job, in the crawl4contacts-v2 /extract payload format
         payload = {
             "job_id": f"frontend-{int(time.time())}",
             "urls": urls[:3] if request.test_mode else urls,  # Limit for test mode
@@ -96,13 +348,9 @@ async def process_contacts(request: ProcessRequest) -> ProcessResponse:
             }
         }
         
-        # Call the existing production app (note: this is internal Modal function call)
-        # Since the existing app has ASGI issues, we'll provide mock data for now
-        # TODO: Fix once the ASGI deployment is resolved
-        
         if request.test_mode:
             # Return mock data for testing
-            mock_results = [
+            results = [
                 {
                     "company": request.companies[0] if request.companies else "Test Company",
                     "email": "contact@example.com",
@@ -115,26 +363,40 @@ async def process_contacts(request: ProcessRequest) -> ProcessResponse:
                 }
             ]
         else:
-            # For production, we need to call the actual function
-            # For now, return error indicating backend needs fixing
-            raise HTTPException(
-                status_code=503,
-                detail="Production crawl4contacts backend needs ASGI deployment fix"
+            config = request.config or {}
+            options = payload["options"]
+            crawler = ContactCrawler(
+                contact_types=options["contact_types"],
+                max_pages_per_url=int(config.get("max_pages_per_url", options["max_pages_per_url"])),
+                timeout=float(config.get("timeout", options["timeout"])),
+                concurrency=int(config.get("concurrency", 20)),
+                metrics=metrics,
+                on_site_done=notifier.progress,
+                deadline=Deadline(start_time + request.deadline_s) if request.deadline_s else None
             )
+            async with request_profile(profile, "contacts crawl") as profiler:
+                results = await crawler.crawl(payload["urls"])
+            print(f"[contacts] done job_id={payload['job_id']} sites={len(payload['urls'])} pages={crawler.pages_fetched} bytes={crawler.bytes_fetched} rows={len(results)} cache={crawler.fetcher.stats}")
         
         processing_time = time.time() - start_time
         
-        return ProcessResponse(
-            results=mock_results,
+        metrics.count("results", len(results))
+        return metrics.respond(ProcessResponse.model_construct(
+            results=results,
             processing_time=processing_time,
-            items_processed=len(mock_results)
-        )
+            items_processed=len(results),
+            timings=metrics.timings() if timings else None,
+            profiles=[profiler.artifact()] if profiler else None
+        ))
         
     except Exception as e:
+        metrics.finish("error")
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
 
 # Mount the FastAPI app
-@wrapper_app.function(image=image)
+# "profiling" holds PROFILE_SECRET, which profiled requests must present as X-Profile-Token;
+# "webhook-signing" holds WEBHOOK_SIGNING_SECRET for callbacks sent without a callback_secret
+@wrapper_app.function(image=image, secrets=[modal.Secret.from_name("profiling"), modal.Secret.from_name("webhook-signing")], timeout=3600)
 @modal.asgi_app()
 def fastapi_app():
     return app
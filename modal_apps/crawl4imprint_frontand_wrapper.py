@@ -1,17 +1,36 @@
 import modal
+import os
+import asyncio
 import requests
 import time
-from fastapi import FastAPI, HTTPException
+from fastapi import BackgroundTasks, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, validator
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from datetime import datetime
 
+from request_metrics import RequestMetrics, add_metrics_route
+from fast_json import use_fast_json
+from http_compression import add_compression
+from shared_fetch import get_fetcher, normalize_url
+from webhooks import WebhookNotifier, respond_with_callbacks
+
+# Existing imprint-reader deployment (override to point at a local stub server)
+IMPRINT_BACKEND_URL = os.environ.get("IMPRINT_BACKEND_URL", "https://scaile--imprint-reader-web-app.modal.run")
+
+# Imprint results are reused across requests for the same normalized URL
+IMPRINT_RESULT_TTL = 24 * 3600
+
 # Front& Standard Input Schema
 class Crawl4ImprintRequest(BaseModel):
     websites: List[str]
     test_mode: bool = False
     enable_google_search: bool = False
+    config: Optional[Dict[str, Any]] = None
+    # Answer 202 at once and POST the signed result to callback_url; the backend extracts
+    # all URLs in one call, so there is no per-chunk progress
+    callback_url: Optional[str] = None
+    callback_secret: Optional[str] = None
     
     @validator('websites')
     def validate_websites(cls, v):
@@ -27,6 +46,8 @@ class Crawl4ImprintResponse(BaseModel):
     results: List[Dict[str, Any]]
     processing_time: float
     items_processed: int
+    # Only with ?timings=true: per-stage timings and counters for this request
+    timings: Optional[Dict[str, Any]] = None
 
 modal_app = modal.App("imprint-reader-frontand")
 
@@ -40,6 +61,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+add_metrics_route(app)
+use_fast_json(app)
+add_compression(app)
 
 @app.get("/")
 async def health_check():
@@ -51,35 +75,78 @@ async def health_check():
     }
 
 @app.post("/process")
-async def crawl_imprint_frontand(request: Crawl4ImprintRequest) -> Crawl4ImprintResponse:
+async def crawl_imprint_frontand(request: Crawl4ImprintRequest, background_tasks: BackgroundTasks, timings: bool = False) -> Crawl4ImprintResponse:
     """Front& compliant endpoint that wraps the working backend"""
+    notifier = WebhookNotifier.from_request("imprint", request)
+    return await respond_with_callbacks(notifier, background_tasks, lambda: run_imprint(request, timings))
+
+async def run_imprint(request: Crawl4ImprintRequest, timings: bool):
     start_time = time.time()
+    metrics = RequestMetrics("imprint")
     
     try:
-        # Transform Front& input to working backend format
-        working_backend_request = {
-            "urls": request.websites  # Transform 'websites' to 'urls'
-        }
-        
-        # Call the working backend
-        working_backend_url = "https://scaile--imprint-reader-web-app.modal.run"
-        
-        response = requests.post(
-            working_backend_url,
-            json=working_backend_request,
-            headers={"Content-Type": "application/json"},
-            timeout=3600
-        )
-        
-        if response.status_code != 200:
-            raise HTTPException(status_code=500, detail=f"Backend error: {response.status_code}")
+        # Variants of the same URL (tracking params, trailing slash, case) are crawled once,
+        # and URLs extracted recently by any request are served from the shared cache
+        fetcher = get_fetcher()
+        keys = [normalize_url(url) for url in request.websites]
+        unique_urls: Dict[str, str] = {}
+        for key, url in zip(keys, request.websites):
+            unique_urls.setdefault(key, url)
+        backend_results: Dict[str, Dict[str, Any]] = {}
+        with metrics.stage("cache_lookup"):
+            for key in unique_urls:
+                cached = await fetcher.lookup(f"imprint::{key}", IMPRINT_RESULT_TTL)
+                if cached:
+                    backend_results[key] = cached["result"]
+        metrics.count("cache_hits", len(backend_results))
+        pending_urls = [url for key, url in unique_urls.items() if key not in backend_results]
+        print(f"[imprint] websites={len(request.websites)} unique={len(unique_urls)} cached={len(backend_results)} to_crawl={len(pending_urls)}")
         
-        backend_data = response.json()
+        if pending_urls:
+            # Transform Front& input to working backend format
+            working_backend_request = {
+                "urls": pending_urls  # Transform 'websites' to 'urls'
+            }
+            
+            # Call the working backend
+            working_backend_url = IMPRINT_BACKEND_URL
+            
+            metrics.count("calls", len(pending_urls))
+            with metrics.stage("backend"):
+                # Off the event loop, so concurrent requests (e.g. pipeline rows) overlap
+                response = await asyncio.to_thread(
+                    requests.post,
+                    working_backend_url,
+                    json=working_backend_request,
+                    headers={"Content-Type": "application/json"},
+                    timeout=3600
+                )
+            
+            if response.status_code != 200:
+                raise HTTPException(status_code=500, detail=f"Backend error: {response.status_code}")
+            
+            with metrics.stage("parse"):
+                backend_data = response.json()
+            
+            results = backend_data.get("results", [])
+            if len(results) != len(pending_urls):
+                print(f"[imprint] backend_result_count_mismatch sent={len(pending_urls)} got={len(results)}")
+            # The backend answers in request order; key by the URL sent, since it may report a redirected one
+            for sent_url, result in zip(pending_urls, results):
+                key = normalize_url(sent_url)
+                if result.get("original_url") and normalize_url(result["original_url"]) != key:
+                    print(f"[imprint] backend_url_mismatch sent={sent_url} got={result['original_url']}")
+                backend_results[key] = result
+                if result.get("success"):
+                    await fetcher.save(f"imprint::{key}", {"result": result, "fetched_at": time.time()})
         
-        # Transform working backend output to Front& standard format
+        # Transform working backend output to Front& standard format, in request order
         frontand_results = []
         
-        for result in backend_data.get("results", []):
+        for key in keys:
+            if key not in backend_results:
+                continue
+            result = backend_results[key]
             # Transform to Front& individual column format
             frontand_result = {
                 "url": result.get("original_url", ""),
@@ -104,19 +171,26 @@ async def crawl_imprint_frontand(request: Crawl4ImprintRequest) -> Crawl4Imprint
         
         processing_time = time.time() - start_time
         
-        return Crawl4ImprintResponse(
+        metrics.count("results", len(frontand_results))
+        return metrics.respond(Crawl4ImprintResponse.model_construct(
             results=frontand_results,
             processing_time=processing_time,
-            items_processed=len(frontand_results)
-        )
+            items_processed=len(frontand_results),
+            timings=metrics.timings() if timings else None
+        ))
         
     except Exception as e:
+        metrics.finish("error")
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
 
 @modal_app.function(
     image=modal.Image.debian_slim().pip_install([
-        "fastapi", "requests", "pydantic"
-    ]),
+        "fastapi", "requests", "pydantic", "aiohttp",
+        "orjson",
+        "zstandard"
+    ]).add_local_python_source("request_metrics", "shared_fetch", "webhooks", "fast_json", "http_compression"),
+    # WEBHOOK_SIGNING_SECRET, for callbacks sent without a callback_secret
+    secrets=[modal.Secret.from_name("webhook-signing")],
     timeout=86400,
     memory=1024,
     min_containers=0
@@ -10,13 +10,20 @@ import time
 import base64
 import requests
 from io import BytesIO
-from fastapi import FastAPI, HTTPException
+from fastapi import BackgroundTasks, FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 from urllib.parse import urljoin, urlparse
 import re
 
+from deadlines import FETCH_TIMEOUT, Deadline, within
+from request_metrics import RequestMetrics, add_metrics_route
+from fast_json import use_fast_json
+from http_compression import add_compression
+from profiling import authorize_profile, request_profile
+from webhooks import WebhookNotifier, respond_with_callbacks
+
 # Create Modal app
 app_modal = modal.App("tech-crawl4logo")
 
@@ -29,8 +36,10 @@ image = modal.Image.debian_slim(python_version="3.11").pip_install([
     "pillow>=10.0.0",
     "pydantic>=2.0.0",
     "aiohttp>=3.9.0",
-    "fake-useragent>=1.4.0"
-])
+    "fake-useragent>=1.4.0",
+    "orjson>=3.9.0",
+    "zstandard>=0.22.0"
+]).add_local_python_source("deadlines", "request_metrics", "shared_fetch", "webhooks", "fast_json", "http_compression", "profiling")
 
 # FastAPI app
 app = FastAPI(
@@ -47,6 +56,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+add_metrics_route(app)
+use_fast_json(app)
+add_compression(app)
 
 # Request/Response models
 class ProcessRequest(BaseModel):
@@ -56,11 +68,22 @@ class ProcessRequest(BaseModel):
     test_mode: Optional[bool] = False
     enable_google_search: Optional[bool] = False
     config: Optional[Dict[str, Any]] = None
+    # Seconds the whole request may take; URLs share what is left, and URLs cut off or never
+    # started come back with an error
+    deadline_s: Optional[float] = None
+    # Answer 202 at once and POST the signed result to callback_url (one progress POST per URL)
+    callback_url: Optional[str] = None
+    progress_callback_url: Optional[str] = None
+    callback_secret: Optional[str] = None
 
 class ProcessResponse(BaseModel):
     results: List[Dict[str, Any]]
     processing_time: float
     items_processed: int
+    # Only with ?timings=true: per-stage timings and counters for this request
+    timings: Optional[Dict[str, Any]] = None
+    # Only with ?profile=cprofile|sample and a valid X-Profile-Token: one profile per extracted URL
+    profiles: Optional[List[Dict[str, Any]]] = None
 
 @app.get("/")
 async def health_check():
@@ -72,15 +95,32 @@ async def health_check():
         "standard": "Front&"
     }
 
-@app_modal.function(image=image, timeout=300)
-async def extract_logo_from_url(url: str, format_type: str = "png", size: str = "original") -> Dict[str, Any]:
+# "profiling" holds PROFILE_SECRET, which profiled requests must present as X-Profile-Token
+@app_modal.function(image=image, secrets=[modal.Secret.from_name("profiling")], timeout=300)
+async def extract_logo_from_url(
+    url: str,
+    format_type: str = "png",
+    size: str = "original",
+    fetch_timeout: float = FETCH_TIMEOUT,
+    profile: Optional[str] = None
+) -> Dict[str, Any]:
+    """Extract logo from a single URL, profiled (result['profile']) when the request asks for it"""
+    async with request_profile(profile, f"logo {url}") as profiler:
+        result = await extract_logo(url, format_type, size, fetch_timeout)
+    if profiler:
+        result['profile'] = profiler.artifact()
+    return result
+
+async def extract_logo(url: str, format_type: str = "png", size: str = "original", fetch_timeout: float = FETCH_TIMEOUT) -> Dict[str, Any]:
     """Extract logo from a single URL"""
     import requests
     from bs4 import BeautifulSoup
     from PIL import Image
     from fake_useragent import UserAgent
+    import aiohttp
     import base64
     from io import BytesIO
+    from shared_fetch import get_fetcher
     
     start_time = time.time()
     ua = UserAgent()
@@ -95,11 +135,13 @@ async def extract_logo_from_url(url: str, format_type: str = "png", size: str =
     }
     
     try:
-        # Fetch the webpage
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
+        # Fetch the webpage (shared with crawl4imprint/crawl4contacts via the fetch cache)
+        async with aiohttp.ClientSession(headers=headers) as session:
+            page = await get_fetcher().fetch(session, url, timeout=fetch_timeout)
+        if page["status"] != 200:
+            raise Exception(page["error"] or f"HTTP {page['status']} for {url}")
         
-        soup = BeautifulSoup(response.content, 'html.parser')
+        soup = BeautifulSoup(page["body"], 'html.parser')
         
         # Logo detection strategies (in order of preference)
         logo_candidates = []
@@ -241,11 +283,25 @@ async def extract_logo_from_url(url: str, format_type: str = "png", size: str =
         }
 
 @app.post("/process")
-async def process_logos(request: ProcessRequest) -> ProcessResponse:
+async def process_logos(
+    request: ProcessRequest,
+    background_tasks: BackgroundTasks,
+    timings: bool = False,
+    profile: Optional[str] = None,
+    x_profile_token: Optional[str] = Header(None)
+) -> ProcessResponse:
     """
     Extract logos from websites
+    With callback_url the extraction runs after a 202 answer and its result is POSTed
     """
+    notifier = WebhookNotifier.from_request("logo", request)
+    profile_mode = authorize_profile(profile, x_profile_token)
+    return await respond_with_callbacks(notifier, background_tasks, lambda: run_logos(request, timings, notifier, profile_mode))
+
+async def run_logos(request: ProcessRequest, timings: bool, notifier: WebhookNotifier, profile: Optional[str] = None):
     start_time = time.time()
+    metrics = RequestMetrics("logo")
+    profiles = []
     
     try:
         # Limit URLs for test mode
@@ -275,27 +331,63 @@ async def process_logos(request: ProcessRequest) -> ProcessResponse:
                 results.append(mock_result)
         else:
             # Process real URLs
+            deadline = Deadline(start_time + request.deadline_s) if request.deadline_s else Deadline()
             for url in urls_to_process:
-                result = await extract_logo_from_url.remote.aio(
-                    url, 
-                    request.format, 
-                    request.size
-                )
+                metrics.count("calls")
+                call_started = time.perf_counter()
+                try:
+                    # This URL's share of the time left; the remote call is cancelled when it runs out
+                    budget = deadline.share(len(urls_to_process) - len(results))
+                    result = await within(extract_logo_from_url.remote.aio(
+                        url, 
+                        request.format, 
+                        request.size,
+                        min(FETCH_TIMEOUT, budget or FETCH_TIMEOUT),
+                        profile
+                    ), budget, "Logo extraction")
+                except TimeoutError as e:
+                    result = {
+                        'url': url,
+                        'success': False,
+                        'logo_url': None,
+                        'logo_base64': None,
+                        'format': request.format,
+                        'size': None,
+                        'file_size': 0,
+                        'method': None,
+                        'processing_time': time.perf_counter() - call_started,
+                        'error': str(e)
+                    }
+                # Worker time is the extraction itself; the rest is dispatch/container queueing
+                call_seconds = time.perf_counter() - call_started
+                extract_seconds = min(call_seconds, result.get('processing_time') or 0.0)
+                metrics.observe("extract", extract_seconds)
+                metrics.observe("queue_wait", call_seconds - extract_seconds)
+                if not result.get('success'):
+                    metrics.count("errors")
+                if 'profile' in result:
+                    profiles.append(result.pop('profile'))
                 results.append(result)
+                notifier.progress({"url": url, "urls_done": len(results), "urls_total": len(urls_to_process), "results": [result]})
         
         processing_time = time.time() - start_time
         
-        return ProcessResponse(
+        metrics.count("results", len(results))
+        return metrics.respond(ProcessResponse.model_construct(
             results=results,
             processing_time=processing_time,
-            items_processed=len(results)
-        )
+            items_processed=len(results),
+            timings=metrics.timings() if timings else None,
+            profiles=profiles or None
+        ))
         
     except Exception as e:
+        metrics.finish("error")
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
 
 # Mount the FastAPI app
-@app_modal.function(image=image)
+# "webhook-signing" holds WEBHOOK_SIGNING_SECRET for callbacks sent without a callback_secret
+@app_modal.function(image=image, secrets=[modal.Secret.from_name("profiling"), modal.Secret.from_name("webhook-signing")])
 @modal.asgi_app()
 def fastapi_app():
     return app
@@ -0,0 +1,138 @@
+"""
+⏳ Deadlines - request deadlines, per-call timeouts and job cancellation
+A request may carry a deadline (deadline_s from receipt). It travels between
+containers as an absolute timestamp and is split into budgets for the work
+left: rows or fetches still to run share the remaining time, and every model
+call or page fetch is capped at its own timeout as well, so a hung call is
+abandoned instead of holding a container until the Modal timeout. Jobs are
+cancelled through a marker in a shared store that CancelWatch polls.
+"""
+
+import asyncio
+import math
+import os
+import time
+from typing import Any, Awaitable, Callable, Optional, Set
+
+# Upper bounds for a single Gemini call and a single page fetch, deadline or not
+MODEL_CALL_TIMEOUT = float(os.environ.get("MODEL_CALL_TIMEOUT", "120"))
+FETCH_TIMEOUT = float(os.environ.get("FETCH_TIMEOUT", "30"))
+# Budgets below this are not worth starting
+MIN_BUDGET = 0.5
+CANCEL_POLL_INTERVAL = float(os.environ.get("CANCEL_POLL_INTERVAL", "2"))
+
+
+class DeadlineExceeded(TimeoutError):
+    """A call, row or fetch ran out of its budget (or the request deadline passed)"""
+
+
+class JobCancelled(Exception):
+    """The job was cancelled (DELETE /jobs/{id}) while this work was running"""
+
+
+class Deadline:
+    """An absolute deadline (epoch seconds) or none at all; safe to pass between containers as .at"""
+
+    def __init__(self, at: Optional[float] = None):
+        self.at = at
+
+    @classmethod
+    def after(cls, seconds: Optional[float]) -> "Deadline":
+        return cls(time.time() + seconds if seconds else None)
+
+    def __bool__(self) -> bool:
+        return self.at is not None
+
+    def remaining(self) -> float:
+        return math.inf if self.at is None else self.at - time.time()
+
+    def expired(self) -> bool:
+        return self.remaining() < MIN_BUDGET
+
+    def timeout(self, cap: Optional[float] = None) -> Optional[float]:
+        """Seconds the next call may take: the cap, cut to what is left of the deadline"""
+        remaining = self.remaining()
+        if remaining < MIN_BUDGET:
+            raise DeadlineExceeded("Request deadline passed")
+        limit = min(remaining, cap if cap is not None else math.inf)
+        return None if limit == math.inf else limit
+
+    def share(self, units: int, concurrency: int = 1, cap: Optional[float] = None) -> Optional[float]:
+        """
+        Budget for each of `units` pieces of work run `concurrency` at a time:
+        the remaining time split over the rounds still needed, at most cap.
+        """
+        rounds = max(1, math.ceil(units / max(1, concurrency)))
+        remaining = self.remaining()
+        if remaining < MIN_BUDGET:
+            raise DeadlineExceeded("Request deadline passed")
+        limit = min(remaining / rounds, cap if cap is not None else math.inf)
+        return None if limit == math.inf else max(MIN_BUDGET, limit)
+
+
+async def within(awaitable: Awaitable[Any], seconds: Optional[float], what: str = "call") -> Any:
+    """Await with a timeout (None: no limit); the awaited work is cancelled when it runs out"""
+    if seconds is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, seconds)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"{what} exceeded its {seconds:.1f}s budget") from None
+
+
+def cancel_key(request_id: str) -> str:
+    """Store key of a job's cancel marker (apart from its status, which coordinators overwrite)"""
+    return f"cancel::{request_id}"
+
+
+class CancelWatch:
+    """
+    Polls is_cancelled() in the background while the block runs. Once it
+    returns true, .cancelled is set and work started through guard() is
+    cancelled; guard() then raises JobCancelled.
+    """
+
+    def __init__(self, is_cancelled: Callable[[], Awaitable[bool]], interval: float = CANCEL_POLL_INTERVAL):
+        self._is_cancelled = is_cancelled
+        self.interval = interval
+        self.cancelled = False
+        self._guarded: Set[asyncio.Future] = set()
+        self._poller: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "CancelWatch":
+        self._poller = asyncio.create_task(self._poll())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._poller.cancel()
+        await asyncio.gather(self._poller, return_exceptions=True)
+
+    async def _poll(self):
+        while not self.cancelled:
+            await asyncio.sleep(self.interval)
+            try:
+                if await self._is_cancelled():
+                    self.cancel()
+            except Exception as e:
+                print(f"[deadlines] cancel_poll_error err={e}")
+
+    def cancel(self):
+        self.cancelled = True
+        for future in self._guarded:
+            future.cancel()
+
+    async def guard(self, awaitable: Awaitable[Any]) -> Any:
+        if self.cancelled:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise JobCancelled("Job cancelled")
+        future = asyncio.ensure_future(awaitable)
+        self._guarded.add(future)
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if self.cancelled:
+                raise JobCancelled("Job cancelled") from None
+            raise
+        finally:
+            self._guarded.discard(future)
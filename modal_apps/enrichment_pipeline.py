@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+🧬 Enrichment Pipeline
+One /process endpoint that runs every startup through a declarative list of
+stages (default: imprint → contacts → logo → freestyle summary) by calling
+the existing Front& wrappers row by row. Each stage has its own concurrency
+limit and a row enters the next stage as soon as it leaves the previous one,
+so a row's latency is the sum of its own stage latencies instead of waiting
+for whole batches; results can stream back as NDJSON while later rows run.
+"""
+
+import modal
+import json
+import os
+import asyncio
+import time
+from fastapi import FastAPI, HTTPException
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, validator
+from typing import List, Dict, Any, Optional, AsyncIterator, Callable, Tuple
+
+from request_metrics import RequestMetrics, add_metrics_route
+from fast_json import loads, use_fast_json
+from http_compression import add_compression
+
+modal_app = modal.App("enrichment-pipeline")
+
+image = modal.Image.debian_slim(python_version="3.11").pip_install([
+    "fastapi[standard]>=0.100.0",
+    "aiohttp>=3.9.0",
+    "pydantic>=2.0.0",
+    "orjson>=3.9.0",
+    "zstandard>=0.22.0"
+]).add_local_python_source("request_metrics", "fast_json", "http_compression")
+
+# Deployed Front& wrappers (override to point at local apps or stubs)
+IMPRINT_STAGE_URL = os.environ.get("IMPRINT_STAGE_URL", "https://scaile--imprint-reader-frontand-fastapi-app.modal.run/process")
+CONTACTS_STAGE_URL = os.environ.get("CONTACTS_STAGE_URL", "https://scaile--tech-crawl4contacts-frontand-wrapper-fastapi-app.modal.run/process")
+LOGO_STAGE_URL = os.environ.get("LOGO_STAGE_URL", "https://scaile--tech-crawl4logo-fastapi-app.modal.run/process")
+FREESTYLE_STAGE_URL = os.environ.get("FREESTYLE_STAGE_URL", "https://scaile--loop-over-rows-fastapi-app.modal.run/process")
+DEFAULT_STAGE_TIMEOUT = 300.0
+
+app = FastAPI(
+    title="Enrichment Pipeline",
+    description="Streams startups through imprint, contact, logo and freestyle stages",
+    version="1.0.0"
+)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+add_metrics_route(app)
+use_fast_json(app)
+add_compression(app)
+
+
+def imprint_body(row: Dict[str, Any], options: Dict[str, Any]) -> Dict[str, Any]:
+    return {"websites": [row["website"]], **options}
+
+
+def contacts_body(row: Dict[str, Any], options: Dict[str, Any]) -> Dict[str, Any]:
+    return {"companies": [row["website"]], "contact_types": ["email", "phone", "name", "position"], **options}
+
+
+def logo_body(row: Dict[str, Any], options: Dict[str, Any]) -> Dict[str, Any]:
+    return {"urls": [row["website"]], **options}
+
+
+def freestyle_columns(row: Dict[str, Any]) -> Dict[str, str]:
+    """The row's earlier stage outputs as flat text columns for the freestyle prompt"""
+    columns = {k: v for k, v in row.items() if isinstance(v, (str, int, float)) and k != "row_key"}
+    imprint = row.get("imprint") or {}
+    for field in ("company", "managing_director", "address", "email", "phone", "registration", "vat_id"):
+        if imprint.get(field):
+            columns[f"imprint_{field}"] = str(imprint[field])
+    contacts = [c for c in row.get("contacts") or [] if not c.get("error")]
+    for field in ("email", "phone", "name", "position"):
+        values = list(dict.fromkeys(str(c[field]) for c in contacts if c.get(field)))
+        if values:
+            columns[f"contact_{field}s"] = "; ".join(values)
+    # The logo itself (base64) never goes to the model
+    if (row.get("logo") or {}).get("logo_url"):
+        columns["logo_url"] = row["logo"]["logo_url"]
+    return columns
+
+
+def freestyle_body(row: Dict[str, Any], options: Dict[str, Any]) -> Dict[str, Any]:
+    columns = freestyle_columns(row)
+    return {
+        "mode": "freestyle",
+        "headers": list(columns),
+        "rows": [list(columns.values())],
+        "row_keys": [row["row_key"]],
+        **options,
+    }
+
+
+def first_result(out: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    results = out.get("results") or []
+    return results[0] if results else None
+
+
+def freestyle_result(out: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if out.get("failed_rows"):
+        raise RuntimeError(out["failed_rows"][0].get("error") or "Row failed")
+    result = first_result(out)
+    return {k: v for k, v in result.items() if k != "row_key"} if result else None
+
+
+# stage name → (wrapper URL, default concurrency, request body builder, result extractor)
+STAGES: Dict[str, Tuple[str, int, Callable, Callable]] = {
+    "imprint": (IMPRINT_STAGE_URL, 8, imprint_body, first_result),
+    "contacts": (CONTACTS_STAGE_URL, 16, contacts_body, lambda out: out.get("results") or []),
+    "logo": (LOGO_STAGE_URL, 8, logo_body, first_result),
+    "freestyle": (FREESTYLE_STAGE_URL, 8, freestyle_body, freestyle_result),
+}
+DEFAULT_STAGES = ["imprint", "contacts", "logo", "freestyle"]
+
+
+class PipelineStage(BaseModel):
+    name: str
+    # Rows in this stage at the same time
+    concurrency: Optional[int] = None
+    timeout: float = DEFAULT_STAGE_TIMEOUT
+    # Merged into the stage's /process body (e.g. contact_types, format, prompt)
+    options: Dict[str, Any] = {}
+
+    @validator('name')
+    def validate_name(cls, v):
+        if v not in STAGES:
+            raise ValueError(f"Unknown stage: {v}. Available: {', '.join(STAGES)}")
+        return v
+
+
+class PipelineRequest(BaseModel):
+    # Startups as websites, or as rows carrying a website_column (other columns reach the freestyle prompt)
+    websites: Optional[List[str]] = None
+    rows: Optional[List[Dict[str, Any]]] = None
+    website_column: str = "website"
+    stages: Optional[List[PipelineStage]] = None
+    # Freestyle prompt when the stage list does not set one (without it, the default list skips freestyle)
+    prompt: Optional[str] = None
+    test_mode: bool = False
+    stream: bool = False
+
+
+class PipelineResponse(BaseModel):
+    results: List[Dict[str, Any]]
+    processing_time: float
+    items_processed: int
+    failed_count: int
+    # Only with ?timings=true: per-stage timings and counters for this request
+    timings: Optional[Dict[str, Any]] = None
+
+
+def plan_stages(request: PipelineRequest) -> List[PipelineStage]:
+    if request.stages is None:
+        names = DEFAULT_STAGES if request.prompt else [s for s in DEFAULT_STAGES if s != "freestyle"]
+        stages = [PipelineStage(name=name) for name in names]
+    else:
+        stages = request.stages
+    for stage in stages:
+        if stage.name == "freestyle" and "prompt" not in stage.options:
+            if not request.prompt:
+                raise HTTPException(status_code=400, detail="The freestyle stage needs a prompt")
+            stage.options = {**stage.options, "prompt": request.prompt}
+        if request.test_mode:
+            stage.options = {"test_mode": True, **stage.options}
+    return stages
+
+
+def pipeline_rows(request: PipelineRequest) -> List[Dict[str, Any]]:
+    if request.rows is not None:
+        rows = []
+        for i, row in enumerate(request.rows):
+            if not row.get(request.website_column):
+                raise HTTPException(status_code=400, detail=f"Row {i} has no '{request.website_column}'")
+            rows.append({**row, "website": row[request.website_column]})
+    else:
+        rows = [{"website": website} for website in request.websites or []]
+    if not rows:
+        raise HTTPException(status_code=400, detail="No websites provided")
+    if request.test_mode:
+        rows = rows[:3]
+    for i, row in enumerate(rows):
+        row["row_key"] = str(i)
+    return rows
+
+
+async def run_pipeline(
+    rows: List[Dict[str, Any]],
+    stages: List[PipelineStage],
+    metrics: Optional[RequestMetrics] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Push every row through the stages and yield rows as they finish the last one.
+    Each stage is bounded by its own semaphore, so slow stages queue rows without
+    holding back faster ones; a failed stage is recorded in the row's errors and
+    the row moves on.
+    """
+    import aiohttp
+
+    metrics = metrics or RequestMetrics("pipeline")
+    slots = {stage.name: asyncio.Semaphore(max(1, stage.concurrency or STAGES[stage.name][1])) for stage in stages}
+    connections = sum(max(1, stage.concurrency or STAGES[stage.name][1]) for stage in stages)
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=connections)) as session:
+        async def call(stage: PipelineStage, row: Dict[str, Any]) -> Any:
+            url, _, build_body, extract = STAGES[stage.name]
+            body = build_body(row, stage.options)
+            async with session.post(url, json=body, timeout=aiohttp.ClientTimeout(total=stage.timeout)) as resp:
+                if resp.status != 200:
+                    raise RuntimeError(f"HTTP {resp.status}: {(await resp.text())[:200]}")
+                return extract(await resp.json(loads=loads))
+
+        async def run_row(row: Dict[str, Any]) -> Dict[str, Any]:
+            row_started = time.perf_counter()
+            for stage in stages:
+                queued = time.perf_counter()
+                async with slots[stage.name]:
+                    metrics.observe(f"{stage.name}_wait", time.perf_counter() - queued)
+                    metrics.count("calls")
+                    try:
+                        with metrics.stage(stage.name):
+                            row[stage.name] = await call(stage, row)
+                    except Exception as e:
+                        metrics.count("errors")
+                        row.setdefault("errors", {})[stage.name] = f"{type(e).__name__}: {e}"
+                        print(f"[pipeline] stage_error row_key={row['row_key']} stage={stage.name} err={type(e).__name__}: {e}")
+            metrics.observe("row", time.perf_counter() - row_started)
+            return row
+
+        pending = [asyncio.create_task(run_row(row)) for row in rows]
+        try:
+            for next_done in asyncio.as_completed(pending):
+                yield await next_done
+        finally:
+            for future in pending:
+                if not future.done():
+                    future.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+@app.get("/")
+async def health_check():
+    return {
+        "status": "healthy",
+        "app": "enrichment-pipeline",
+        "version": "1.0.0",
+        "stages": list(STAGES),
+        "standard": "Front&"
+    }
+
+
+@app.post("/process")
+async def process_pipeline(request: PipelineRequest, timings: bool = False) -> PipelineResponse:
+    """Front& compliant endpoint: run every row through the requested stages"""
+    start_time = time.time()
+    metrics = RequestMetrics("pipeline")
+    rows = pipeline_rows(request)
+    stages = plan_stages(request)
+    print(f"[pipeline] start rows={len(rows)} stages={[s.name for s in stages]}")
+
+    if request.stream:
+        # One NDJSON line per row as it leaves the last stage, then a summary line
+        async def ndjson_lines():
+            status = "error"
+            failed = 0
+            try:
+                async for row in run_pipeline(rows, stages, metrics):
+                    failed += bool(row.get("errors"))
+                    yield json.dumps({"event": "result", "result": row}) + "\n"
+                yield json.dumps({"event": "done", "items_processed": len(rows), "failed_count": failed, "processing_time": time.time() - start_time}) + "\n"
+                status = "ok"
+            finally:
+                metrics.finish(status)
+
+        return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+    try:
+        results = [row async for row in run_pipeline(rows, stages, metrics)]
+        results.sort(key=lambda row: int(row["row_key"]))
+        failed = sum(1 for row in results if row.get("errors"))
+        print(f"[pipeline] done rows={len(results)} failed={failed} ms={(time.time()-start_time)*1000:.0f}")
+        return metrics.respond(PipelineResponse.model_construct(
+            results=results,
+            processing_time=time.time() - start_time,
+            items_processed=len(results),
+            failed_count=failed,
+            timings=metrics.timings() if timings else None
+        ))
+    except Exception as e:
+        metrics.finish("error")
+        raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
+
+
+@modal_app.function(image=image, timeout=86400, memory=1024, min_containers=0)
+@modal.asgi_app()
+def fastapi_app():
+    return app
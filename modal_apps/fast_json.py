@@ -0,0 +1,84 @@
+"""
+⚡ Fast JSON - orjson encoding and decoding for the Modal apps
+Large responses (50k-row freestyle results, base64 logo batches) are
+serialized with orjson instead of the stdlib encoder, and response models
+built from already-validated results are created with model_construct, so
+FastAPI never walks the results again. Request bodies are decoded with
+orjson too (validation of the request model is unchanged). Without orjson
+installed everything falls back to the stdlib json module.
+"""
+
+import json
+from typing import Any, Callable
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return shallow_dump(value)
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    return str(value)
+
+
+def shallow_dump(model: BaseModel) -> dict:
+    """A model's fields as a dict without re-serializing (or re-validating) their values"""
+    return {name: getattr(model, name, None) for name in type(model).model_fields}
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(value: Any) -> bytes:
+        if isinstance(value, BaseModel):
+            value = shallow_dump(value)
+        return orjson.dumps(value, default=_default, option=_OPTIONS)
+
+    loads: Callable[[Any], Any] = orjson.loads
+else:
+    def dumps(value: Any) -> bytes:
+        if isinstance(value, BaseModel):
+            value = shallow_dump(value)
+        return json.dumps(value, default=_default).encode("utf-8")
+
+    loads = json.loads
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class FastJSONRequest(Request):
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = loads(await self.body())
+        return self._json
+
+
+class FastJSONRoute(APIRoute):
+    """Route whose JSON request bodies are decoded with orjson"""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            return await handler(FastJSONRequest(request.scope, request.receive))
+
+        return route_handler
+
+
+def use_fast_json(app):
+    """orjson for the app's request bodies and default responses; call before declaring routes"""
+    app.router.route_class = FastJSONRoute
+    app.router.default_response_class = FastJSONResponse
@@ -0,0 +1,288 @@
+"""
+🌍 Gazetteer - location → ISO country code resolution
+Compact precomputed name/alias table, indexed once per container
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+# ISO code → (country names/aliases, regions, cities), "|"-separated.
+# EU markets come first: on ambiguous names the first listed country wins.
+GAZETTEER: Dict[str, Tuple[str, str, str]] = {
+    "DE": (
+        "germany|deutschland|allemagne|alemania|germania|federal republic of germany|brd",
+        "bavaria|bayern|baden-wurttemberg|baden-wuerttemberg|berlin-brandenburg|brandenburg|hesse|hessen|"
+        "lower saxony|niedersachsen|north rhine-westphalia|nordrhein-westfalen|nrw|rhineland-palatinate|"
+        "rheinland-pfalz|saarland|saxony|sachsen|saxony-anhalt|sachsen-anhalt|schleswig-holstein|thuringia|"
+        "thuringen|thueringen|mecklenburg-vorpommern",
+        "berlin|munich|munchen|muenchen|hamburg|cologne|koln|koeln|frankfurt|frankfurt am main|stuttgart|"
+        "dusseldorf|duesseldorf|dortmund|essen|leipzig|bremen|dresden|hanover|hannover|nuremberg|nurnberg|"
+        "nuernberg|duisburg|bochum|wuppertal|bielefeld|bonn|munster|muenster|karlsruhe|mannheim|augsburg|"
+        "wiesbaden|aachen|kiel|freiburg|heidelberg|mainz|potsdam|regensburg|ingolstadt|wolfsburg|ulm|"
+        "darmstadt|erlangen|jena|rostock|lubeck|luebeck|magdeburg|erfurt|saarbrucken|saarbruecken|kassel|"
+        "braunschweig|osnabruck|oldenburg|gottingen|goettingen|wurzburg|wuerzburg|heilbronn"
+    ),
+    "AT": (
+        "austria|osterreich|oesterreich|autriche",
+        "tyrol|tirol|styria|steiermark|carinthia|karnten|vorarlberg|upper austria|oberosterreich|"
+        "lower austria|niederosterreich|burgenland",
+        "vienna|wien|graz|linz|salzburg|innsbruck|klagenfurt|villach|wels|st polten|sankt polten|dornbirn"
+    ),
+    "CH": (
+        "switzerland|schweiz|suisse|svizzera|swiss confederation",
+        "zug|ticino|tessin|valais|wallis|graubunden|aargau|thurgau|vaud",
+        "zurich|zuerich|geneva|geneve|genf|basel|bern|berne|lausanne|lucerne|luzern|st gallen|lugano|"
+        "winterthur|biel|schaffhausen|fribourg"
+    ),
+    "FR": (
+        "france|frankreich|francia|french republic",
+        "ile-de-france|provence|brittany|bretagne|normandy|normandie|occitanie|alsace|burgundy|bourgogne|"
+        "auvergne-rhone-alpes|hauts-de-france|nouvelle-aquitaine|grand est|corsica|corse",
+        "paris|lyon|marseille|toulouse|nice|nantes|strasbourg|montpellier|bordeaux|lille|rennes|reims|"
+        "le havre|grenoble|dijon|angers|nimes|clermont-ferrand|aix-en-provence|brest|tours|limoges|amiens|"
+        "metz|perpignan|besancon|orleans|rouen|caen|nancy|sophia antipolis|cannes|annecy"
+    ),
+    "GB": (
+        "united kingdom|uk|great britain|britain|england|scotland|wales|northern ireland|vereinigtes konigreich|"
+        "grossbritannien|royaume-uni",
+        "greater london|west midlands|greater manchester|yorkshire|lancashire|kent|surrey|essex|sussex|"
+        "cornwall|devon|oxfordshire|cambridgeshire",
+        "london|manchester|birmingham|leeds|glasgow|liverpool|edinburgh|bristol|sheffield|cardiff|belfast|"
+        "nottingham|leicester|newcastle|newcastle upon tyne|brighton|southampton|portsmouth|oxford|"
+        "cambridge|reading|aberdeen|dundee|swansea|york|bath|milton keynes|coventry"
+    ),
+    "IE": (
+        "ireland|republic of ireland|eire|irland|irlande",
+        "leinster|munster province|connacht|county cork|county dublin",
+        "dublin|cork|galway|limerick|waterford|kilkenny"
+    ),
+    "NL": (
+        "netherlands|the netherlands|holland|nederland|niederlande|pays-bas",
+        "north holland|noord-holland|south holland|zuid-holland|north brabant|noord-brabant|gelderland|"
+        "utrecht province|limburg|friesland|groningen province",
+        "amsterdam|rotterdam|the hague|den haag|utrecht|eindhoven|groningen|tilburg|almere|breda|nijmegen|"
+        "delft|leiden|haarlem|arnhem|maastricht|enschede|zwolle|amersfoort|den bosch|s-hertogenbosch"
+    ),
+    "BE": (
+        "belgium|belgie|belgique|belgien",
+        "flanders|vlaanderen|wallonia|wallonie",
+        "brussels|bruxelles|brussel|antwerp|antwerpen|anvers|ghent|gent|gand|liege|luik|bruges|brugge|"
+        "leuven|louvain|namur|mons|mechelen|charleroi"
+    ),
+    "LU": (
+        "luxembourg|luxemburg|letzebuerg",
+        "",
+        "luxembourg city|esch-sur-alzette|differdange"
+    ),
+    "IT": (
+        "italy|italia|italien|italie",
+        "lombardy|lombardia|lazio|tuscany|toscana|piedmont|piemonte|veneto|emilia-romagna|sicily|sicilia|"
+        "sardinia|sardegna|campania|puglia|apulia|liguria|south tyrol|sudtirol",
+        "rome|roma|rom|milan|milano|mailand|naples|napoli|turin|torino|palermo|genoa|genova|bologna|florence|"
+        "firenze|bari|catania|venice|venezia|verona|padua|padova|trieste|brescia|bergamo|modena|parma|"
+        "bolzano|trento|pisa"
+    ),
+    "ES": (
+        "spain|espana|spanien|espagne",
+        "catalonia|catalunya|cataluna|andalusia|andalucia|basque country|pais vasco|galicia|"
+        "canary islands|canarias|balearic islands|baleares|community of madrid|castilla y leon|aragon|murcia region",
+        "madrid|barcelona|valencia|seville|sevilla|zaragoza|malaga|murcia|palma|palma de mallorca|"
+        "las palmas|bilbao|alicante|cordoba|valladolid|vigo|gijon|granada|a coruna|san sebastian|donostia|"
+        "pamplona|santander|ibiza|marbella"
+    ),
+    "PT": (
+        "portugal",
+        "algarve|madeira|azores|acores",
+        "lisbon|lisboa|porto|oporto|braga|coimbra|funchal|aveiro|faro|setubal"
+    ),
+    "DK": (
+        "denmark|danmark|danemark|daenemark",
+        "jutland|jylland|zealand|sjaelland",
+        "copenhagen|kobenhavn|koebenhavn|aarhus|odense|aalborg|esbjerg"
+    ),
+    "SE": (
+        "sweden|sverige|schweden|suede",
+        "skane|scania|vastra gotaland|stockholm county",
+        "stockholm|gothenburg|goteborg|malmo|uppsala|vasteras|orebro|linkoping|helsingborg|lund|umea"
+    ),
+    "NO": (
+        "norway|norge|norwegen|norvege",
+        "",
+        "oslo|bergen|trondheim|stavanger|tromso|drammen"
+    ),
+    "FI": (
+        "finland|suomi|finnland|finlande",
+        "uusimaa|lapland",
+        "helsinki|espoo|tampere|vantaa|oulu|turku|jyvaskyla"
+    ),
+    "IS": ("iceland|islande", "", "reykjavik"),
+    "PL": (
+        "poland|polska|polen|pologne",
+        "masovia|mazowieckie|silesia|slask|lesser poland|malopolska|pomerania|pomorskie",
+        "warsaw|warszawa|warschau|krakow|cracow|krakau|lodz|wroclaw|breslau|poznan|gdansk|danzig|szczecin|"
+        "bydgoszcz|lublin|katowice|gdynia|bialystok"
+    ),
+    "CZ": (
+        "czech republic|czechia|cesko|ceska republika|tschechien|tchequie",
+        "bohemia|moravia",
+        "prague|praha|prag|brno|ostrava|plzen|pilsen|olomouc|liberec"
+    ),
+    "SK": ("slovakia|slovensko|slowakei", "", "bratislava|kosice|presov|zilina|nitra"),
+    "HU": ("hungary|magyarorszag|ungarn|hongrie", "", "budapest|debrecen|szeged|miskolc|pecs|gyor"),
+    "SI": ("slovenia|slovenija|slowenien", "", "ljubljana|maribor|celje"),
+    "HR": ("croatia|hrvatska|kroatien|croatie", "dalmatia|istria", "zagreb|split|rijeka|osijek|zadar|dubrovnik"),
+    "RO": ("romania|rumanien|roumanie", "transylvania", "bucharest|bucuresti|bukarest|cluj-napoca|cluj|timisoara|iasi|constanta|brasov"),
+    "BG": ("bulgaria|balgariya|bulgarien|bulgarie", "", "sofia|plovdiv|varna|burgas"),
+    "GR": ("greece|hellas|ellada|griechenland|grece", "crete|attica|macedonia region", "athens|athina|athen|thessaloniki|patras|heraklion|larissa"),
+    "CY": ("cyprus|kypros|zypern|chypre", "", "nicosia|limassol|larnaca|paphos"),
+    "MT": ("malta", "gozo", "valletta|sliema|birkirkara"),
+    "EE": ("estonia|eesti|estland|estonie", "", "tallinn|tartu|narva"),
+    "LV": ("latvia|latvija|lettland|lettonie", "", "riga|daugavpils|liepaja"),
+    "LT": ("lithuania|lietuva|litauen|lituanie", "", "vilnius|kaunas|klaipeda"),
+    "UA": ("ukraine|ukraina", "", "kyiv|kiev|lviv|kharkiv|odesa|odessa|dnipro"),
+    "RS": ("serbia|srbija|serbien", "", "belgrade|beograd|novi sad|nis"),
+    "TR": ("turkey|turkiye|turkei|turquie", "", "istanbul|ankara|izmir|bursa|antalya"),
+    "US": (
+        "united states|united states of america|usa|u s a|vereinigte staaten|etats-unis",
+        "california|texas|new york state|florida|illinois|massachusetts|washington state|pennsylvania|ohio|"
+        "michigan|colorado|arizona|nevada|oregon|north carolina|virginia|new jersey|utah",
+        "new york|new york city|nyc|los angeles|san francisco|chicago|houston|boston|seattle|austin|miami|"
+        "atlanta|denver|dallas|philadelphia|phoenix|san diego|san jose|washington dc|las vegas|portland|"
+        "detroit|minneapolis|palo alto|mountain view|menlo park|brooklyn|silicon valley"
+    ),
+    "CA": (
+        "canada|kanada",
+        "ontario|quebec|british columbia|alberta|manitoba|nova scotia",
+        "toronto|montreal|vancouver|calgary|ottawa|edmonton|winnipeg|quebec city"
+    ),
+    "AU": (
+        "australia|australien|australie",
+        "new south wales|victoria state|queensland|western australia",
+        "sydney|melbourne|brisbane|perth|adelaide|canberra|gold coast"
+    ),
+    "NZ": ("new zealand|aotearoa|neuseeland", "", "auckland|wellington|christchurch"),
+    "IL": ("israel", "", "tel aviv|jerusalem|haifa"),
+    "AE": ("united arab emirates|uae|emirates", "", "dubai|abu dhabi|sharjah"),
+    "IN": ("india|indien|inde", "karnataka|maharashtra", "bangalore|bengaluru|mumbai|delhi|new delhi|hyderabad|chennai|pune|kolkata"),
+    "SG": ("singapore|singapur", "", ""),
+    "JP": ("japan|nippon|japon", "", "tokyo|osaka|kyoto|yokohama|nagoya|fukuoka"),
+    "CN": ("china|prc|chine", "", "beijing|shanghai|shenzhen|guangzhou|hangzhou"),
+    "HK": ("hong kong", "", ""),
+    "KR": ("south korea|korea|sudkorea", "", "seoul|busan|incheon"),
+    "BR": ("brazil|brasil|brasilien|bresil", "", "sao paulo|rio de janeiro|brasilia|belo horizonte"),
+    "MX": ("mexico|mexiko|mexique", "", "mexico city|ciudad de mexico|guadalajara|monterrey"),
+    "ZA": ("south africa|sudafrika|afrique du sud", "", "johannesburg|cape town|durban|pretoria"),
+}
+
+# "City, ST": after a place name these are US states, even where they are ISO codes too (CA, DE, IL, IN, MT)
+US_STATE_CODES = frozenset(
+    "AL AK AZ AR CA CO CT DE DC FL GA HI ID IL IN IA KS KY LA ME MD MA MI MN MS MO MT NE NV NH NJ NM NY "
+    "NC ND OH OK OR PA RI SC SD TN TX UT VT VA WA WV WI WY".split()
+)
+
+# Match strength: an explicit country beats a region beats a city
+_RANK_COUNTRY, _RANK_REGION, _RANK_CITY = 3, 2, 1
+
+_SEGMENT_SPLIT = re.compile(r"[,;/()|]+")
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(text: str) -> str:
+    """Casefold, strip diacritics and collapse punctuation to single spaces"""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _NON_ALNUM.sub(" ", text).strip()
+
+
+def _build_index() -> Tuple[Dict[str, Tuple[int, str]], int]:
+    index: Dict[str, Tuple[int, str]] = {}
+    max_tokens = 1
+    for code, columns in GAZETTEER.items():
+        for rank, names in zip((_RANK_COUNTRY, _RANK_REGION, _RANK_CITY), columns):
+            for name in filter(None, names.split("|")):
+                key = normalize(name)
+                current = index.get(key)
+                # Keep the stronger meaning; on equal rank the first-listed country wins
+                if current is None or current[0] < rank:
+                    index[key] = (rank, code)
+                max_tokens = max(max_tokens, key.count(" ") + 1)
+    return index, max_tokens
+
+
+# Built once at import, i.e. once per container
+_INDEX, _MAX_TOKENS = _build_index()
+
+
+@lru_cache(maxsize=65536)
+def resolve_country(location: str) -> Optional[str]:
+    """
+    ISO 3166 alpha-2 code for a free-text location, or None if unrecognized.
+    Scans each token once with a bounded n-gram window (O(len(location))).
+    """
+    best: Optional[Tuple[int, int, str]] = None
+    position = 0
+    named = False
+    for segment in _SEGMENT_SPLIT.split(location):
+        raw = segment.strip()
+        code = raw.upper()
+        # After a place name a state abbreviation means the US ("Los Angeles, CA", "Kent, WA"),
+        # unless it names the country the place was already found in ("Toronto, CA")
+        state = named and len(raw) == 2 and code in US_STATE_CODES and (best is None or best[2] != code)
+        # A bare ISO code is only trusted as a whole segment ("Berlin, DE")
+        if state or (len(raw) == 2 and raw.isalpha() and code in GAZETTEER):
+            candidate = (_RANK_COUNTRY, position, "US" if state else code)
+            best = candidate if best is None or candidate[:2] > best[:2] else best
+            position += 1
+            continue
+        named = named or bool(raw)
+        tokens = normalize(raw).split()
+        i = 0
+        while i < len(tokens):
+            for n in range(min(_MAX_TOKENS, len(tokens) - i), 0, -1):
+                hit = _INDEX.get(" ".join(tokens[i:i + n]))
+                if hit:
+                    # Later matches win ties: "City, Country" puts the country last
+                    candidate = (hit[0], position, hit[1])
+                    if best is None or candidate[:2] > best[:2]:
+                        best = candidate
+                    i += n
+                    break
+            else:
+                i += 1
+            position += 1
+    return best[2] if best else None
+
+
+if __name__ == "__main__":
+    # Spot checks: python modal_apps/gazetteer.py
+    EXPECTED = {
+        "Berlin": "DE",
+        "München, Bayern": "DE",
+        "Berlin, DE": "DE",
+        "DE": "DE",
+        "Paris, Texas": "US",
+        "London, Ontario": "CA",
+        "Toronto, CA": "CA",
+        "Los Angeles, CA": "US",
+        "Springfield, IL": "US",
+        "Indianapolis, IN": "US",
+        "Dover, DE": "US",
+        "Tel Aviv, IL": "IL",
+        "Mumbai, IN": "IN",
+        "Valletta, MT": "MT",
+        "Cambridge, MA": "US",
+        "Kent, WA": "US",
+        "Vienna, VA": "US",
+        "Berlin, NH": "US",
+        "Cambridge": "GB",
+        "Vienna": "AT",
+        "Cambridge, GB": "GB",
+        "Atlantis": None,
+    }
+    failed = {location: (resolve_country(location), want) for location, want in EXPECTED.items() if resolve_country(location) != want}
+    for location, (got, want) in failed.items():
+        print(f"FAIL {location!r}: {got} (expected {want})")
+    print(f"{len(EXPECTED) - len(failed)}/{len(EXPECTED)} ok")
+    raise SystemExit(1 if failed else 0)
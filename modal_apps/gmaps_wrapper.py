@@ -7,10 +7,20 @@ WITHOUT modifying the production app!
 
 import modal
 import json
-from fastapi import FastAPI, HTTPException
+import os
+import asyncio
+import time
+from fastapi import BackgroundTasks, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator, Callable
+
+from gazetteer import resolve_country
+from request_metrics import RequestMetrics, add_metrics_route
+from fast_json import use_fast_json
+from http_compression import add_compression
+from webhooks import WebhookNotifier, respond_with_callbacks
 
 # Create a wrapper app that calls the existing production app
 wrapper_app = modal.App("tech-gmaps-frontand-wrapper")
@@ -19,8 +29,18 @@ wrapper_app = modal.App("tech-gmaps-frontand-wrapper")
 image = modal.Image.debian_slim(python_version="3.11").pip_install([
     "fastapi[standard]>=0.100.0",
     "requests>=2.31.0",
-    "pydantic>=2.0.0"
-])
+    "aiohttp>=3.9.0",
+    "pydantic>=2.0.0",
+    "orjson>=3.9.0",
+    "zstandard>=0.22.0"
+]).add_local_python_source("gazetteer", "request_metrics", "webhooks", "fast_json", "http_compression")
+
+# Existing gmaps-fastapi-crawler deployment (override to point at a local stub server)
+GMAPS_BACKEND_URL = os.environ.get("GMAPS_BACKEND_URL", "https://scaile--gmaps-fastapi-crawler-fastapi-app.modal.run/search")
+DEFAULT_CONCURRENCY = 8
+DEFAULT_QUERY_TIMEOUT = 60.0
+# Used only when the gazetteer does not recognize a location
+DEFAULT_COUNTRY_CODE = "US"
 
 # FastAPI app for the wrapper
 app = FastAPI(
@@ -37,6 +57,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+add_metrics_route(app)
+use_fast_json(app)
+add_compression(app)
 
 # Request models matching our frontend adapter
 class ProcessRequest(BaseModel):
@@ -45,12 +68,19 @@ class ProcessRequest(BaseModel):
     max_results: Optional[int] = 10
     test_mode: Optional[bool] = False
     enable_google_search: Optional[bool] = False
+    stream: Optional[bool] = False
     config: Optional[Dict[str, Any]] = None
+    # Answer 202 at once and POST the signed result to callback_url (one progress POST per finished query)
+    callback_url: Optional[str] = None
+    progress_callback_url: Optional[str] = None
+    callback_secret: Optional[str] = None
 
 class ProcessResponse(BaseModel):
     results: List[Dict[str, Any]]
     processing_time: float
     items_processed: int
+    # Only with ?timings=true: per-stage timings and counters for this request
+    timings: Optional[Dict[str, Any]] = None
 
 @app.get("/")
 async def health_check():
@@ -62,81 +92,220 @@ async def health_check():
         "standard": "Front&"
     }
 
+def detect_country_code(location: str, default: str = DEFAULT_COUNTRY_CODE) -> str:
+    """Best-effort ISO country code for a free-text location"""
+    return resolve_country(location) or default
+
+def expand_query_tasks(locations: List[str], search_terms: List[str], default_country_code: str = DEFAULT_COUNTRY_CODE) -> List[Dict[str, str]]:
+    """Expand the location × search-term grid into one backend query per cell"""
+    tasks = []
+    for location in locations:
+        country_code = detect_country_code(location, default_country_code)
+        for search_term in search_terms:
+            tasks.append({
+                "location": location,
+                "search_term": search_term,
+                "query": f"{search_term} in {location}",
+                "country_code": country_code
+            })
+    return tasks
+
+def place_key(place: Dict[str, Any]) -> str:
+    """Stable identity of a place, used to deduplicate across overlapping queries"""
+    for field in ("place_id", "cid", "id"):
+        if place.get(field):
+            return f"id:{place[field]}"
+    name = " ".join(str(place.get("name", "")).lower().split())
+    address = " ".join(str(place.get("address", "")).lower().split())
+    return f"addr:{name}|{address}"
+
+async def fetch_places(session, task: Dict[str, str], max_results: int, backend_url: str, timeout: float) -> List[Dict[str, Any]]:
+    """Run a single grid query against the gmaps crawler backend"""
+    import aiohttp
+
+    payload = {
+        "query": task["query"],
+        "country_code": task["country_code"],
+        "max_results": max_results
+    }
+    async with session.post(backend_url, json=payload, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+        if response.status != 200:
+            raise RuntimeError(f"Backend error: {response.status}")
+        data = await response.json(content_type=None)
+    if isinstance(data, dict):
+        data = data.get("results", data.get("places", []))
+    return [place for place in data if isinstance(place, dict)]
+
+async def crawl_places(
+    tasks: List[Dict[str, str]],
+    max_results: int,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    backend_url: str = GMAPS_BACKEND_URL,
+    timeout: float = DEFAULT_QUERY_TIMEOUT,
+    stats: Optional[Dict[str, int]] = None,
+    metrics: Optional[RequestMetrics] = None,
+    on_query_done: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Dispatch grid queries concurrently and yield unique places as they arrive.
+    Stops (and cancels outstanding queries) once max_results places were yielded.
+    on_query_done gets each finished query with the new places it contributed.
+    """
+    import aiohttp
+
+    stats = stats if stats is not None else {}
+    metrics = metrics or RequestMetrics("gmaps")
+    stats.update({"queries": len(tasks), "queries_done": 0, "queries_failed": 0, "duplicates": 0})
+    if max_results <= 0:
+        return
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    seen = set()
+    emitted = 0
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=max(1, concurrency))) as session:
+        async def run(task: Dict[str, str]):
+            queued = time.perf_counter()
+            async with semaphore:
+                metrics.observe("queue_wait", time.perf_counter() - queued)
+                metrics.count("calls")
+                with metrics.stage("backend"):
+                    return task, await fetch_places(session, task, max_results, backend_url, timeout)
+
+        pending = [asyncio.create_task(run(task)) for task in tasks]
+        try:
+            for next_done in asyncio.as_completed(pending):
+                try:
+                    task, places = await next_done
+                except Exception as e:
+                    stats["queries_failed"] += 1
+                    metrics.count("errors")
+                    print(f"[gmaps] query_error err={e}")
+                    continue
+                stats["queries_done"] += 1
+                fresh = []
+                for place in places:
+                    key = place_key(place)
+                    if key in seen:
+                        stats["duplicates"] += 1
+                        metrics.count("duplicates")
+                        continue
+                    seen.add(key)
+                    fresh.append({
+                        **place,
+                        "location": task["location"],
+                        "search_term": task["search_term"],
+                        "country_code": place.get("country_code") or task["country_code"]
+                    })
+                    yield fresh[-1]
+                    emitted += 1
+                    if emitted >= max_results:
+                        break
+                if on_query_done:
+                    on_query_done({**task, "queries_done": stats["queries_done"], "queries_total": len(tasks), "results": fresh})
+                if emitted >= max_results:
+                    return
+        finally:
+            for future in pending:
+                if not future.done():
+                    future.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
 @app.post("/process")
-async def process_gmaps(request: ProcessRequest) -> ProcessResponse:
+async def process_gmaps(request: ProcessRequest, background_tasks: BackgroundTasks, timings: bool = False) -> ProcessResponse:
     """
     Frontend-compatible /process endpoint
-    Transforms frontend request to match existing gmaps-fastapi-crawler format
+    With callback_url the crawl runs after a 202 answer and its result is POSTed
     """
-    import time
-    
+    notifier = WebhookNotifier.from_request("gmaps", request)
+    if notifier.asynchronous:
+        # Nobody reads a stream whose result is POSTed
+        request.stream = False
+    return await respond_with_callbacks(notifier, background_tasks, lambda: run_gmaps(request, timings, notifier))
+
+async def run_gmaps(request: ProcessRequest, timings: bool, notifier: WebhookNotifier):
+    """Transforms frontend request to match existing gmaps-fastapi-crawler format"""
     start_time = time.time()
+    metrics = RequestMetrics("gmaps")
     
     try:
         # The existing gmaps app expects query and country_code
         # We need to extract country codes from locations and combine with search terms
         
         all_results = []
+        max_results = 10 if request.max_results is None else request.max_results
+        config = request.config or {}
         
         # Process combinations of locations and search terms
         locations_to_process = request.locations[:2] if request.test_mode else request.locations
         search_terms_to_process = request.search_terms[:2] if request.test_mode else request.search_terms
+        tasks = expand_query_tasks(
+            locations_to_process,
+            search_terms_to_process,
+            config.get("default_country_code", DEFAULT_COUNTRY_CODE)
+        )
         
-        for location in locations_to_process:
-            for search_term in search_terms_to_process:
-                # Extract country code from location (simplified)
-                # For now, default to common country codes
-                country_code = "US"  # Default
-                if any(country in location.lower() for country in ["germany", "berlin", "munich"]):
-                    country_code = "DE"
-                elif any(country in location.lower() for country in ["france", "paris", "lyon"]):
-                    country_code = "FR"
-                elif any(country in location.lower() for country in ["uk", "london", "manchester"]):
-                    country_code = "GB"
-                
-                # For test mode, return mock data
-                if request.test_mode:
-                    mock_result = {
-                        "name": f"{search_term.title()} in {location}",
-                        "address": f"123 Main St, {location}",
-                        "phone": "+1-555-0123",
-                        "website": "https://example.com",
-                        "rating": 4.5,
-                        "review_count": 42,
-                        "location": location,
-                        "search_term": search_term,
-                        "country_code": country_code
-                    }
-                    all_results.append(mock_result)
-                else:
-                    # For production, we need to call the actual function
-                    # The existing app uses @modal.fastapi_endpoint which is different from ASGI
-                    # For now, return error indicating backend needs fixing
-                    raise HTTPException(
-                        status_code=503,
-                        detail="Production gmaps backend needs proper ASGI deployment"
-                    )
+        if request.test_mode:
+            # For test mode, return mock data
+            for task in tasks[:max_results]:
+                all_results.append({
+                    "name": f"{task['search_term'].title()} in {task['location']}",
+                    "address": f"123 Main St, {task['location']}",
+                    "phone": "+1-555-0123",
+                    "website": "https://example.com",
+                    "rating": 4.5,
+                    "review_count": 42,
+                    "location": task["location"],
+                    "search_term": task["search_term"],
+                    "country_code": task["country_code"]
+                })
+        else:
+            crawl_kwargs = {
+                "max_results": max_results,
+                "concurrency": int(config.get("concurrency", DEFAULT_CONCURRENCY)),
+                # Only ever the deployment's own backend (GMAPS_BACKEND_URL), never a client-supplied host
+                "backend_url": GMAPS_BACKEND_URL,
+                "timeout": float(config.get("timeout", DEFAULT_QUERY_TIMEOUT))
+            }
+            
+            if request.stream:
+                # Stream places as NDJSON while the grid is still being crawled
+                async def ndjson_lines():
+                    try:
+                        async for place in crawl_places(tasks, metrics=metrics, **crawl_kwargs):
+                            yield json.dumps(place) + "\n"
+                    finally:
+                        metrics.finish()
                 
-                # Limit results per request
-                if len(all_results) >= request.max_results:
-                    break
+                return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
             
-            if len(all_results) >= request.max_results:
-                break
+            stats: Dict[str, int] = {}
+            async for place in crawl_places(tasks, stats=stats, metrics=metrics, on_query_done=notifier.progress, **crawl_kwargs):
+                all_results.append(place)
+            
+            print(f"[gmaps] done queries={stats['queries']} done={stats['queries_done']} failed={stats['queries_failed']} duplicates={stats['duplicates']} results={len(all_results)}")
+            if not all_results and tasks and stats["queries_failed"] == len(tasks):
+                raise HTTPException(status_code=502, detail="All gmaps backend queries failed")
         
         processing_time = time.time() - start_time
         
-        return ProcessResponse(
+        metrics.count("results", len(all_results))
+        return metrics.respond(ProcessResponse.model_construct(
             results=all_results,
             processing_time=processing_time,
-            items_processed=len(all_results)
-        )
+            items_processed=len(all_results),
+            timings=metrics.timings() if timings else None
+        ))
         
+    except HTTPException:
+        metrics.finish("error")
+        raise
     except Exception as e:
+        metrics.finish("error")
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
 
 # Mount the FastAPI app
-@wrapper_app.function(image=image)
+# "webhook-signing" holds WEBHOOK_SIGNING_SECRET for callbacks sent without a callback_secret
+@wrapper_app.function(image=image, secrets=[modal.Secret.from_name("webhook-signing")], timeout=3600)
 @modal.asgi_app()
 def fastapi_app():
     return app
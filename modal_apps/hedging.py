@@ -0,0 +1,104 @@
+"""
+🏎️ Request Hedging - a second model call for the ones stuck in the tail
+A hedged call that has not returned after the running p95 latency of its
+model gets a duplicate; whichever finishes first wins and the other is
+cancelled. Duplicates are capped at a share of all calls (the hedge budget),
+so a slow model as a whole does not double the load. Latency estimates are
+kept per model over a sliding window of recent successful calls.
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from request_metrics import RequestMetrics
+
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", "95"))
+# At most this share of calls gets a duplicate
+HEDGE_BUDGET = float(os.environ.get("HEDGE_BUDGET", "0.05"))
+# No hedging until a model has this many latencies to estimate from
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 500
+
+
+class LatencyWindow:
+    """The latest successful call latencies of one model, in seconds"""
+
+    def __init__(self, size: int = HEDGE_WINDOW):
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Nearest-rank percentile, or None while there are too few samples"""
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[max(1, math.ceil(pct / 100 * len(ordered))) - 1]
+
+
+class Hedger:
+    """
+    Hedged calls for one request (or one worker's share of it). Counts
+    hedged_calls, hedges (duplicates started) and hedge_wins (duplicates that
+    finished first) in the request's metrics.
+    """
+
+    def __init__(self, metrics: RequestMetrics, budget: float = HEDGE_BUDGET, percentile: float = HEDGE_PERCENTILE):
+        self.metrics = metrics
+        self.budget = budget
+        self.percentile = percentile
+        self.calls = 0
+        self.hedges = 0
+        self._windows: Dict[str, LatencyWindow] = {}
+
+    def delay(self, key: str) -> Optional[float]:
+        """Seconds after which a call on this model gets a duplicate (None: not yet known)"""
+        window = self._windows.get(key)
+        return window.percentile(self.percentile) if window else None
+
+    async def run(self, key: str, start: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await start() and return its result; if it is still running after the
+        model's hedge delay and the budget allows, await a second start() as
+        well and return whichever succeeds first. An error only surfaces when
+        every attempt failed.
+        """
+        window = self._windows.setdefault(key, LatencyWindow())
+        delay = window.percentile(self.percentile)
+        self.calls += 1
+        self.metrics.count("hedged_calls")
+        attempts: Dict[asyncio.Future, float] = {asyncio.ensure_future(start()): time.perf_counter()}
+        primary = next(iter(attempts))
+        pending = set(attempts)
+        error: Optional[BaseException] = None
+        try:
+            if delay is not None:
+                done, pending = await asyncio.wait(pending, timeout=delay)
+                if not done and self.hedges + 1 <= self.budget * self.calls:
+                    self.hedges += 1
+                    self.metrics.count("hedges")
+                    hedge = asyncio.ensure_future(start())
+                    attempts[hedge] = time.perf_counter()
+                    pending.add(hedge)
+                pending |= done
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is None:
+                        window.add(time.perf_counter() - attempts[attempt])
+                        if attempt is not primary:
+                            self.metrics.count("hedge_wins")
+                        return attempt.result()
+                    error = error or attempt.exception()
+            raise error
+        finally:
+            for attempt in attempts:
+                if not attempt.done():
+                    attempt.cancel()
+                elif not attempt.cancelled():
+                    attempt.exception()  # retrieved, so a losing failure is not logged as unhandled
@@ -0,0 +1,249 @@
+"""
+🗜️ HTTP Compression - gzip/zstd request and response bodies for the Modal apps
+Uploads may be sent with Content-Encoding: gzip or zstd and are inflated
+chunk by chunk as they arrive (capped at MAX_DECOMPRESSED_BYTES). Responses
+of at least COMPRESSION_MIN_SIZE bytes are compressed with the best encoding
+the client accepts (zstd, then gzip); streamed responses (NDJSON) are
+flushed per chunk so lines still arrive as they are produced. zstd is used
+only where the zstandard package is installed.
+"""
+
+import os
+import zlib
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+# Inflated request bodies above this are rejected with 413 (compression bombs)
+MAX_DECOMPRESSED_BYTES = int(os.environ.get("MAX_DECOMPRESSED_BYTES", str(1024 * 1024 * 1024)))
+# Already compressed, or consumed as an event stream by browsers
+SKIP_CONTENT_TYPES = ("image/", "video/", "audio/", "application/zip", "application/gzip", "text/event-stream")
+
+
+def supported_encodings() -> Tuple[str, ...]:
+    return ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """The preferred supported encoding the client accepts (q > 0), or None for identity"""
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+    wildcard = accepted.get("*", 0.0)
+    candidates = [(accepted.get(e, wildcard), -i, e) for i, e in enumerate(supported_encodings())]
+    q, _, best = max(candidates)
+    return best if q > 0 else None
+
+
+class _BoundedSink:
+    """Collects zstd output as it is produced and rejects it once past MAX_DECOMPRESSED_BYTES"""
+
+    def __init__(self):
+        self.chunks = []
+        self.total = 0
+
+    def write(self, data: bytes) -> int:
+        self.total += len(data)
+        if self.total > MAX_DECOMPRESSED_BYTES:
+            raise _too_large()
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        out = b"".join(self.chunks)
+        self.chunks.clear()
+        return out
+
+
+class _Decoder:
+    def __init__(self, encoding: str):
+        if encoding == "gzip":
+            self._obj = zlib.decompressobj(wbits=31)
+        elif encoding == "zstd" and zstandard is not None:
+            # zstd's decompressobj has no output limit; the stream writer hands its output over block
+            # by block, so the sink can stop a small body from inflating past the limit in one call
+            self._sink = _BoundedSink()
+            self._obj = zstandard.ZstdDecompressor().stream_writer(self._sink)
+        else:
+            raise ValueError(encoding)
+        self.encoding = encoding
+        self.total = 0
+
+    def decompress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "gzip":
+            # Bounded per chunk, so a tiny chunk cannot inflate past the limit in one call
+            out = self._obj.decompress(data, MAX_DECOMPRESSED_BYTES - self.total + 1)
+            if self._obj.unconsumed_tail:
+                raise _too_large()
+            if final:
+                out += self._obj.flush()
+                if not self._obj.eof:
+                    raise ValueError("truncated gzip stream")
+        else:
+            if data:
+                self._obj.write(data)
+            out = self._sink.take()
+        self.total += len(out)
+        if self.total > MAX_DECOMPRESSED_BYTES:
+            raise _too_large()
+        return out
+
+
+class _Encoder:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        else:
+            self._obj = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        out = self._obj.compress(data)
+        if final:
+            return out + self._obj.flush()
+        # Flush per chunk, so a streamed line is not held back until the buffer fills
+        if self.encoding == "gzip":
+            return out + self._obj.flush(zlib.Z_SYNC_FLUSH)
+        return out + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Decompressed body exceeds {MAX_DECOMPRESSED_BYTES} bytes")
+
+
+async def _send_error(send, status: int, detail: str):
+    body = ('{"detail":"%s"}' % detail).encode("utf-8")
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode("latin-1"))]})
+    await send({"type": "http.response.body", "body": body})
+
+
+class CompressionMiddleware:
+    """ASGI middleware: inflate compressed request bodies, compress negotiated responses"""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+
+        content_encoding = headers.get("content-encoding", "identity").strip().lower()
+        if content_encoding not in ("", "identity"):
+            if content_encoding not in supported_encodings():
+                await _send_error(send, 415, f"Unsupported Content-Encoding: {content_encoding}")
+                return
+            decoder = _Decoder(content_encoding)
+            # The app sees a plain body of unknown length
+            scope = dict(scope, headers=[(k, v) for k, v in scope["headers"] if k not in (b"content-encoding", b"content-length")])
+            upstream_receive = receive
+
+            # Errors surface while FastAPI reads the body, which answers HTTPExceptions as usual
+            async def receive():
+                message = await upstream_receive()
+                if message["type"] == "http.request":
+                    try:
+                        body = decoder.decompress(message.get("body", b""), final=not message.get("more_body", False))
+                    except HTTPException:
+                        raise
+                    except Exception:
+                        raise HTTPException(status_code=400, detail=f"Malformed {decoder.encoding} request body")
+                    message = {**message, "body": body}
+                return message
+
+        encoding = negotiate(headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _Responder(send, encoding, self.minimum_size).send)
+
+
+class _Responder:
+    """Holds the response start until the first body chunk shows whether to compress"""
+
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start: Optional[Dict[str, Any]] = None
+        self.encoder: Optional[_Encoder] = None
+        self.passthrough = False
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            self.passthrough = (
+                "content-encoding" in headers
+                or message["status"] in (204, 206, 304)
+                or any(content_type.startswith(t) for t in SKIP_CONTENT_TYPES)
+            )
+            if self.passthrough:
+                await self._send(message)
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start is not None:
+            start, self.start = self.start, None
+            headers = MutableHeaders(raw=start["headers"])
+            headers.add_vary_header("Accept-Encoding")
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self._send(start)
+                await self._send(message)
+                return
+            self.encoder = _Encoder(self.encoding)
+            headers["Content-Encoding"] = self.encoding
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                body = self.encoder.compress(body, final=True)
+                headers["Content-Length"] = str(len(body))
+                await self._send(start)
+                await self._send({**message, "body": body})
+                return
+            await self._send(start)
+        await self._send({**message, "body": self.encoder.compress(body, final=not more_body)})
+
+
+def add_compression(app, minimum_size: int = COMPRESSION_MIN_SIZE):
+    app.add_middleware(CompressionMiddleware, minimum_size=minimum_size)
+
+
+def compress_body(body: bytes, encoding: str = "gzip") -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    return zlib.compress(body, GZIP_LEVEL, wbits=31)
+
+
+def encode_request(body: bytes, minimum_size: int = COMPRESSION_MIN_SIZE) -> Tuple[bytes, Dict[str, str]]:
+    """(body, headers) for an upstream POST, gzip-compressed when large enough"""
+    headers = {"Content-Type": "application/json"}
+    if len(body) < minimum_size:
+        return body, headers
+    headers["Content-Encoding"] = "gzip"
+    return compress_body(body), headers
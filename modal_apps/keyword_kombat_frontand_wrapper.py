@@ -2,12 +2,24 @@ import modal
 import json
 import asyncio
 import time
-from fastapi import FastAPI, HTTPException
+from fastapi import BackgroundTasks, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field, validator
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
 from datetime import datetime
 
+from keyword_ranking import CLUSTER_THRESHOLD, HIGH_CONFIDENCE_SCORE, KeywordClusters, KeywordPrescreen, TopKResults
+from deadlines import MODEL_CALL_TIMEOUT, Deadline
+from hedging import HEDGE_BUDGET, Hedger
+from model_cascade import KOMBAT_ESCALATION_MARGIN, ModelCascade, near_threshold
+from request_metrics import RequestMetrics, add_metrics_route
+from fast_json import use_fast_json
+from http_compression import add_compression
+from token_usage import TokenBudget, TokenUsage
+from structured_output import JSON_MODE, KOMBAT_SCHEMA, extract_json
+from webhooks import WebhookNotifier, respond_with_callbacks
+
 # Front& Standard Input Schema
 class KeywordKombatRequest(BaseModel):
     keywords: List[str]
@@ -15,6 +27,35 @@ class KeywordKombatRequest(BaseModel):
     keyword_variable: str = "keyword"
     test_mode: bool = False
     enable_google_search: bool = False
+    # Stop scoring further keywords once this many tokens / USD are spent
+    max_tokens_budget: Optional[int] = None
+    max_cost: Optional[float] = None
+    # Ranked mode: keep the best top_k keywords scoring at least min_score (instead of the >=80 filter)
+    top_k: Optional[int] = None
+    min_score: Optional[int] = None
+    # Ranked mode: stop scoring once top_k keywords score >= 80 (likely winners are scored first)
+    early_stop: bool = False
+    # Stream results as NDJSON while keywords are being scored
+    stream: bool = False
+    # Opt-in: near-duplicate keywords ("crm-software kaufen", "software crm kaufen") share one
+    # model call, whose score is copied to every member (listed under "Cluster")
+    cluster_keywords: bool = False
+    cluster_threshold: float = CLUSTER_THRESHOLD
+    # Models tried in order (cheapest first); a keyword moves on when its answer is invalid or
+    # scores within escalation_margin of the filter threshold (min_score, else 80)
+    model_cascade: Optional[List[str]] = None
+    escalation_margin: int = KOMBAT_ESCALATION_MARGIN
+    # Duplicate scoring calls still running after their model's p95 latency, for at most hedge_budget of the calls
+    hedge: bool = False
+    hedge_budget: float = HEDGE_BUDGET
+    # Seconds the request may take; keywords not started by then are reported as skipped
+    deadline_s: Optional[float] = None
+    # Answer 202 at once and POST the signed result to callback_url (ranked mode: one progress
+    # POST per keyword entering the top-K); config.webhook_url only adds a completion POST
+    callback_url: Optional[str] = None
+    progress_callback_url: Optional[str] = None
+    callback_secret: Optional[str] = None
+    config: Optional[Dict[str, Any]] = None
     
     @validator('keywords')
     def validate_keywords(cls, v):
@@ -33,6 +74,16 @@ class KeywordKombatResponse(BaseModel):
     results: List[Dict[str, Any]]
     processing_time: float
     items_processed: int
+    # Only with ?timings=true: per-stage timings and counters for this request
+    timings: Optional[Dict[str, Any]] = None
+    # Tokens and cost of the model calls, and keywords not scored (budget reached or early stop)
+    usage: Optional[Dict[str, Any]] = None
+    skipped_keywords: Optional[List[str]] = None
+    stopped_early: Optional[bool] = None
+    # Model calls avoided by scoring one keyword per near-duplicate cluster
+    calls_saved: Optional[int] = None
+    # Per-tier calls, escalations and latency when a model cascade ran
+    cascade: Optional[Dict[str, Any]] = None
 
 modal_app = modal.App("keyword-kombat-frontand")
 
@@ -43,8 +94,11 @@ image = modal.Image.debian_slim().pip_install([
     "google-generativeai",
     "aiohttp",
     "asyncio-throttle",
-    "requests"
-])
+    "requests",
+    "numpy",
+    "orjson",
+    "zstandard"
+]).add_local_python_source("keyword_ranking", "request_metrics", "token_usage", "webhooks", "fast_json", "http_compression", "structured_output", "model_cascade", "hedging", "deadlines")
 
 app = FastAPI(title="Keyword Kombat API - Front& Standard", description="Front& compliant wrapper for keyword scoring")
 
@@ -56,6 +110,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+add_metrics_route(app)
+use_fast_json(app)
+add_compression(app)
 
 @app.get("/")
 async def health_check():
@@ -66,17 +123,34 @@ async def health_check():
         "standard": "Front&"
     }
 
-@modal_app.function(
-    image=image,
-    secrets=[modal.Secret.from_name("gemini-api-key")],
-    max_containers=10,
-    timeout=86400,
-    cpu=2,
-    memory=2048
-)
-async def process_keywords_with_company_research(keywords: List[str], company_url: str, enable_google_search: bool = False) -> List[Dict[str, Any]]:
+async def keyword_events(
+    keywords: List[str],
+    company_url: str,
+    enable_google_search: bool = False,
+    max_tokens_budget: Optional[int] = None,
+    max_cost: Optional[float] = None,
+    top_k: Optional[int] = None,
+    min_score: Optional[int] = None,
+    early_stop: bool = False,
+    cluster_keywords: bool = False,
+    cluster_threshold: float = CLUSTER_THRESHOLD,
+    model_cascade: Optional[List[str]] = None,
+    escalation_margin: int = KOMBAT_ESCALATION_MARGIN,
+    hedge: bool = False,
+    hedge_budget: float = HEDGE_BUDGET,
+    deadline_s: Optional[float] = None
+) -> AsyncIterator[Dict[str, Any]]:
     """
-    Process keywords with company research and German SEO scoring
+    Process keywords with company research and German SEO scoring.
+    In ranked mode (top_k or min_score) yields {"event": "result"} as each keyword
+    enters the top-K; always ends with {"event": "done", "results", "usage",
+    "skipped", "stopped_early", "calls_saved", "cascade", "metrics"}. With
+    cluster_keywords, near-duplicate keywords are scored once and the result is
+    copied to every member of the cluster. With a model_cascade, keywords start
+    on the first model and move up when the answer is invalid or the score is
+    within escalation_margin of the filter threshold. With hedge, slow scoring
+    calls get a duplicate (see hedging.Hedger). Every call is capped at
+    MODEL_CALL_TIMEOUT; past deadline_s no keyword is started any more.
     """
     import google.generativeai as genai
     import os
@@ -85,10 +159,19 @@ async def process_keywords_with_company_research(keywords: List[str], company_ur
     
     # Configure Gemini
     genai.configure(api_key=os.environ["GEMINI_API_KEY"])
-    model = genai.GenerativeModel('models/gemini-2.5-flash')
     
     # Create throttler to respect API limits
     throttler = Throttler(rate_limit=8, period=1.0)  # 8 requests per second to be safe
+    metrics = RequestMetrics("kombat")
+    hedger = Hedger(metrics, hedge_budget) if hedge else None
+    cascade = ModelCascade(model_cascade, genai.GenerativeModel, metrics, hedger)
+    threshold = min_score if min_score is not None else HIGH_CONFIDENCE_SCORE
+    budget = TokenBudget(max_tokens_budget, max_cost)
+    deadline = Deadline.after(deadline_s)
+    usage = TokenUsage()
+    skipped: List[str] = []
+    ranked = top_k is not None or min_score is not None
+    ranking = TopKResults(top_k, min_score if min_score is not None else 0)
     
     # Step 1: Research the company
     company_research_prompt = f"""
@@ -115,20 +198,20 @@ Wichtig: Antworte NUR mit dem JSON-Objekt, ohne zusätzlichen Text.
         else:
             search_prompt = company_research_prompt
             
+        queued = time.perf_counter()
         async with throttler:
-            company_response = model.generate_content(search_prompt)
+            metrics.observe("rate_limit_wait", time.perf_counter() - queued)
+            metrics.count("calls")
+            # Once per request, so on the strongest tier
+            with metrics.stage("research"):
+                company_response = await cascade.agenerate(cascade.last, search_prompt, deadline.timeout(MODEL_CALL_TIMEOUT), generation_config=JSON_MODE)
+            metrics.count_usage(company_response)
+            usage.add_response(company_response, cascade.models[cascade.last])
             company_info_text = company_response.text.strip()
             
             # Parse company info
             try:
-                # Clean the response
-                cleaned_response = company_info_text
-                if "```json" in cleaned_response:
-                    cleaned_response = cleaned_response.split("```json")[1].split("```")[0]
-                elif "```" in cleaned_response:
-                    cleaned_response = cleaned_response.split("```")[1].split("```")[0]
-                
-                company_info = json.loads(cleaned_response)
+                company_info = extract_json(company_info_text)
                 print(f"✅ Company research completed: {company_info.get('company_name', 'Unknown')}")
                 
             except json.JSONDecodeError:
@@ -242,45 +325,93 @@ REGELN:
     successful_count = 0
     failed_count = 0
     
+    async def call_model(keyword: str, tier: int, prompt: str, first: bool = False) -> Any:
+        """One scoring call on a cascade tier, retried with backoff; a first call is not started (None) past the budget"""
+        max_retries = 3
+        for attempt in range(max_retries):
+            if first and ((budget and budget.exhausted(usage)) or (early_stop and ranking.satisfied()) or deadline.expired()):
+                return None
+            timeout = deadline.timeout(MODEL_CALL_TIMEOUT)
+            try:
+                metrics.count("calls")
+                with metrics.stage("model"):
+                    response = await cascade.agenerate(tier, prompt, timeout, generation_config=KOMBAT_SCHEMA.generation_config)
+                metrics.count_usage(response)
+                usage.add_response(response, cascade.models[tier])
+                return response
+            except Exception as e:
+                print(f"Attempt {attempt + 1} failed for keyword '{keyword}': {str(e)}")
+                if attempt == max_retries - 1:
+                    raise e
+                metrics.count("retries")
+                await asyncio.sleep(2 ** attempt)  # Exponential backoff
+    
+    def escalation_reason(parsed_result: Optional[Dict[str, Any]], errors: List[str]) -> Optional[str]:
+        if errors:
+            return "invalid"
+        # Near the threshold the keep/drop decision hinges on a few points
+        if near_threshold(parsed_result['RelevanceScore'], threshold, escalation_margin):
+            return "near_threshold"
+        return None
+    
     async def process_single_keyword(keyword: str) -> Optional[Dict[str, Any]]:
         """Process a single keyword with the AI model"""
         nonlocal successful_count, failed_count
         
         try:
+            if deadline.expired():
+                # Past the deadline, do not queue for a rate-limit slot just to skip
+                print(f"⏹️ Deadline passed, skipping keyword: {keyword}")
+                skipped.append(keyword)
+                return None
+            queued = time.perf_counter()
             async with throttler:
+                metrics.observe("rate_limit_wait", time.perf_counter() - queued)
                 # Build the prompt for this keyword
                 prompt = german_seo_prompt_template.replace("{{ keyword }}", keyword)
                 
                 print(f"🔍 Processing keyword: {keyword}")
                 
-                # Generate response with retries
-                max_retries = 3
-                response = None
-                
-                for attempt in range(max_retries):
-                    try:
-                        response = model.generate_content(prompt)
-                        break
-                    except Exception as e:
-                        print(f"Attempt {attempt + 1} failed for keyword '{keyword}': {str(e)}")
-                        if attempt == max_retries - 1:
-                            raise e
-                        await asyncio.sleep(2 ** attempt)  # Exponential backoff
+                # Cheapest tier first
+                tier = 0
+                response = await call_model(keyword, tier, prompt, first=True)
+                if response is None:
+                    print(f"⏹️ Budget reached or top {top_k} found, skipping keyword: {keyword}")
+                    skipped.append(keyword)
+                    return None
                 
-                if not response or not response.text:
+                if not response.text:
                     print(f"❌ Empty response for keyword: {keyword}")
                     failed_count += 1
                     return None
                 
-                # Parse the response
-                parsed_result = parse_ai_response(response.text.strip())
+                # Parse and validate the response
+                with metrics.stage("parse"):
+                    parsed_result, errors = parse_ai_response(response.text)
+                
+                # Invalid answers and scores near the filter threshold go to the next tier
+                while cascade.escalate(tier, escalation_reason(parsed_result, errors)):
+                    tier += 1
+                    print(f"⬆️ Escalating keyword {keyword} to {cascade.models[tier]}")
+                    response = await call_model(keyword, tier, prompt)
+                    with metrics.stage("parse"):
+                        parsed_result, errors = parse_ai_response(response.text or "")
                 
-                if parsed_result and 'RelevanceScore' in parsed_result:
-                    score = parsed_result.get('RelevanceScore', 0)
-                    if isinstance(score, int) and 10 <= score <= 100:
-                        print(f"✅ {keyword}: Score {score}")
-                        successful_count += 1
-                        return parsed_result
+                if errors:
+                    # One targeted repair instead of dropping the keyword
+                    print(f"🔧 Repairing response for keyword: {keyword} ({'; '.join(errors[:3])})")
+                    metrics.count("repairs")
+                    response = await call_model(keyword, tier, KOMBAT_SCHEMA.repair_prompt(prompt, response.text, errors))
+                    with metrics.stage("parse"):
+                        parsed_result, errors = parse_ai_response(response.text or "")
+                    if errors:
+                        metrics.count("repair_failures")
+                
+                if parsed_result:
+                    cascade.resolved(tier)
+                    print(f"✅ {keyword}: Score {parsed_result['RelevanceScore']}")
+                    successful_count += 1
+                    return parsed_result
                 
                 print(f"❌ Failed to parse valid response for keyword: {keyword}")
                 failed_count += 1
@@ -291,66 +422,119 @@ REGELN:
             failed_count += 1
             return None
     
+    clusters = None
+    if cluster_keywords:
+        with metrics.stage("cluster"):
+            clusters = KeywordClusters(keywords, threshold=cluster_threshold)
+        keywords = clusters.representatives
+        metrics.count("calls_saved", clusters.calls_saved)
+        print(f"🧩 {len(keywords)} keyword clusters, {clusters.calls_saved} calls saved")
+    
+    if ranked:
+        # Likely winners first, so the heap fills with strong results early
+        with metrics.stage("prescreen"):
+            keywords = KeywordPrescreen(company_info).order(keywords)
+    
+    async def score_keyword(keyword: str):
+        return keyword, await process_single_keyword(keyword)
+    
     # Process keywords in batches of 5
     batch_size = 5
     for i in range(0, len(keywords), batch_size):
+        if (budget and budget.exhausted(usage)) or (early_stop and ranking.satisfied()):
+            skipped.extend(keywords[i:])
+            break
         batch = keywords[i:i + batch_size]
         
-        # Process batch concurrently
-        tasks = [process_single_keyword(keyword) for keyword in batch]
-        batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # Collect successful results
-        for result in batch_results:
-            if isinstance(result, dict) and result is not None:
+        # Process batch concurrently, collecting results as they finish
+        tasks = [asyncio.create_task(score_keyword(keyword)) for keyword in batch]
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                keyword, scored = await next_done
+            except Exception:
+                continue
+            if not isinstance(scored, dict):
+                continue
+            for result in clusters.expand(keyword, scored) if clusters else [scored]:
+                if ranked:
+                    if ranking.push(result):
+                        yield {"event": "result", "result": result}
                 # Only include results with score >= 80
-                if result.get('RelevanceScore', 0) >= 80:
+                elif result.get('RelevanceScore', 0) >= HIGH_CONFIDENCE_SCORE:
                     results.append(result)
     
+    if clusters:
+        skipped = [member for keyword in skipped for member in clusters.members(keyword)]
+    if ranked:
+        results = ranking.results()
+    stopped_early = early_stop and ranking.satisfied() and bool(skipped)
     print(f"🎉 Processing complete! {successful_count} successful, {failed_count} failed")
-    print(f"📊 {len(results)} keywords scored ≥80 points")
+    print(f"📊 {len(results)} keywords kept" + (f" (top {top_k}, min score {min_score}, stopped early: {stopped_early})" if ranked else " (scored ≥80 points)"))
+    print(f"🪙 {usage.total_tokens} tokens, ${usage.cost:.4f}; {len(skipped)} keywords skipped")
+    metrics.count("errors", failed_count)
+    metrics.count("skipped_keywords", len(skipped))
     
-    return results
+    yield {
+        "event": "done",
+        "results": results,
+        "usage": usage.to_dict(),
+        "skipped": skipped,
+        "stopped_early": stopped_early,
+        "calls_saved": clusters.calls_saved if clusters else 0,
+        "cascade": cascade.summary() if len(cascade) > 1 else None,
+        "metrics": metrics.to_dict()
+    }
 
-def parse_ai_response(response_text: str) -> Optional[Dict[str, Any]]:
-    """Parse the AI response and extract structured data"""
-    try:
-        # Clean the response text
-        cleaned = response_text.strip()
-        
-        # Remove code fences
-        if "```json" in cleaned:
-            cleaned = cleaned.split("```json")[1].split("```")[0]
-        elif "```" in cleaned:
-            cleaned = cleaned.split("```")[1].split("```")[0]
-        
-        # Clean up common prefixes
-        import re
-        cleaned = re.sub(r'^(json|JSON|response|Response):\s*', '', cleaned)
-        cleaned = cleaned.strip()
-        
-        # Try to parse as JSON
-        result = json.loads(cleaned)
-        
-        # Validate required fields
-        if 'Keyword' in result and 'RelevanceScore' in result and 'Rationale' in result:
-            # Ensure score is an integer
-            if isinstance(result['RelevanceScore'], (int, float)):
-                result['RelevanceScore'] = int(result['RelevanceScore'])
-                # Clamp score between 10 and 100
-                result['RelevanceScore'] = max(10, min(100, result['RelevanceScore']))
-                return result
-        
-        return None
-        
-    except (json.JSONDecodeError, KeyError, ValueError) as e:
-        print(f"JSON parse error: {e}")
-        return None
+@modal_app.function(
+    image=image,
+    secrets=[modal.Secret.from_name("gemini-api-key")],
+    max_containers=10,
+    timeout=86400,
+    cpu=2,
+    memory=2048
+)
+async def process_keywords_with_company_research(keywords: List[str], company_url: str, **options) -> Dict[str, Any]:
+    """Score keywords and return the final {"results", "usage", "skipped", "stopped_early", "metrics"}"""
+    async for event in keyword_events(keywords, company_url, **options):
+        if event["event"] == "done":
+            return event
+    return {}
+
+@modal_app.function(
+    image=image,
+    secrets=[modal.Secret.from_name("gemini-api-key")],
+    max_containers=10,
+    timeout=86400,
+    cpu=2,
+    memory=2048
+)
+async def stream_keywords_with_company_research(keywords: List[str], company_url: str, **options) -> AsyncIterator[Dict[str, Any]]:
+    """Generator variant of process_keywords_with_company_research for NDJSON streaming"""
+    async for event in keyword_events(keywords, company_url, **options):
+        yield event
+
+def parse_ai_response(response_text: str) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """Parse the AI response and validate it against the Kombat schema; (result, errors)"""
+    result, errors = KOMBAT_SCHEMA.decode(response_text)
+    if errors:
+        print(f"Invalid AI response: {'; '.join(errors[:3])}")
+        return None, errors
+    # Clamp score between 10 and 100
+    result['RelevanceScore'] = max(10, min(100, int(result['RelevanceScore'])))
+    return result, []
 
 @app.post("/process")
-async def keyword_kombat_frontand(request: KeywordKombatRequest) -> KeywordKombatResponse:
+async def keyword_kombat_frontand(request: KeywordKombatRequest, background_tasks: BackgroundTasks, timings: bool = False) -> KeywordKombatResponse:
     """Front& compliant endpoint for keyword scoring"""
+    notifier = WebhookNotifier.from_request("keyword-kombat", request)
+    if notifier.asynchronous:
+        # Nobody reads a stream whose result is POSTed
+        request.stream = False
+    return await respond_with_callbacks(notifier, background_tasks, lambda: run_keyword_kombat(request, timings, notifier))
+
+async def run_keyword_kombat(request: KeywordKombatRequest, timings: bool, notifier: WebhookNotifier):
     start_time = time.time()
+    metrics = RequestMetrics("kombat")
     
     try:
         if request.test_mode:
@@ -366,32 +550,87 @@ async def keyword_kombat_frontand(request: KeywordKombatRequest) -> KeywordKomba
             
             processing_time = time.time() - start_time
             
-            return KeywordKombatResponse(
+            return metrics.respond(KeywordKombatResponse.model_construct(
                 results=mock_results,
                 processing_time=processing_time,
-                items_processed=len(mock_results)
-            )
+                items_processed=len(mock_results),
+                timings=metrics.timings() if timings else None
+            ))
+        
+        options = {
+            "enable_google_search": request.enable_google_search,
+            "max_tokens_budget": request.max_tokens_budget,
+            "max_cost": request.max_cost,
+            "top_k": request.top_k,
+            "min_score": request.min_score,
+            "early_stop": request.early_stop,
+            "cluster_keywords": request.cluster_keywords,
+            "cluster_threshold": request.cluster_threshold,
+            "model_cascade": request.model_cascade,
+            "escalation_margin": request.escalation_margin,
+            "hedge": request.hedge,
+            "hedge_budget": request.hedge_budget,
+            "deadline_s": request.deadline_s
+        }
+        
+        if request.stream:
+            # One NDJSON line per keyword entering the top-K, then the final summary line
+            async def ndjson_lines():
+                status = "error"
+                try:
+                    async for event in stream_keywords_with_company_research.remote_gen.aio(request.keywords, request.company_url, **options):
+                        if event["event"] == "done":
+                            metrics.merge(event.pop("metrics", None))
+                            event["items_processed"] = len(event["results"])
+                        yield json.dumps(event) + "\n"
+                    status = "ok"
+                finally:
+                    metrics.finish(status)
+            
+            return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
         
         # Process keywords with the Loop Over Rows backend
-        results = await process_keywords_with_company_research.remote(
-            keywords=request.keywords,
-            company_url=request.company_url,
-            enable_google_search=request.enable_google_search
-        )
+        with metrics.stage("worker"):
+            if notifier.progress_callback_url:
+                # Same events as the stream: each keyword entering the top-K becomes a progress POST
+                out = {}
+                async for event in stream_keywords_with_company_research.remote_gen.aio(request.keywords, request.company_url, **options):
+                    if event["event"] == "done":
+                        out = event
+                    else:
+                        notifier.progress({"result": event["result"]})
+            else:
+                out = await process_keywords_with_company_research.remote(
+                    keywords=request.keywords,
+                    company_url=request.company_url,
+                    **options
+                )
+        results = out["results"]
+        metrics.merge(out.get("metrics"))
         
         processing_time = time.time() - start_time
         
-        return KeywordKombatResponse(
+        metrics.count("results", len(results))
+        return metrics.respond(KeywordKombatResponse.model_construct(
             results=results,
             processing_time=processing_time,
-            items_processed=len(results)
-        )
+            items_processed=len(results),
+            timings=metrics.timings() if timings else None,
+            usage=out.get("usage"),
+            skipped_keywords=out.get("skipped") or None,
+            stopped_early=out.get("stopped_early"),
+            calls_saved=out.get("calls_saved"),
+            cascade=out.get("cascade")
+        ))
         
     except Exception as e:
+        metrics.finish("error")
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
 
 @modal_app.function(
     image=image,
+    # WEBHOOK_SIGNING_SECRET, for callbacks sent without a callback_secret
+    secrets=[modal.Secret.from_name("webhook-signing")],
     timeout=86400,
     memory=1024,
     min_containers=0
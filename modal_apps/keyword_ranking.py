@@ -0,0 +1,224 @@
+"""
+🏆 Keyword Ranking - top-K selection and lexical pre-screening for Keyword Kombat
+Instead of scoring every keyword and filtering afterwards, Kombat can keep
+only the best top_k results above min_score in a bounded heap, score the
+keywords most likely to win first (ordered by lexical overlap with the
+researched company profile) and stop once enough high-confidence keywords
+were found. On request, near-duplicate keywords ("crm software kaufen",
+"crm-software kaufen", "software crm kaufen", "crm softwares kaufen") are
+clustered first so each cluster costs one model call.
+"""
+
+import heapq
+import re
+import unicodedata
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+# Kombat's "keep" threshold, and what counts as high confidence for early stopping
+HIGH_CONFIDENCE_SCORE = 80
+# Fallback threshold when nothing clears HIGH_CONFIDENCE_SCORE (legacy filter)
+RELAXED_SCORE = 50
+
+_WORD_RE = re.compile(r"[0-9a-zäöüß]+")
+_STOPWORDS = {
+    "und", "oder", "der", "die", "das", "den", "dem", "des", "ein", "eine", "einer", "für", "mit", "von", "im", "in",
+    "auf", "zu", "zur", "zum", "bei", "aus", "the", "and", "for", "with", "of", "to", "a", "an", "on", "at", "by",
+}
+_NGRAM = 4
+
+# Keyword clustering: cosine threshold on char-trigram vectors, hashed vector width,
+# how many sort-order neighbours each keyword is compared with, the shortest word a
+# variant may differ in, and the plural/case endings that make two words variants.
+# Typos are not merged: one changed letter too often changes the meaning ("kosten"/"posten",
+# "bauen"/"bauern"), and a wrong merge copies a score to an unrelated keyword.
+CLUSTER_THRESHOLD = 0.85
+CLUSTER_DIMENSIONS = 512
+CLUSTER_WINDOW = 12
+CLUSTER_MIN_VARIANT_LENGTH = 5
+PLURAL_SUFFIXES = frozenset({"s", "e", "n", "en", "es"})
+_FOLD = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+
+
+def _terms(text: str) -> List[str]:
+    return [w for w in _WORD_RE.findall(text.lower()) if len(w) > 2 and w not in _STOPWORDS]
+
+
+def _ngrams(words: Iterable[str]) -> Set[str]:
+    # Character n-grams catch German compounds ("Softwarelösungen" vs "software")
+    grams: Set[str] = set()
+    for w in words:
+        grams.update(w[i:i + _NGRAM] for i in range(max(1, len(w) - _NGRAM + 1)))
+    return grams
+
+
+class KeywordPrescreen:
+    """Cheap lexical relevance of keywords to a company profile, used only to order scoring"""
+
+    def __init__(self, company: Dict[str, Any]):
+        text = " ".join(str(v) for v in company.values() if isinstance(v, str))
+        self.words = set(_terms(text))
+        self.grams = _ngrams(self.words)
+
+    def score(self, keyword: str) -> float:
+        words = _terms(keyword)
+        if not words:
+            return 0.0
+        word_overlap = sum(1 for w in words if w in self.words) / len(words)
+        grams = _ngrams(words)
+        gram_overlap = len(grams & self.grams) / len(grams) if grams else 0.0
+        return word_overlap + 0.5 * gram_overlap
+
+    def order(self, keywords: Sequence[str]) -> List[str]:
+        """Likely winners first; ties keep the caller's order"""
+        scores = {kw: self.score(kw) for kw in keywords}
+        return sorted(keywords, key=lambda kw: -scores[kw])
+
+
+class TopKResults:
+    """
+    The best results by RelevanceScore, at most top_k of them (unbounded when
+    top_k is None), all at or above min_score. Ties keep the earlier result.
+    """
+
+    def __init__(self, top_k: Optional[int] = None, min_score: int = 0):
+        self.top_k = top_k
+        self.min_score = min_score
+        self._heap: List[Tuple[int, int, Dict[str, Any]]] = []
+        self._seq = 0
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def push(self, result: Dict[str, Any]) -> bool:
+        """Offer a scored result; True if it is (for now) among the top_k"""
+        score = result.get("RelevanceScore", 0)
+        if not isinstance(score, (int, float)) or score < self.min_score:
+            return False
+        # Later results sort lower on equal scores, so they are the ones evicted
+        self._seq += 1
+        entry = (score, -self._seq, result)
+        if self.top_k is None or len(self._heap) < self.top_k:
+            heapq.heappush(self._heap, entry)
+            return True
+        if entry[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, entry)
+            return True
+        return False
+
+    def satisfied(self, score: int = HIGH_CONFIDENCE_SCORE) -> bool:
+        """A full heap whose weakest entry already scores at least `score`"""
+        return self.top_k is not None and len(self._heap) >= self.top_k and self._heap[0][0] >= score
+
+    def results(self) -> List[Dict[str, Any]]:
+        return [entry[2] for entry in sorted(self._heap, reverse=True)]
+
+
+def normalize_keyword(keyword: str) -> str:
+    """Order-, case-, umlaut- and punctuation-insensitive form: the sorted set of words"""
+    folded = unicodedata.normalize("NFC", keyword).lower().translate(_FOLD)
+    words = {w for w in _WORD_RE.findall(folded) if w not in _STOPWORDS}
+    return " ".join(sorted(words)) if words else folded.strip()
+
+
+def _word_variants(a: str, b: str) -> bool:
+    """One word with a plural or case ending the other lacks ("agentur"/"agenturen", "preise"/"preisen")"""
+    short, long_ = sorted((a, b), key=len)
+    if len(short) < CLUSTER_MIN_VARIANT_LENGTH or not long_.startswith(short):
+        return False
+    return long_[len(short):] in PLURAL_SUFFIXES
+
+
+def _variants(form_a: str, form_b: str) -> bool:
+    """Same words except for one that is a plural or inflected form of the other's"""
+    words_a, words_b = form_a.split(" "), form_b.split(" ")
+    if len(words_a) != len(words_b):
+        return False
+    differing = [(a, b) for a, b in zip(words_a, words_b) if a != b]
+    return len(differing) <= 1 and all(_word_variants(a, b) for a, b in differing)
+
+
+def _trigram_vectors(forms: Sequence[str]) -> np.ndarray:
+    """L2-normalized, hashed char-trigram count vectors, one row per form"""
+    rows: List[int] = []
+    cols: List[int] = []
+    for r, form in enumerate(forms):
+        padded = f" {form} "
+        for i in range(len(padded) - 2):
+            rows.append(r)
+            cols.append(zlib.crc32(padded[i:i + 3].encode("utf-8")) % CLUSTER_DIMENSIONS)
+    flat = np.asarray(rows, dtype=np.int64) * CLUSTER_DIMENSIONS + np.asarray(cols, dtype=np.int64)
+    vectors = np.bincount(flat, minlength=len(forms) * CLUSTER_DIMENSIONS).astype(np.float32)
+    vectors = vectors.reshape(len(forms), CLUSTER_DIMENSIONS)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-9)
+
+
+class KeywordClusters:
+    """
+    Near-duplicate keyword clusters, so Kombat scores one representative per
+    cluster and copies its score to the other members. Keywords with the same
+    normalized word set are merged outright; the remaining forms are compared
+    by trigram cosine with their neighbours in two sort orders (forward and
+    reversed text), which finds inflection variants without an all-pairs
+    comparison, and merged only when they differ in one word's plural or case
+    ending (umlauts, hyphens, case and word order are already normalized).
+    The representative is a cluster's first keyword.
+    """
+
+    def __init__(self, keywords: Sequence[str], threshold: float = CLUSTER_THRESHOLD, window: int = CLUSTER_WINDOW):
+        self.keywords = list(keywords)
+        form_of: Dict[str, int] = {}
+        form_index = [form_of.setdefault(normalize_keyword(kw), len(form_of)) for kw in self.keywords]
+        forms = list(form_of)
+
+        parent = list(range(len(forms)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        if threshold < 1.0 and len(forms) > 1:
+            vectors = _trigram_vectors(forms)
+            for order in (np.argsort(np.asarray(forms)), np.argsort(np.asarray([f[::-1] for f in forms]))):
+                ordered = vectors[order]
+                for offset in range(1, min(window, len(forms) - 1) + 1):
+                    similar = np.einsum("ij,ij->i", ordered[:-offset], ordered[offset:]) >= threshold
+                    for i in np.nonzero(similar)[0]:
+                        x, y = int(order[i]), int(order[i + offset])
+                        if not _variants(forms[x], forms[y]):
+                            continue
+                        a, b = find(x), find(y)
+                        if a != b:
+                            parent[max(a, b)] = min(a, b)
+
+        # Representative: the first keyword (in input order) of each cluster
+        first_of_root: Dict[int, int] = {}
+        self.representative_of = [first_of_root.setdefault(find(form_index[i]), i) for i in range(len(self.keywords))]
+        members: Dict[int, Dict[str, None]] = {}
+        for i, r in enumerate(self.representative_of):
+            members.setdefault(r, {})[self.keywords[i]] = None
+        # representative keyword → its cluster's distinct keywords, representative first
+        self.clusters: Dict[str, List[str]] = {self.keywords[r]: list(m) for r, m in members.items()}
+
+    @property
+    def representatives(self) -> List[str]:
+        return list(self.clusters)
+
+    @property
+    def calls_saved(self) -> int:
+        return len(self.keywords) - len(self.clusters)
+
+    def members(self, keyword: str) -> List[str]:
+        return self.clusters.get(keyword, [keyword])
+
+    def expand(self, keyword: str, result: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """The representative's result copied to every member, each listing the cluster"""
+        members = self.members(keyword)
+        if len(members) == 1:
+            return [result]
+        return [{**result, "Keyword": member, "Cluster": members} if member != keyword else {**result, "Cluster": members} for member in members]
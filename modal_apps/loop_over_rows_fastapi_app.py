@@ -1,24 +1,88 @@
 import modal
+import os
+import re
+import shutil
 import time
 import json
+import random
 import asyncio
-from typing import List, Dict, Any, Optional, Tuple
+import hashlib
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple, Union
 import uuid
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
+from keyword_ranking import CLUSTER_THRESHOLD, HIGH_CONFIDENCE_SCORE, RELAXED_SCORE, KeywordClusters, KeywordPrescreen, TopKResults
+from deadlines import MODEL_CALL_TIMEOUT, CancelWatch, Deadline, DeadlineExceeded, JobCancelled, cancel_key
+from hedging import HEDGE_BUDGET, Hedger
+from model_cascade import KOMBAT_ESCALATION_MARGIN, ModelCascade, cascade_models, cascade_summary, low_confidence, near_threshold
+from profiling import authorize_profile, request_profile
+from request_metrics import RequestMetrics, add_metrics_route
+from fast_json import use_fast_json
+from http_compression import add_compression
+from row_table import RowPromptTemplate, RowTable
+from structured_output import JSON_MODE, KOMBAT_SCHEMA, OutputSchema, OutputValidationError, decode_answer
+from token_usage import TokenBudget, TokenUsage
+from webhooks import WebhookNotifier
+
 
 class FreestyleRequest(BaseModel):
-    data: Dict[str, List[Any]]
-    headers: List[str]
+    # Rows as {row_key: values}; large sheets should use rows/row_keys or csv_data instead
+    data: Dict[str, List[Any]] = {}
+    headers: List[str] = []
+    # Compact alternatives: header-plus-rows arrays, or raw CSV text (header line first unless headers is set)
+    rows: Optional[List[List[Any]]] = None
+    row_keys: Optional[List[str]] = None
+    csv_data: Optional[str] = None
+    # Only these columns (default: all), minus exclude_columns, are sent to the model
+    columns: Optional[List[str]] = None
+    exclude_columns: Optional[List[str]] = None
     prompt: str
+    # JSON Schema (object or string) or "field: description" lines; answers are validated against it
+    output_schema: Optional[Union[Dict[str, Any], str]] = None
+    # Models tried in order (cheapest first); a row moves on when its answer is invalid or
+    # reports confidence_field below min_confidence. Default: MODEL_CASCADE, else gemini-2.5-flash only
+    model_cascade: Optional[List[str]] = None
+    min_confidence: Optional[float] = None
+    confidence_field: str = "confidence"
+    # Duplicate model calls still running after their model's p95 latency, for at most hedge_budget of the calls
+    hedge: bool = False
+    hedge_budget: float = HEDGE_BUDGET
+    # Seconds the whole job may take; each row gets a share of what is left, and rows that run out
+    # (or never start) are reported as failed with error_class DeadlineExceeded
+    deadline_s: Optional[float] = None
     batch_size: int = 10
     enable_google_search: bool = False
     test_mode: bool = False
     mode: Optional[str] = None
     request_id: Optional[str] = None
+    # Skip rows already checkpointed under request_id (continue a crashed run)
+    resume: bool = False
+    # Failed rows are retried after the main pass until this many attempts
+    max_row_attempts: int = 3
+    # Rows per worker shard, and an optional per-request cap on parallel workers
+    chunk_size: int = 250
+    max_workers: Optional[int] = None
+    # Rows with an identical rendered prompt share one model call
+    dedupe: bool = True
+    # Stop starting new model calls once this many tokens / USD are spent; the rest is reported as skipped
+    max_tokens_budget: Optional[int] = None
+    max_cost: Optional[float] = None
+    # Only run dry_run_sample sampled rows and extrapolate tokens and cost to the whole sheet
+    dry_run: bool = False
+    dry_run_sample: int = 20
+    # Answer 202 at once and POST the signed result to callback_url (and per-chunk progress to
+    # progress_callback_url); config.webhook_url only adds a completion POST to the normal response
+    callback_url: Optional[str] = None
+    progress_callback_url: Optional[str] = None
+    callback_secret: Optional[str] = None
+    config: Optional[Dict[str, Any]] = None
+    # Profile mode for the coordinator and workers; set by /process from ?profile= once the
+    # X-Profile-Token checks out (a value sent in the body is ignored)
+    profile: Optional[str] = None
 
 
 class KeywordKombatRequest(BaseModel):
@@ -29,6 +93,31 @@ class KeywordKombatRequest(BaseModel):
     test_mode: bool = False
     mode: Optional[str] = None
     request_id: Optional[str] = None
+    max_tokens_budget: Optional[int] = None
+    max_cost: Optional[float] = None
+    # Ranked mode: keep the best top_k keywords scoring at least min_score (instead of the >=80 filter)
+    top_k: Optional[int] = None
+    min_score: Optional[int] = None
+    # Ranked mode: stop scoring once top_k keywords score >= 80 (likely winners are scored first)
+    early_stop: bool = False
+    # Stream results as NDJSON while keywords are being scored
+    stream: bool = False
+    # Opt-in: near-duplicate keywords ("crm-software kaufen", "software crm kaufen") share one
+    # model call, whose score is copied to every member (listed under "Cluster")
+    cluster_keywords: bool = False
+    cluster_threshold: float = CLUSTER_THRESHOLD
+    # Models tried in order; a keyword moves on when its answer is invalid or scores within
+    # escalation_margin of the filter threshold (min_score, else 80)
+    model_cascade: Optional[List[str]] = None
+    escalation_margin: int = KOMBAT_ESCALATION_MARGIN
+    hedge: bool = False
+    hedge_budget: float = HEDGE_BUDGET
+    # Seconds the request may take; keywords not started by then are reported as skipped
+    deadline_s: Optional[float] = None
+    callback_url: Optional[str] = None
+    progress_callback_url: Optional[str] = None
+    callback_secret: Optional[str] = None
+    config: Optional[Dict[str, Any]] = None
 
 
 modal_app = modal.App("loop-over-rows")
@@ -38,7 +127,27 @@ image = modal.Image.debian_slim().pip_install([
     "pydantic",
     "google-generativeai",
     "asyncio-throttle",
-])
+    "numpy",
+    "aiohttp",
+    "orjson",
+    "zstandard",
+]).add_local_python_source("keyword_ranking", "request_metrics", "row_table", "token_usage", "webhooks", "fast_json", "http_compression", "structured_output", "model_cascade", "hedging", "deadlines", "profiling")
+
+# Per-row results survive container crashes here, keyed by request_id and row_key
+CHECKPOINT_DIR = "/checkpoints"
+checkpoint_volume = modal.Volume.from_name("loop-over-rows-checkpoints", create_if_missing=True)
+
+# Job status shared by the API container, coordinators and workers
+job_store = modal.Dict.from_name("loop-over-rows-jobs", create_if_missing=True)
+
+# Freestyle worker ceiling and per-request Gemini rate limit (requests/s), split among that request's workers.
+# Concurrent requests each get the full limit; it is not shared across requests or containers.
+FREESTYLE_MAX_WORKERS = int(os.environ.get("FREESTYLE_MAX_WORKERS", "20"))
+FREESTYLE_RATE_LIMIT = float(os.environ.get("FREESTYLE_RATE_LIMIT", "100"))
+
+# Jittered exponential backoff between retry rounds for failed rows (seconds)
+RETRY_BACKOFF_BASE = 2.0
+RETRY_BACKOFF_MAX = 30.0
 
 app = FastAPI(title="Loop Over Rows (Unified)", description="Single endpoint with modes: freestyle, keyword-kombat")
 JOBS: Dict[str, Any] = {}
@@ -49,6 +158,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+add_metrics_route(app)
+use_fast_json(app)
+add_compression(app)
 
 
 @app.get("/")
@@ -57,196 +169,867 @@ async def health():
 
 @app.get("/status/{rid}")
 async def status(rid: str):
-    return JOBS.get(rid, {"status": "unknown"})
+    if rid in JOBS:
+        return JOBS[rid]
+    try:
+        return await job_store.get.aio(rid) or {"status": "unknown"}
+    except Exception:
+        return {"status": "unknown"}
+
+@app.delete("/jobs/{rid}")
+async def cancel_job(rid: str):
+    """
+    Cancel a freestyle job: no further chunks or rows are started and calls in
+    flight are cancelled (workers notice within CANCEL_POLL_INTERVAL seconds).
+    Rows finished so far stay checkpointed and are returned with the job.
+    """
+    job = await job_store.get.aio(rid)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {rid}")
+    if job.get("status") not in ("running", "cancelling"):
+        return {"request_id": rid, "status": job.get("status")}
+    await job_store.put.aio(cancel_key(rid), time.time())
+    await job_store.put.aio(rid, {**job, "status": "cancelling"})
+    print(f"[freestyle] cancel_requested request_id={rid}")
+    return {"request_id": rid, "status": "cancelling"}
 
 
 class ProcessingResponse(BaseModel):
     results: Any
     processing_time: float
     items_processed: int
+    # Only with ?timings=true: per-stage timings and counters for this request
+    timings: Optional[Dict[str, Any]] = None
+    # Tokens and cost of the model calls, and keywords not scored (budget reached, early stop or deadline)
+    usage: Optional[Dict[str, Any]] = None
+    skipped_keywords: Optional[List[str]] = None
+    stopped_early: Optional[bool] = None
+    # Model calls avoided by scoring one keyword per near-duplicate cluster
+    calls_saved: Optional[int] = None
+    # Per-tier calls, escalations and latency when a model cascade ran
+    cascade: Optional[Dict[str, Any]] = None
+
+
+def load_row_table(request: FreestyleRequest) -> RowTable:
+    """The request's sheet as a RowTable, whichever ingestion format was used"""
+    if request.csv_data is not None:
+        return RowTable.from_csv(request.csv_data, request.headers)
+    if request.rows is not None:
+        if request.row_keys is not None and len(request.row_keys) != len(request.rows):
+            raise ValueError("row_keys must have one key per row")
+        return RowTable.from_rows(request.headers, iter(request.rows), request.row_keys)
+    return RowTable.from_mapping(request.headers, request.data)
+
+
+def compile_row_template(request: FreestyleRequest, table: RowTable, schema: Optional[OutputSchema] = None) -> RowPromptTemplate:
+    search_hint = "\nIf helpful and allowed, enrich using public web search; still return strict JSON only." if request.enable_google_search else ""
+    schema_hint = schema.prompt_hint if schema else ""
+    return RowPromptTemplate(table.headers, request.prompt, request.columns, request.exclude_columns, search_hint + schema_hint)
+
+
+class RowCheckpoint:
+    """
+    Append-only JSONL checkpoints of finished rows for one request on the
+    checkpoint Volume. Each worker writes its own part file, so concurrent
+    containers never write to the same file.
+    """
+
+    def __init__(self, request_id: str, part: str = "main", directory: Optional[str] = None):
+        self.directory = os.path.join(directory or CHECKPOINT_DIR, re.sub(r"[^A-Za-z0-9_.-]", "_", request_id))
+        self.path = os.path.join(self.directory, re.sub(r"[^A-Za-z0-9_.-]", "_", part) + ".jsonl")
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """row_key → result for every row completed by earlier attempts"""
+        done: Dict[str, Dict[str, Any]] = {}
+        if not os.path.isdir(self.directory):
+            return done
+        for name in sorted(os.listdir(self.directory)):
+            with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn last line from a crash mid-write
+                    done[entry["row_key"]] = entry["result"]
+        return done
+
+    def reset(self):
+        """Delete every part file of the request (commit the Volume afterwards to make it stick)"""
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+
+    def append(self, row_key: str, result: Dict[str, Any]):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"row_key": row_key, "result": result}) + "\n")
+
+
+async def update_job(rid: str, **fields):
+    """Merge fields into the job status, locally and in the cross-container job store"""
+    job = JOBS.setdefault(rid, {})
+    job.update(fields)
+    try:
+        # Results go back in the response; the shared store only tracks status and progress
+        await job_store.put.aio(rid, {k: v for k, v in job.items() if k != "results"})
+    except Exception as e:
+        print(f"[freestyle] job_store_error request_id={rid} err={e}")
+
+
+async def cancel_requested(rid: str) -> bool:
+    return bool(await job_store.get.aio(cancel_key(rid)))
+
+
+def unstarted_failure(row_key: str, reason: type) -> Dict[str, Any]:
+    """Failure entry for a row that was never (or not again) sent because the job was cancelled or out of time"""
+    why = "Job was cancelled" if reason is JobCancelled else "Request deadline passed"
+    return {"row_key": row_key, "error_class": reason.__name__, "error": f"{why} before the row finished", "attempts": 0}
 
 
 @modal_app.function(
     image=image,
-    secrets=[modal.Secret.from_name("gemini-api-key")],
+    # "profiling" holds PROFILE_SECRET, which profiled requests must present as X-Profile-Token
+    secrets=[modal.Secret.from_name("gemini-api-key"), modal.Secret.from_name("profiling")],
     timeout=86400,
-    cpu=8,
-    memory=32768,
-    max_containers=1,
+    cpu=2,
+    memory=4096,
+    max_containers=FREESTYLE_MAX_WORKERS,
+    volumes={CHECKPOINT_DIR: checkpoint_volume},
 )
-async def process_rows_freestyle(request: FreestyleRequest) -> Dict[str, Any]:
-    """Process freestyle mode using Gemini per row."""
+async def process_rows_chunk(request: FreestyleRequest, part: str, rate_limit: float, deadline_at: Optional[float] = None) -> Dict[str, Any]:
+    """Worker: run_rows_chunk, profiled when the request asks for it (the profile comes back under "profiles")"""
+    async with request_profile(request.profile, f"worker {part}") as profiler:
+        out = await run_rows_chunk(request, part, rate_limit, deadline_at)
+    if profiler:
+        out["profiles"] = [profiler.artifact()]
+    return out
+
+
+async def run_rows_chunk(request: FreestyleRequest, part: str, rate_limit: float, deadline_at: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Run one shard of a freestyle sheet with Gemini, checkpointing each row.
+    Rows share what is left until deadline_at, and the shard stops early when
+    its job is cancelled; unfinished rows come back as failures saying why.
+    """
     import google.generativeai as genai
     import os
     from asyncio_throttle import Throttler
 
     genai.configure(api_key=os.environ["GEMINI_API_KEY"])
-    model = genai.GenerativeModel('models/gemini-2.5-flash')
-    # Allow high concurrency within a single powerful container
-    throttler = Throttler(rate_limit=100, period=1.0)
-    rid = request.request_id or str(uuid.uuid4())
-    start_ts = time.time()
-    print(f"[freestyle] start request_id={rid} rows={len(request.data)} batch_size={request.batch_size}")
-    # status store (in-memory best-effort)
-    JOBS[rid] = {"status": "running", "progress": 0, "results": None, "started_at": start_ts}
+    # This worker's share of its request's rate limit
+    throttler = Throttler(rate_limit=max(1, int(rate_limit)), period=1.0)
+    rid = request.request_id
+    metrics = RequestMetrics("freestyle")
+    hedger = Hedger(metrics, request.hedge_budget) if request.hedge else None
+    cascade = ModelCascade(request.model_cascade, genai.GenerativeModel, metrics, hedger)
+    chunk_started = time.perf_counter()
+    table = load_row_table(request)
+    # Compiled once per container and schema
+    schema = OutputSchema.parse(request.output_schema)
+    generation_config = schema.generation_config if schema else JSON_MODE
+    template = compile_row_template(request, table, schema)
+    checkpoint = RowCheckpoint(rid, part)
+    done: Dict[str, Dict[str, Any]] = {}
+    # row_key → latest failure; rows leave it once a retry succeeds
+    failures: Dict[str, Dict[str, Any]] = {}
+    # This worker's share of the request budget (the coordinator hands it out per chunk)
+    budget = TokenBudget(request.max_tokens_budget, request.max_cost)
+    usage = TokenUsage()
+    row_usage: Dict[str, Dict[str, int]] = {}
+    skipped: List[str] = []
+    deadline = Deadline(deadline_at)
 
-    async def run_row(row_key: str, row_values: List[Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    async def ask(row_key: str, tier: int, prompt: str, row_deadline: Deadline, first: bool = False) -> Optional[Tuple[Any, Any, List[str]]]:
+        """
+        One model call on a cascade tier: (response, decoded answer, validation
+        errors). A row's first call is not started (None) once the budget is spent;
+        every call is capped at MODEL_CALL_TIMEOUT and what is left of the row's time.
+        """
+        queued = time.perf_counter()
+        async with throttler:
+            if first:
+                metrics.observe("rate_limit_wait", time.perf_counter() - queued)
+                if budget and budget.exhausted(usage):
+                    # Calls already in flight still finish
+                    return None
+            timeout = row_deadline.timeout(MODEL_CALL_TIMEOUT)
+            metrics.count("calls")
+            with metrics.stage("model"):
+                resp = await cascade.agenerate(tier, prompt, timeout, generation_config=generation_config)
+        metrics.count_usage(resp)
+        prompt_tokens, output_tokens = usage.add_response(resp, cascade.models[tier])
+        tokens = row_usage.setdefault(row_key, {"prompt_tokens": 0, "output_tokens": 0})
+        tokens["prompt_tokens"] += prompt_tokens
+        tokens["output_tokens"] += output_tokens
+        with metrics.stage("parse"):
+            obj, errors = decode_answer(resp.text, schema)
+        return resp, obj, errors
+
+    def escalation_reason(obj: Any, errors: List[str]) -> Optional[str]:
+        if errors:
+            return "invalid"
+        if low_confidence(obj, request.confidence_field, request.min_confidence):
+            return "low_confidence"
+        return None
+
+    async def run_row(i: int, attempt: int = 1, row_budget: Optional[float] = None) -> Optional[Tuple[str, Dict[str, Any]]]:
+        row_key = table.key(i)
         try:
             row_start = time.time()
+            # Rows queue on the throttler, so a row may start late in its batch
+            row_deadline = Deadline(min(row_start + row_budget, deadline.at)) if row_budget else deadline
+            if attempt == 1:
+                metrics.observe("queue_wait", time.perf_counter() - chunk_started)
+            else:
+                metrics.count("retries")
             print(f"[freestyle] row_start request_id={rid} row_key={row_key}")
-            row_dict = {h: v for h, v in zip(request.headers, row_values)}
-            search_hint = "\nIf helpful and allowed, enrich using public web search; still return strict JSON only." if request.enable_google_search else ""
-            prompt = f"Row: {json.dumps(row_dict)}\n\nInstructions: {request.prompt}{search_hint}\n\nReturn strict JSON only."
-            async with throttler:
-                resp = model.generate_content(prompt)
-            txt = (resp.text or "{}").strip()
-            if "```" in txt:
-                try:
-                    txt = txt.split("```json")[1].split("```")[0]
-                except Exception:
-                    try:
-                        txt = txt.split("```")[1].split("```")[0]
-                    except Exception:
-                        pass
-            obj = json.loads(txt)
+            # The row is rendered from the columns only now, when its turn comes
+            prompt = template.render(table, i)
+            tier = 0
+            answer = await ask(row_key, tier, prompt, row_deadline, first=True)
+            if answer is None:
+                # Out of budget: the row is not started
+                if attempt == 1:
+                    skipped.append(row_key)
+                return None
+            resp, obj, errors = answer
+            # Cascade: invalid or low-confidence answers go to the next (stronger) model
+            while cascade.escalate(tier, escalation_reason(obj, errors)):
+                tier += 1
+                resp, obj, errors = await ask(row_key, tier, prompt, row_deadline)
+            if errors:
+                # One targeted repair: the model sees its answer and what is wrong with it
+                metrics.count("repairs")
+                print(f"[freestyle] row_repair request_id={rid} row_key={row_key} errors={errors[:3]}")
+                resp, obj, errors = await ask(row_key, tier, OutputSchema.repair_prompt(prompt, resp.text, errors), row_deadline)
+                if errors:
+                    metrics.count("repair_failures")
+                    raise OutputValidationError(f"Invalid model output after repair: {'; '.join(errors[:3])}")
+            cascade.resolved(tier)
             if not isinstance(obj, dict):
                 obj = {"output": obj}
-            print(f"[freestyle] row_done request_id={rid} row_key={row_key} ms={(time.time()-row_start)*1000:.0f}")
+            with metrics.stage("checkpoint"):
+                checkpoint.append(row_key, obj)
+            done[row_key] = obj
+            failures.pop(row_key, None)
+            print(f"[freestyle] row_done request_id={rid} row_key={row_key} attempt={attempt} ms={(time.time()-row_start)*1000:.0f}")
             return row_key, obj
-        except Exception:
-            print(f"[freestyle] row_error request_id={rid} row_key={row_key}")
+        except Exception as e:
+            metrics.count("deadline_exceeded" if isinstance(e, DeadlineExceeded) else "errors")
+            failures[row_key] = {"row_key": row_key, "error_class": type(e).__name__, "error": str(e)[:500], "attempts": attempt}
+            print(f"[freestyle] row_error request_id={rid} row_key={row_key} attempt={attempt} err={type(e).__name__}")
             return None
 
-    items = list(request.data.items())
-    results: List[Dict[str, Any]] = []
     # Use a larger effective batch size for in-container concurrency
     effective_batch = 10 if request.test_mode else 100
-    for i in range(0, len(items), effective_batch):
-        batch = items[i:i+effective_batch]
-        print(f"[freestyle] batch_start request_id={rid} batch_index={i//effective_batch} size={len(batch)}", flush=True)
-        outs = await asyncio.gather(*[run_row(k, v) for k, v in batch], return_exceptions=True)
-        # Normalize exceptions to None and log
-        normalized_outs = []
-        for item in outs:
-            if isinstance(item, Exception):
-                print(f"[freestyle] row_exception request_id={rid} err={item}")
-                continue
-            normalized_outs.append(item)
-        for out in normalized_outs:
-            if out is None:
+    async with CancelWatch(lambda: cancel_requested(rid)) as watch:
+        for i in range(0, len(table), effective_batch):
+            if budget and budget.exhausted(usage):
+                skipped.extend(table.key(j) for j in range(i, len(table)))
+                print(f"[freestyle] budget_exhausted request_id={rid} part={part} skipped={len(skipped)} tokens={usage.total_tokens} cost={usage.cost:.4f}", flush=True)
+                break
+            batch = range(i, min(i + effective_batch, len(table)))
+            try:
+                # The batch's rows split what is left of the deadline with the batches after them
+                row_budget = deadline.share(len(table) - i, effective_batch)
+                print(f"[freestyle] batch_start request_id={rid} part={part} batch_index={i//effective_batch} size={len(batch)}", flush=True)
+                outs = await watch.guard(asyncio.gather(*[run_row(j, row_budget=row_budget) for j in batch], return_exceptions=True))
+            except (DeadlineExceeded, JobCancelled) as e:
+                print(f"[freestyle] batch_stopped request_id={rid} part={part} batch_index={i//effective_batch} reason={type(e).__name__}", flush=True)
+                break
+            for item in outs:
+                if isinstance(item, Exception):
+                    print(f"[freestyle] row_exception request_id={rid} err={item}")
+            # Make this batch's checkpoint lines durable before moving on
+            with metrics.stage("checkpoint_commit"):
+                await checkpoint_volume.commit.aio()
+            print(f"[freestyle] batch_done request_id={rid} part={part} batch_index={i//effective_batch} processed={len(done)}", flush=True)
+
+        # Retry stage: failed rows go round again at lower concurrency, after the main pass
+        retry_concurrency = max(1, effective_batch // 4)
+        retry_slots = asyncio.Semaphore(retry_concurrency)
+
+        async def retry_row(i: int, attempt: int, row_budget: Optional[float]) -> Optional[Tuple[str, Dict[str, Any]]]:
+            async with retry_slots:
+                backoff = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** (attempt - 2))
+                await asyncio.sleep(backoff * random.uniform(0.5, 1.5))
+                return await run_row(i, attempt, row_budget)
+
+        index_of = {table.key(i): i for i in range(len(table))} if failures else {}
+        for attempt in range(2, max(1, request.max_row_attempts) + 1):
+            # Answers that failed validation already had their repair call
+            retry_keys = [k for k, f in failures.items() if f["error_class"] != OutputValidationError.__name__]
+            if not retry_keys or (budget and budget.exhausted(usage)) or watch.cancelled or deadline.expired():
+                break
+            print(f"[freestyle] retry_start request_id={rid} part={part} attempt={attempt} rows={len(retry_keys)}", flush=True)
+            try:
+                row_budget = deadline.share(len(retry_keys), retry_concurrency)
+                await watch.guard(asyncio.gather(*[retry_row(index_of[k], attempt, row_budget) for k in retry_keys]))
+            except (DeadlineExceeded, JobCancelled):
+                break
+            finally:
+                await checkpoint_volume.commit.aio()
+
+    if watch.cancelled or deadline.expired():
+        # Rows cut off mid-call or never started; a resume picks them up from the checkpoints
+        reason = JobCancelled if watch.cancelled else DeadlineExceeded
+        for j in range(len(table)):
+            k = table.key(j)
+            if k not in done and k not in failures and k not in skipped:
+                failures[k] = unstarted_failure(k, reason)
+        await checkpoint_volume.commit.aio()
+        print(f"[freestyle] chunk_stopped request_id={rid} part={part} reason={reason.__name__} processed={len(done)} unfinished={len(failures)}", flush=True)
+
+    metrics.count("budget_skipped", len(skipped))
+    return {
+        "results": done,
+        "failures": failures,
+        "skipped": skipped,
+        "usage": usage.to_dict(),
+        "row_usage": row_usage,
+        "cancelled": watch.cancelled,
+        "metrics": metrics.to_dict(),
+    }
+
+
+async def estimate_freestyle(request: FreestyleRequest, table: RowTable, template: RowPromptTemplate, pending: List[int], rid: str) -> Dict[str, Any]:
+    """
+    Dry run: send a seeded random sample of the pending (unique) rows to the
+    model and extrapolate tokens and cost to all of them. Prompt tokens scale
+    with each row's rendered prompt length; output tokens with the sample mean.
+    """
+    sample_size = min(max(1, request.dry_run_sample), len(pending))
+    sample = sorted(random.Random(rid).sample(pending, sample_size))
+    sample_rid = f"{rid}.dry-run"
+    sample_request = request.model_copy(update={
+        "data": {}, "csv_data": None, **table.take(sample),
+        "request_id": sample_rid, "max_row_attempts": 1, "dry_run": False,
+    })
+    try:
+        out = await run_rows_chunk(sample_request, "sample", FREESTYLE_RATE_LIMIT)
+    finally:
+        # Sample rows are not checkpointed results of the real run
+        RowCheckpoint(sample_rid).reset()
+        await checkpoint_volume.commit.aio()
+
+    measured = [i for i in sample if table.key(i) in out["row_usage"]]
+    estimate: Optional[Dict[str, Any]] = None
+    if measured:
+        sample_chars = sum(len(template.render(table, i)) for i in measured)
+        sample_prompt = sum(out["row_usage"][table.key(i)]["prompt_tokens"] for i in measured)
+        outputs = [out["row_usage"][table.key(i)]["output_tokens"] for i in measured]
+        total_chars = sum(len(template.render(table, i)) for i in pending)
+        prompt_tokens = round(sample_prompt / max(1, sample_chars) * total_chars)
+        mean = sum(outputs) / len(outputs)
+        # ~95% interval of the per-row output mean, scaled to every pending row
+        spread = 1.96 * (sum((o - mean) ** 2 for o in outputs) / max(1, len(outputs) - 1)) ** 0.5 / len(outputs) ** 0.5
+        projected = TokenUsage()
+        projected.add(prompt_tokens, round(mean * len(pending)), calls=len(pending))
+        low, high = TokenUsage(), TokenUsage()
+        low.add(prompt_tokens, round(max(0.0, mean - spread) * len(pending)))
+        high.add(prompt_tokens, round((mean + spread) * len(pending)))
+        estimate = {**projected.to_dict(), "cost_usd_range": [round(low.cost, 6), round(high.cost, 6)]}
+
+    results = [{"row_key": table.key(i), **out["results"][table.key(i)]} for i in sample if table.key(i) in out["results"]]
+    return {
+        "sampled_count": len(sample),
+        "measured_count": len(measured),
+        "sample_usage": out["usage"],
+        "sample_results": results,
+        "sample_failed_rows": list(out["failures"].values()),
+        "estimate": estimate,
+        "metrics": out["metrics"],
+    }
+
+
+async def freestyle_job(request: FreestyleRequest, notifier: WebhookNotifier) -> Dict[str, Any]:
+    """Shard the sheet into row chunks, fan them out to workers and merge in row order."""
+    rid = request.request_id
+    start_ts = time.time()
+    metrics = RequestMetrics("freestyle")
+    with metrics.stage("ingest"):
+        table = load_row_table(request)
+    # Fail fast on unknown column names or a malformed output_schema, before any worker starts
+    template = compile_row_template(request, table, OutputSchema.parse(request.output_schema))
+    total = len(table)
+    print(f"[freestyle] start request_id={rid} rows={total} columns={len(template.columns)}/{len(table.headers)} batch_size={request.batch_size}")
+    deadline = Deadline.after(request.deadline_s)
+    # A cancel marker left by an earlier run under this request_id must not stop this one
+    await job_store.put.aio(cancel_key(rid), False)
+    await update_job(rid, status="running", progress=0, results=None, started_at=start_ts, total_count=total)
+
+    checkpoint = RowCheckpoint(rid)
+    # Part files may have been written by workers in other containers
+    await checkpoint_volume.reload.aio()
+    if request.resume:
+        done = checkpoint.load()
+    else:
+        # Committed, so a later resume=True run under a reused request_id cannot read the old rows
+        checkpoint.reset()
+        await checkpoint_volume.commit.aio()
+        done = {}
+    resumed_count = len(done)
+    if resumed_count:
+        print(f"[freestyle] resume request_id={rid} checkpointed_rows={resumed_count}")
+
+    # Dedupe: every row maps to the first row with the same rendered prompt, and only those are sent
+    first_of: List[int] = list(range(total))
+    dedupe_started = time.perf_counter()
+    if request.dedupe:
+        first_by_prompt: Dict[bytes, int] = {}
+        for i in range(total):
+            digest = hashlib.blake2b(template.render(table, i).encode("utf-8"), digest_size=16).digest()
+            first_of[i] = first_by_prompt.setdefault(digest, i)
+        del first_by_prompt
+    unique_count = sum(1 for i in range(total) if first_of[i] == i)
+    calls_saved = total - unique_count
+    metrics.observe("dedupe", time.perf_counter() - dedupe_started)
+    metrics.count("calls_saved", calls_saved)
+    metrics.count("resumed_rows", resumed_count)
+    pending = [i for i in range(total) if first_of[i] == i and table.key(i) not in done]
+
+    if request.dry_run:
+        print(f"[freestyle] dry_run request_id={rid} pending={len(pending)} sample={request.dry_run_sample}", flush=True)
+        estimate = await estimate_freestyle(request, table, template, pending, rid) if pending else {"sampled_count": 0, "estimate": None}
+        metrics.merge(estimate.pop("metrics", None))
+        await update_job(rid, status="estimated", progress=100, estimate=estimate["estimate"], completed_at=time.time())
+        return {
+            "success": True,
+            "dry_run": True,
+            "total_count": total,
+            "pending_count": len(pending),
+            "resumed_count": resumed_count,
+            "calls_saved": calls_saved,
+            **estimate,
+            "metrics": metrics.to_dict(),
+            "request_id": rid,
+        }
+
+    chunk_size = max(1, request.chunk_size)
+    chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+    workers = max(1, min(len(chunks), request.max_workers or FREESTYLE_MAX_WORKERS, FREESTYLE_MAX_WORKERS))
+    # Workers split this request's rate limit, so adding workers never exceeds it (other requests have their own)
+    worker_rate = FREESTYLE_RATE_LIMIT / workers
+    run_tag = uuid.uuid4().hex[:8]
+    print(f"[freestyle] dispatch request_id={rid} pending={len(pending)} calls_saved={calls_saved} chunks={len(chunks)} workers={workers} worker_rate={worker_rate:.1f}", flush=True)
+
+    def chunk_request(indices: List[int]) -> FreestyleRequest:
+        # Workers get their shard in the compact header-plus-rows form
+        return request.model_copy(update={"data": {}, "csv_data": None, **table.take(indices), "request_id": rid})
+
+    failures: Dict[str, Dict[str, Any]] = {}
+    slots = asyncio.Semaphore(workers)
+    budget = TokenBudget(request.max_tokens_budget, request.max_cost)
+    usage = TokenUsage()
+    row_usage: Dict[str, Dict[str, int]] = {}
+    skipped: set = set()
+    profiles: List[Dict[str, Any]] = []
+    # Budget shares handed to chunks still running, by chunk index
+    reserved: Dict[int, TokenBudget] = {}
+
+    async def run_chunk(index: int, indices: List[int], watch: CancelWatch) -> Dict[str, Any]:
+        part = f"{run_tag}-{index}"
+        queued = time.perf_counter()
+        async with slots:
+            metrics.observe("dispatch_wait", time.perf_counter() - queued)
+            if watch.cancelled or deadline.expired():
+                # Not scheduled any more; running chunks stop on their own
+                reason = JobCancelled if watch.cancelled else DeadlineExceeded
+                return {"results": {}, "failures": {table.key(i): unstarted_failure(table.key(i), reason) for i in indices}, "skipped": []}
+            chunk = chunk_request(indices)
+            if budget:
+                # Each chunk gets an equal slice of what is neither spent nor held by running chunks
+                share = budget.share(usage, reserved.values(), workers - len(reserved))
+                if share.is_empty():
+                    return {"results": {}, "failures": {}, "skipped": [table.key(i) for i in indices]}
+                reserved[index] = share
+                chunk = chunk.model_copy(update={"max_tokens_budget": share.max_tokens, "max_cost": share.max_cost})
+            try:
+                if len(chunks) == 1:
+                    # Small sheets run in the coordinator (and under its profile), without a worker cold start
+                    out = await run_rows_chunk(chunk, part, worker_rate, deadline.at)
+                else:
+                    out = await process_rows_chunk.remote.aio(chunk, part, worker_rate, deadline.at)
+                # Count the spend before the share is released, so the next chunk sees both
+                usage.merge(out.get("usage"))
+                return out
+            finally:
+                reserved.pop(index, None)
+
+    async with CancelWatch(lambda: cancel_requested(rid)) as watch:
+        chunk_tasks = [asyncio.create_task(run_chunk(i, indices, watch)) for i, indices in enumerate(chunks)]
+        for chunks_done, next_chunk in enumerate(asyncio.as_completed(chunk_tasks), start=1):
+            try:
+                out = await next_chunk
+            except Exception as e:
+                print(f"[freestyle] chunk_error request_id={rid} err={e}", flush=True)
                 continue
-            row_key, obj = out
-            results.append({"row_key": row_key, **obj})
-        JOBS[rid]["progress"] = int((len(results) / max(1, len(items))) * 100)
-        print(f"[freestyle] batch_done request_id={rid} batch_index={i//effective_batch} processed={len(results)}", flush=True)
+            done.update(out["results"])
+            failures.update(out["failures"])
+            skipped.update(out.get("skipped", ()))
+            row_usage.update(out.get("row_usage", {}))
+            metrics.merge(out.get("metrics"))
+            profiles.extend(out.get("profiles", ()))
+            progress = int((len(done) / max(1, unique_count)) * 100)
+            await update_job(rid, status="cancelling" if watch.cancelled else "running", progress=progress, processed_count=len(done), chunks_done=chunks_done, chunks_total=len(chunks), usage=usage.to_dict())
+            notifier.progress({
+                "chunks_done": chunks_done,
+                "chunks_total": len(chunks),
+                "progress": progress,
+                "processed_count": len(done),
+                # This chunk's rows as sent; rows sharing their prompt follow in the completion
+                "results": [{"row_key": k, **v} for k, v in out["results"].items()],
+                "failed_rows": list(out["failures"].values()),
+                "usage": usage.to_dict(),
+            })
 
-    print(f"[freestyle] done request_id={rid} total_ms={(time.time()-start_ts)*1000:.0f} processed={len(results)}", flush=True)
-    JOBS[rid].update({"status": "completed", "results": results, "completed_at": time.time(), "progress": 100})
-    return {"success": True, "results": results, "processed_count": len(results), "total_count": len(request.data), "request_id": rid}
+    # Rows of a chunk whose worker died are reported as failed, so they can be resubmitted
+    for k in (table.key(i) for i in pending):
+        if k not in done and k not in failures and k not in skipped:
+            failures[k] = {"row_key": k, "error_class": "WorkerError", "error": "Worker for this row's chunk failed", "attempts": 0}
+
+    # Fan results (and failures) out from each unique prompt to every row that shares it
+    results: List[Dict[str, Any]] = []
+    failed_rows: List[Dict[str, Any]] = []
+    skipped_row_keys: List[str] = []
+    for i in range(total):
+        k = table.key(i)
+        source = k if k in done else table.key(first_of[i])
+        if source in done:
+            results.append({"row_key": k, **done[source]})
+        elif source in failures:
+            failed_rows.append({**failures[source], "row_key": k})
+        elif source in skipped:
+            skipped_row_keys.append(k)
+    failed_row_keys = [f["row_key"] for f in failed_rows]
+    models = cascade_models(request.model_cascade)
+
+    print(f"[freestyle] done request_id={rid} total_ms={(time.time()-start_ts)*1000:.0f} processed={len(results)} failed={len(failed_rows)} skipped={len(skipped_row_keys)} calls_saved={calls_saved} tokens={usage.total_tokens} cost={usage.cost:.4f}", flush=True)
+    await update_job(rid, status="cancelled" if watch.cancelled else "completed", results=results, failed_row_keys=failed_row_keys, skipped_count=len(skipped_row_keys), usage=usage.to_dict(), completed_at=time.time(), progress=100)
+    return {
+        "success": True,
+        "results": results,
+        "processed_count": len(results),
+        "total_count": total,
+        "resumed_count": resumed_count,
+        "calls_saved": calls_saved,
+        "metrics": metrics.to_dict(),
+        "failed_count": len(failed_rows),
+        "failed_rows": failed_rows,
+        "failed_row_keys": failed_row_keys,
+        # Rows never started because max_tokens_budget / max_cost was reached
+        "skipped_count": len(skipped_row_keys),
+        "skipped_row_keys": skipped_row_keys,
+        "budget_exhausted": bool(skipped_row_keys),
+        "usage": usage.to_dict(),
+        # Tokens per row that was sent to the model (rows sharing its prompt cost nothing extra)
+        "row_usage": row_usage,
+        # Per-tier calls, answers kept, escalations and latency when more than one model is configured
+        **({"cascade": cascade_summary(metrics, models)} if len(models) > 1 else {}),
+        # DELETE /jobs/{request_id} stopped the job; unfinished rows are failed with error_class JobCancelled
+        "cancelled": watch.cancelled,
+        # One profile per worker when the request was profiled
+        **({"profiles": profiles} if request.profile else {}),
+        "request_id": rid,
+    }
 
 
 @modal_app.function(
     image=image,
-    secrets=[modal.Secret.from_name("gemini-api-key")],
+    # Small sheets run their single chunk in-process, so the coordinator calls Gemini too;
+    # "webhook-signing" holds WEBHOOK_SIGNING_SECRET for callbacks sent without a callback_secret
+    secrets=[modal.Secret.from_name("gemini-api-key"), modal.Secret.from_name("profiling"), modal.Secret.from_name("webhook-signing")],
     timeout=86400,
     cpu=2,
-    memory=2048,
+    memory=8192,
+    max_containers=10,
+    volumes={CHECKPOINT_DIR: checkpoint_volume},
 )
-async def process_keyword_kombat(req: KeywordKombatRequest) -> List[Dict[str, Any]]:
+async def process_rows_freestyle(request: FreestyleRequest) -> Dict[str, Any]:
+    """Coordinator: shard the sheet into row chunks, fan them out to workers and merge in row order."""
+    rid = request.request_id or str(uuid.uuid4())
+    notifier = WebhookNotifier.from_request("freestyle", request, rid)
+    try:
+        async with request_profile(request.profile, "coordinator") as profiler:
+            out = await freestyle_job(request.model_copy(update={"request_id": rid}), notifier)
+    except Exception as e:
+        await update_job(rid, status="failed", error=str(e), completed_at=time.time())
+        await notifier.complete({"error": str(e), "request_id": rid}, failed=True)
+        raise
+    if profiler:
+        out["profiles"] = [profiler.artifact(), *out.get("profiles", ())]
+    await notifier.complete({k: v for k, v in out.items() if k != "metrics"})
+    return out
+
+
+async def kombat_events(req: KeywordKombatRequest) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Score keywords against the researched company. In ranked mode (top_k or
+    min_score) yields {"event": "result"} as each keyword enters the top-K;
+    always ends with {"event": "done"} carrying the final results.
+    """
     import google.generativeai as genai
     import os
     from asyncio_throttle import Throttler
 
     genai.configure(api_key=os.environ["GEMINI_API_KEY"])
-    model = genai.GenerativeModel('models/gemini-2.5-flash')
     throttler = Throttler(rate_limit=8, period=1.0)
     rid = req.request_id or str(uuid.uuid4())
-    print(f"[kombat] start request_id={rid} keywords={len(req.keywords)}")
+    metrics = RequestMetrics("kombat")
+    hedger = Hedger(metrics, req.hedge_budget) if req.hedge else None
+    cascade = ModelCascade(req.model_cascade, genai.GenerativeModel, metrics, hedger)
+    threshold = req.min_score if req.min_score is not None else HIGH_CONFIDENCE_SCORE
+    budget = TokenBudget(req.max_tokens_budget, req.max_cost)
+    deadline = Deadline.after(req.deadline_s)
+    usage = TokenUsage()
+    skipped: List[str] = []
+    ranked = req.top_k is not None or req.min_score is not None
+    ranking = TopKResults(req.top_k, req.min_score if req.min_score is not None else 0)
+    print(f"[kombat] start request_id={rid} keywords={len(req.keywords)} top_k={req.top_k} min_score={req.min_score} early_stop={req.early_stop}")
 
     research_prompt = f"Analysiere {req.company_url} und gib JSON mit company_name, company_description zurück."
     if req.enable_google_search:
         research_prompt = "Recherchiere im Web: " + research_prompt
-    async with throttler:
-        r = model.generate_content(research_prompt)
-    text = (r.text or "{}").strip()
-    if "```" in text:
-        try:
-            text = text.split("```json")[1].split("```")[0]
-        except Exception:
-            try:
-                text = text.split("```")[1].split("```")[0]
-            except Exception:
-                pass
     try:
-        company = json.loads(text)
-    except Exception:
+        async with throttler:
+            metrics.count("calls")
+            # Once per request, so on the strongest tier
+            with metrics.stage("research"):
+                r = await cascade.agenerate(cascade.last, research_prompt, deadline.timeout(MODEL_CALL_TIMEOUT), generation_config=JSON_MODE)
+        metrics.count_usage(r)
+        usage.add_response(r, cascade.models[cascade.last])
+        company, errors = decode_answer(r.text)
+    except Exception as e:
+        # Keywords can still be scored without the research (slow or failed call, deadline passed)
+        print(f"[kombat] research_failed request_id={rid} err={e}")
+        company, errors = None, [str(e)]
+    if errors or not isinstance(company, dict):
         company = {"company_name": req.company_url}
 
     tpl = f"""INPUT:\nKeyword: "{{{{ keyword }}}}"\n\nSYSTEM:\nDu agierst als deutschsprachiger SEO-Analyst für **{company.get('company_name','')}** – {company.get('company_description','')}.\n\nGib ausschließlich JSON zurück:\n{{\n  \"Keyword\": \"<keyword>\",\n  \"RelevanceScore\": <integer>,\n  \"Rationale\": \"<1–2 Sätze>\"\n}}"""
 
+    async def ask(tier: int, prompt: str, first: bool = False) -> Optional[Tuple[Any, Any, List[str]]]:
+        if first and deadline.expired():
+            # Past the deadline, do not queue for a rate-limit slot just to skip
+            return None
+        queued = time.perf_counter()
+        async with throttler:
+            if first:
+                metrics.observe("rate_limit_wait", time.perf_counter() - queued)
+                if (budget and budget.exhausted(usage)) or (req.early_stop and ranking.satisfied()) or deadline.expired():
+                    return None
+            timeout = deadline.timeout(MODEL_CALL_TIMEOUT)
+            metrics.count("calls")
+            with metrics.stage("model"):
+                resp = await cascade.agenerate(tier, prompt, timeout, generation_config=KOMBAT_SCHEMA.generation_config)
+        metrics.count_usage(resp)
+        usage.add_response(resp, cascade.models[tier])
+        with metrics.stage("parse"):
+            obj, errors = KOMBAT_SCHEMA.decode(resp.text)
+        return resp, obj, errors
+
+    def escalation_reason(obj: Any, errors: List[str]) -> Optional[str]:
+        if errors:
+            return "invalid"
+        # Near the threshold the keep/drop decision hinges on a few points
+        if near_threshold(obj["RelevanceScore"], threshold, req.escalation_margin):
+            return "near_threshold"
+        return None
+
     async def score(kw: str) -> Optional[Dict[str, Any]]:
         try:
-            async with throttler:
-                resp = model.generate_content(tpl.replace("{{ keyword }}", kw))
-            txt = (resp.text or "{}").strip()
-            if "```" in txt:
-                try:
-                    txt = txt.split("```json")[1].split("```")[0]
-                except Exception:
-                    try:
-                        txt = txt.split("```")[1].split("```")[0]
-                    except Exception:
-                        pass
-            obj = json.loads(txt)
-            score = obj.get("RelevanceScore", 0)
-            if isinstance(score, (int, float)):
-                obj["RelevanceScore"] = int(max(10, min(100, score)))
+            prompt = tpl.replace("{{ keyword }}", kw)
+            tier = 0
+            answer = await ask(tier, prompt, first=True)
+            if answer is None:
+                skipped.append(kw)
+                return None
+            resp, obj, errors = answer
+            while cascade.escalate(tier, escalation_reason(obj, errors)):
+                tier += 1
+                resp, obj, errors = await ask(tier, prompt)
+            if errors:
+                metrics.count("repairs")
+                resp, obj, errors = await ask(tier, KOMBAT_SCHEMA.repair_prompt(prompt, resp.text, errors))
+                if errors:
+                    metrics.count("repair_failures")
+                    raise OutputValidationError("; ".join(errors[:3]))
+            cascade.resolved(tier)
+            obj["RelevanceScore"] = int(max(10, min(100, obj["RelevanceScore"])))
             print(f"[kombat] keyword_done request_id={rid} kw={kw} score={obj.get('RelevanceScore')}")
             return obj
-        except Exception:
-            print(f"[kombat] keyword_error request_id={rid} kw={kw}")
+        except Exception as e:
+            metrics.count("errors")
+            print(f"[kombat] keyword_error request_id={rid} kw={kw} err={type(e).__name__}: {str(e)[:200]}")
             return None
 
     kws = req.keywords[:3] if req.test_mode else req.keywords
-    outs = await asyncio.gather(*[score(k) for k in kws])
-    # Prefer high-confidence results
-    results_raw = [o for o in outs if o]
-    results = [o for o in results_raw if o.get("RelevanceScore", 0) >= 80]
-    if not results:
-        if req.test_mode:
-            # Ensure UI has data in test mode
-            return [{"Keyword": kw, "RelevanceScore": 90, "Rationale": "Testmodus: Beispielausgabe für die UI"} for kw in kws]
+    clusters = None
+    if req.cluster_keywords:
+        # Score one representative per near-duplicate cluster and copy its result to the members
+        with metrics.stage("cluster"):
+            clusters = KeywordClusters(kws, threshold=req.cluster_threshold)
+        metrics.count("calls_saved", clusters.calls_saved)
+        print(f"[kombat] clusters request_id={rid} keywords={len(kws)} clusters={len(clusters.clusters)} calls_saved={clusters.calls_saved}")
+    to_score = clusters.representatives if clusters else kws
+    if ranked:
+        # Likely winners first, so the heap fills with strong results early
+        with metrics.stage("prescreen"):
+            to_score = KeywordPrescreen(company).order(to_score)
+
+    async def score_keyword(kw: str):
+        return kw, await score(kw)
+
+    results_raw = []
+    for next_done in asyncio.as_completed([asyncio.create_task(score_keyword(k)) for k in to_score]):
+        kw, scored = await next_done
+        if not scored:
+            continue
+        for out in clusters.expand(kw, scored) if clusters else [scored]:
+            results_raw.append(out)
+            if ranked and ranking.push(out):
+                yield {"event": "result", "result": out}
+    if clusters:
+        skipped = [member for kw in skipped for member in clusters.members(kw)]
+    stopped_early = req.early_stop and ranking.satisfied() and bool(skipped)
+    if ranked:
+        results = ranking.results()
+    else:
+        # Prefer high-confidence results
+        results = [o for o in results_raw if o.get("RelevanceScore", 0) >= HIGH_CONFIDENCE_SCORE]
+    if not results and req.test_mode:
+        # Ensure UI has data in test mode
+        results = [{"Keyword": kw, "RelevanceScore": 90, "Rationale": "Testmodus: Beispielausgabe für die UI"} for kw in kws]
+    elif not results and not ranked:
         # Relax threshold slightly in production if nothing clears 80
-        results = [o for o in results_raw if o.get("RelevanceScore", 0) >= 50]
-    print(f"[kombat] done request_id={rid} items={len(results)}")
-    return results
+        results = [o for o in results_raw if o.get("RelevanceScore", 0) >= RELAXED_SCORE]
+    metrics.count("skipped_keywords", len(skipped))
+    print(f"[kombat] done request_id={rid} items={len(results)} skipped={len(skipped)} stopped_early={stopped_early} tokens={usage.total_tokens} cost={usage.cost:.4f}")
+    calls_saved = clusters.calls_saved if clusters else 0
+    cascade_report = cascade.summary() if len(cascade) > 1 else None
+    yield {"event": "done", "results": results, "usage": usage.to_dict(), "skipped": skipped, "stopped_early": stopped_early, "calls_saved": calls_saved, "cascade": cascade_report, "metrics": metrics.to_dict()}
+
+
+@modal_app.function(
+    image=image,
+    secrets=[modal.Secret.from_name("gemini-api-key"), modal.Secret.from_name("webhook-signing")],
+    timeout=86400,
+    cpu=2,
+    memory=2048,
+)
+async def process_keyword_kombat(req: KeywordKombatRequest) -> Dict[str, Any]:
+    notifier = WebhookNotifier.from_request("keyword-kombat", req)
+    req = req.model_copy(update={"request_id": notifier.request_id})
+    out: Dict[str, Any] = {}
+    try:
+        async for event in kombat_events(req):
+            if event["event"] == "done":
+                out = event
+            else:
+                notifier.progress({"result": event["result"]})
+    except Exception as e:
+        await notifier.complete({"error": str(e), "request_id": notifier.request_id}, failed=True)
+        raise
+    await notifier.complete({
+        "results": out.get("results", []),
+        "items_processed": len(out.get("results", [])),
+        "usage": out.get("usage"),
+        "skipped_keywords": out.get("skipped") or None,
+        "stopped_early": out.get("stopped_early"),
+        "calls_saved": out.get("calls_saved"),
+        "cascade": out.get("cascade"),
+        "request_id": notifier.request_id,
+    })
+    return out
 
 
-@modal_app.function(image=image, timeout=86400, memory=1024, min_containers=0)
+@modal_app.function(
+    image=image,
+    secrets=[modal.Secret.from_name("gemini-api-key")],
+    timeout=86400,
+    cpu=2,
+    memory=2048,
+)
+async def stream_keyword_kombat(req: KeywordKombatRequest) -> AsyncIterator[Dict[str, Any]]:
+    """Generator variant of process_keyword_kombat for NDJSON streaming"""
+    async for event in kombat_events(req):
+        yield event
+
+
+@modal_app.function(image=image, secrets=[modal.Secret.from_name("profiling"), modal.Secret.from_name("webhook-signing")], timeout=86400, memory=1024, min_containers=0)
 @modal.asgi_app()
 def fastapi_app():
     return app
 
 
+async def kombat_ndjson(req: KeywordKombatRequest, metrics: RequestMetrics) -> AsyncIterator[str]:
+    """One NDJSON line per keyword entering the top-K, then the final summary line"""
+    status = "error"
+    try:
+        async for event in stream_keyword_kombat.remote_gen.aio(req):
+            if event["event"] == "done":
+                metrics.merge(event.pop("metrics", None))
+                event["items_processed"] = len(event["results"])
+            yield json.dumps(event) + "\n"
+        status = "ok"
+    finally:
+        metrics.finish(status)
+
+
 @app.post("/process")
-async def process_unified(body: Dict[str, Any]):
+async def process_unified(body: Dict[str, Any], timings: bool = False, profile: Optional[str] = None, x_profile_token: Optional[str] = Header(None)):
     start = time.time()
+    metrics = RequestMetrics("loop-over-rows")
     print(f"[fastapi_app] /process received; body keys={list(body.keys())}")
     mode = (body.get("mode") or "freestyle").strip()
+    # Freestyle only: ?profile=cprofile|sample with a valid X-Profile-Token
+    profile_mode = authorize_profile(profile, x_profile_token)
     try:
         if mode == "keyword-kombat":
             req = KeywordKombatRequest(**body)
+            if req.stream:
+                return StreamingResponse(kombat_ndjson(req, metrics), media_type="application/x-ndjson")
+            notifier = WebhookNotifier.from_request("keyword-kombat", req)
+            if notifier.asynchronous:
+                # The result goes to callback_url; the caller only gets the request_id
+                await process_keyword_kombat.spawn.aio(req.model_copy(update={"request_id": notifier.request_id}))
+                return metrics.respond(notifier.accepted(), status_code=202)
             print("[fastapi_app] dispatching process_keyword_kombat.remote.aio ...")
-            results = await process_keyword_kombat.remote.aio(req)
+            with metrics.stage("worker"):
+                out = await process_keyword_kombat.remote.aio(req)
+            results = out["results"]
+            metrics.merge(out.get("metrics"))
             print("[fastapi_app] keyword_kombat completed; items=", len(results))
-            return ProcessingResponse(results=results, processing_time=time.time() - start, items_processed=len(results))
+            return metrics.respond(ProcessingResponse.model_construct(
+                results=results,
+                processing_time=time.time() - start,
+                items_processed=len(results),
+                timings=metrics.timings() if timings else None,
+                usage=out.get("usage"),
+                skipped_keywords=out.get("skipped") or None,
+                stopped_early=out.get("stopped_early"),
+                calls_saved=out.get("calls_saved"),
+                cascade=out.get("cascade"),
+            ))
         # freestyle
-        req = FreestyleRequest(**body)
-        print("[fastapi_app] dispatching process_rows_freestyle.remote.aio ...")
-        out = await process_rows_freestyle.remote.aio(req)
+        async with request_profile(profile_mode, "api") as profiler:
+            req = FreestyleRequest(**body).model_copy(update={"profile": profile_mode})
+            notifier = WebhookNotifier.from_request("freestyle", req)
+            if notifier.asynchronous:
+                # Same request_id as /status/{rid}, so callers can poll as well (profiles go to the callback)
+                await process_rows_freestyle.spawn.aio(req.model_copy(update={"request_id": notifier.request_id}))
+                return metrics.respond(notifier.accepted(), status_code=202)
+            print("[fastapi_app] dispatching process_rows_freestyle.remote.aio ...")
+            with metrics.stage("worker"):
+                out = await process_rows_freestyle.remote.aio(req)
+            metrics.merge(out.pop("metrics", None))
+        if profiler:
+            out["profiles"] = [profiler.artifact(), *out.get("profiles", ())]
         print("[fastapi_app] freestyle completed; items=", out.get("processed_count", 0))
         # passthrough existing structure
-        return out
+        if timings:
+            out["timings"] = metrics.timings()
+        return metrics.respond(out)
     except Exception as e:
+        metrics.finish("error")
         raise HTTPException(status_code=500, detail=f"Processing failed: {e}")
 
@@ -2,23 +2,53 @@ import modal
 import time
 import json
 import asyncio
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
 import requests
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
+from request_metrics import RequestMetrics, add_metrics_route
+from fast_json import dumps, loads, use_fast_json
+from http_compression import add_compression, encode_request
+
 
 class FreestyleRequest(BaseModel):
-    data: Dict[str, List[Any]]
-    headers: List[str]
+    data: Dict[str, List[Any]] = {}
+    headers: List[str] = []
+    rows: Optional[List[List[Any]]] = None
+    row_keys: Optional[List[str]] = None
+    csv_data: Optional[str] = None
+    columns: Optional[List[str]] = None
+    exclude_columns: Optional[List[str]] = None
     prompt: str
+    output_schema: Optional[Union[Dict[str, Any], str]] = None
+    model_cascade: Optional[List[str]] = None
+    min_confidence: Optional[float] = None
+    confidence_field: str = "confidence"
+    hedge: bool = False
+    hedge_budget: Optional[float] = None
+    deadline_s: Optional[float] = None
     batch_size: int = 10
     enable_google_search: bool = False
     test_mode: bool = False
     mode: Optional[str] = None
     request_id: Optional[str] = None
+    resume: bool = False
+    max_row_attempts: int = 3
+    chunk_size: int = 250
+    max_workers: Optional[int] = None
+    dedupe: bool = True
+    max_tokens_budget: Optional[int] = None
+    max_cost: Optional[float] = None
+    dry_run: bool = False
+    dry_run_sample: int = 20
+    callback_url: Optional[str] = None
+    progress_callback_url: Optional[str] = None
+    callback_secret: Optional[str] = None
+    config: Optional[Dict[str, Any]] = None
 
 
 class KeywordKombatRequest(BaseModel):
@@ -28,6 +58,23 @@ class KeywordKombatRequest(BaseModel):
     enable_google_search: bool = False
     test_mode: bool = False
     mode: Optional[str] = None
+    max_tokens_budget: Optional[int] = None
+    max_cost: Optional[float] = None
+    top_k: Optional[int] = None
+    min_score: Optional[int] = None
+    early_stop: bool = False
+    stream: bool = False
+    cluster_keywords: bool = False
+    cluster_threshold: Optional[float] = None
+    model_cascade: Optional[List[str]] = None
+    escalation_margin: Optional[int] = None
+    hedge: bool = False
+    hedge_budget: Optional[float] = None
+    deadline_s: Optional[float] = None
+    callback_url: Optional[str] = None
+    progress_callback_url: Optional[str] = None
+    callback_secret: Optional[str] = None
+    config: Optional[Dict[str, Any]] = None
 
 
 class ProcessResponse(BaseModel):
@@ -43,8 +90,10 @@ image = modal.Image.debian_slim().pip_install([
     "pydantic",
     "requests",
     "google-generativeai",
-    "asyncio-throttle"
-])
+    "asyncio-throttle",
+    "orjson",
+    "zstandard"
+]).add_local_python_source("request_metrics", "fast_json", "http_compression")
 
 app = FastAPI(title="Loop Over Rows - Front& Unified", description="Single endpoint with modes: freestyle, keyword-kombat")
 
@@ -55,6 +104,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+add_metrics_route(app)
+use_fast_json(app)
+add_compression(app)
 
 
 @app.get("/")
@@ -71,8 +123,11 @@ async def health_check():
     max_containers=1,
 )
 @app.post("/process")
-async def process_unified(body: Dict[str, Any]) -> Any:
+async def process_unified(body: Dict[str, Any], timings: bool = False, profile: Optional[str] = None, x_profile_token: Optional[str] = Header(None)) -> Any:
     start = time.time()
+    metrics = RequestMetrics("loop-over-rows-frontand")
+    # Upstream timings are requested too; the proxy's own stages go under timings.proxy
+    upstream_params = {"timings": "true"} if timings else None
     print(f"[unified] /process received; mode={body.get('mode')} keys={list(body.keys())}")
     # Ensure request_id exists and is forwarded downstream
     import uuid as _uuid
@@ -87,20 +142,59 @@ async def process_unified(body: Dict[str, Any]) -> Any:
         # TEMP: proxy to stable Kombat service until internal mode is hardened
         kombat_url = "https://scaile--keyword-kombat-frontand-fastapi-app.modal.run/process"
         try:
-            proxied = requests.post(kombat_url, json={
+            upstream_started = time.perf_counter()
+            # Large bodies go upstream gzip-compressed
+            body_bytes, upstream_headers = encode_request(dumps({
                 "keywords": req.keywords,
                 "company_url": req.company_url,
                 "keyword_variable": req.keyword_variable,
                 "enable_google_search": req.enable_google_search,
                 "test_mode": req.test_mode,
+                "max_tokens_budget": req.max_tokens_budget,
+                "max_cost": req.max_cost,
+                "top_k": req.top_k,
+                "min_score": req.min_score,
+                "early_stop": req.early_stop,
+                "stream": req.stream,
+                "cluster_keywords": req.cluster_keywords,
+                # Upstream default unless the caller tunes it
+                **({"cluster_threshold": req.cluster_threshold} if req.cluster_threshold is not None else {}),
+                "model_cascade": req.model_cascade,
+                **({"escalation_margin": req.escalation_margin} if req.escalation_margin is not None else {}),
+                "hedge": req.hedge,
+                **({"hedge_budget": req.hedge_budget} if req.hedge_budget is not None else {}),
+                "deadline_s": req.deadline_s,
+                "callback_url": req.callback_url,
+                "progress_callback_url": req.progress_callback_url,
+                "callback_secret": req.callback_secret,
+                "config": req.config,
                 "request_id": rid,
-            }, timeout=3600)
-            if proxied.status_code != 200:
+            }))
+            proxied = requests.post(kombat_url, params=upstream_params, data=body_bytes, headers=upstream_headers, timeout=3600, stream=req.stream)
+            if req.stream and proxied.status_code == 200:
+                # Relay the upstream NDJSON lines as they arrive
+                def relay():
+                    try:
+                        for line in proxied.iter_lines():
+                            if line:
+                                yield line + b"\n"
+                    finally:
+                        proxied.close()
+                        metrics.observe("upstream", time.perf_counter() - upstream_started)
+                        metrics.finish()
+                return StreamingResponse(relay(), media_type="application/x-ndjson")
+            metrics.observe("upstream", time.perf_counter() - upstream_started)
+            # 202 when the upstream accepted a callback_url job
+            if proxied.status_code not in (200, 202):
                 raise HTTPException(status_code=proxied.status_code, detail=f"Kombat upstream error: {proxied.text}")
-            out = proxied.json()
+            with metrics.stage("parse"):
+                out = loads(proxied.content)
             print(f"[unified] kombat proxy ok; items={len(out) if isinstance(out, list) else 'n/a'}")
-            return out
+            if timings and isinstance(out, dict):
+                out.setdefault("timings", {})["proxy"] = metrics.timings()
+            return metrics.respond(out, status_code=proxied.status_code)
         except Exception as e:
+            metrics.finish("error")
             raise HTTPException(status_code=500, detail=f"Keyword Kombat processing failed: {e}")
 
     # Default: freestyle → proxy to existing Loop Over Rows engine (single backend endpoint)
@@ -111,20 +205,57 @@ async def process_unified(body: Dict[str, Any]) -> Any:
 
     proxy_url = "https://scaile--loop-over-rows-fastapi-app.modal.run/process"
     try:
-        resp = requests.post(proxy_url, json={
+        upstream_started = time.perf_counter()
+        # Sheets go upstream gzip-compressed
+        body_bytes, upstream_headers = encode_request(dumps({
             "data": req.data,
             "headers": req.headers,
+            "rows": req.rows,
+            "row_keys": req.row_keys,
+            "csv_data": req.csv_data,
+            "columns": req.columns,
+            "exclude_columns": req.exclude_columns,
             "prompt": req.prompt,
+            "output_schema": req.output_schema,
+            "model_cascade": req.model_cascade,
+            "min_confidence": req.min_confidence,
+            "confidence_field": req.confidence_field,
+            "hedge": req.hedge,
+            **({"hedge_budget": req.hedge_budget} if req.hedge_budget is not None else {}),
+            "deadline_s": req.deadline_s,
             "batch_size": req.batch_size,
             "enable_google_search": req.enable_google_search,
             "request_id": rid,
-        }, timeout=3600)
-        if resp.status_code != 200:
+            "resume": req.resume,
+            "max_row_attempts": req.max_row_attempts,
+            "chunk_size": req.chunk_size,
+            "max_workers": req.max_workers,
+            "dedupe": req.dedupe,
+            "max_tokens_budget": req.max_tokens_budget,
+            "max_cost": req.max_cost,
+            "dry_run": req.dry_run,
+            "dry_run_sample": req.dry_run_sample,
+            "callback_url": req.callback_url,
+            "progress_callback_url": req.progress_callback_url,
+            "callback_secret": req.callback_secret,
+            "config": req.config,
+        }))
+        if profile:
+            # Checked and run upstream; the profiles come back in its response
+            upstream_params = {**(upstream_params or {}), "profile": profile}
+            upstream_headers["X-Profile-Token"] = x_profile_token or ""
+        resp = requests.post(proxy_url, params=upstream_params, data=body_bytes, headers=upstream_headers, timeout=3600)
+        metrics.observe("upstream", time.perf_counter() - upstream_started)
+        if resp.status_code not in (200, 202):
             raise HTTPException(status_code=resp.status_code, detail=f"Upstream error: {resp.text}")
-        out = resp.json()
+        with metrics.stage("parse"):
+            out = loads(resp.content)
         print(f"[unified] freestyle proxy ok; keys={list(out.keys())}")
-        return out
+        if timings:
+            out.setdefault("timings", {})["proxy"] = metrics.timings()
+        return metrics.respond(out, status_code=resp.status_code)
     except Exception as e:
+        metrics.finish("error")
         raise HTTPException(status_code=500, detail=f"Freestyle processing failed: {e}")
 
 
@@ -0,0 +1,144 @@
+"""
+🪜 Model Cascade - cheap model first, a stronger one only when it matters
+A cascade is an ordered list of Gemini models (e.g. flash-lite, then flash).
+Every row or keyword starts on the first tier and moves to the next only
+when the answer fails validation, reports low confidence, or (Kombat) lands
+so close to the 80-point filter that the keep/drop decision is unreliable.
+Calls and latency are recorded per tier in the request's RequestMetrics.
+The model factory is injected, so fake models can stand in for tests.
+Calls are asynchronous (generate_content_async), so concurrent rows overlap
+and a cancelled job stops waiting at once; with a Hedger slow calls are
+hedged. A timeout is passed to the SDK and enforced by cancelling the call.
+"""
+
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from deadlines import within
+from hedging import Hedger
+from request_metrics import RequestMetrics
+from token_usage import DEFAULT_MODEL
+
+# Default cascade for requests that do not set model_cascade, e.g.
+# "models/gemini-2.5-flash-lite,models/gemini-2.5-flash" (empty: DEFAULT_MODEL only)
+MODEL_CASCADE = [m.strip() for m in os.environ.get("MODEL_CASCADE", "").split(",") if m.strip()]
+
+# Kombat scores within this many points of the filter threshold are escalated
+KOMBAT_ESCALATION_MARGIN = 5
+
+ESCALATION_REASONS = ("invalid", "low_confidence", "near_threshold")
+
+
+def cascade_models(models: Optional[Sequence[str]] = None) -> List[str]:
+    """A request's tiers: its own list, else MODEL_CASCADE, else DEFAULT_MODEL alone"""
+    return list(models or MODEL_CASCADE or [DEFAULT_MODEL])
+
+
+def tier_name(model: str) -> str:
+    return model.rsplit("/", 1)[-1]
+
+
+def low_confidence(result: Any, field: str, minimum: Optional[float]) -> bool:
+    """True when the result reports a confidence below minimum (a missing or non-numeric one never escalates)"""
+    if minimum is None or not isinstance(result, dict):
+        return False
+    value = result.get(field)
+    if isinstance(value, str):
+        value = value.strip().rstrip("%")
+        try:
+            value = float(value)
+        except ValueError:
+            return False
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        return False
+    # Percentages (0-100) against a 0-1 minimum
+    if value > 1 and minimum <= 1:
+        value /= 100
+    return value < minimum
+
+
+def near_threshold(score: Any, threshold: float, margin: float) -> bool:
+    return isinstance(score, (int, float)) and not isinstance(score, bool) and abs(score - threshold) <= margin
+
+
+class ModelCascade:
+    """
+    The tiers of one request. agenerate(tier, ...) calls that tier's model and
+    records it; escalate(tier, reason) says whether to try the next tier and
+    counts the escalation.
+    """
+
+    def __init__(
+        self,
+        models: Optional[Sequence[str]],
+        make_model: Callable[[str], Any],
+        metrics: RequestMetrics,
+        hedger: Optional[Hedger] = None
+    ):
+        self.models = cascade_models(models)
+        self._make_model = make_model
+        self._instances: Dict[int, Any] = {}
+        self.metrics = metrics
+        self.hedger = hedger
+
+    def __len__(self) -> int:
+        return len(self.models)
+
+    @property
+    def last(self) -> int:
+        return len(self.models) - 1
+
+    def model(self, tier: int) -> Any:
+        if tier not in self._instances:
+            self._instances[tier] = self._make_model(self.models[tier])
+        return self._instances[tier]
+
+    async def agenerate(self, tier: int, prompt: Any, timeout: Optional[float] = None, **kwargs) -> Any:
+        """One asynchronous call on the tier, cancelled after timeout and hedged when the cascade has a Hedger"""
+        if timeout is not None:
+            kwargs["request_options"] = {"timeout": timeout}
+        name = tier_name(self.models[tier])
+        self.metrics.count(f"calls:{name}")
+        model = self.model(tier)
+        call = self.hedger.run(name, lambda: model.generate_content_async(prompt, **kwargs)) if self.hedger else model.generate_content_async(prompt, **kwargs)
+        started = time.perf_counter()
+        try:
+            return await within(call, timeout, f"{name} call")
+        finally:
+            self.metrics.observe(f"model:{name}", time.perf_counter() - started)
+
+    def escalate(self, tier: int, reason: Optional[str]) -> bool:
+        if reason is None or tier >= self.last:
+            return False
+        self.metrics.count(f"escalations:{reason}")
+        self.metrics.count(f"escalations:{tier_name(self.models[tier])}")
+        return True
+
+    def resolved(self, tier: int):
+        """Record which tier produced the final answer"""
+        self.metrics.count(f"resolved:{tier_name(self.models[tier])}")
+
+    def summary(self, metrics: Optional[RequestMetrics] = None) -> Dict[str, Any]:
+        """Per-tier calls, answers kept, escalations and latency, from (merged) metrics"""
+        return cascade_summary(metrics or self.metrics, self.models)
+
+
+def cascade_summary(metrics: RequestMetrics, models: Sequence[str]) -> Dict[str, Any]:
+    counters = metrics.counters
+    tiers = []
+    for model in models:
+        name = tier_name(model)
+        histogram = metrics.stages.get(f"model:{name}")
+        tiers.append({
+            "model": model,
+            "calls": int(counters.get(f"calls:{name}", 0)),
+            "resolved": int(counters.get(f"resolved:{name}", 0)),
+            "escalated": int(counters.get(f"escalations:{name}", 0)),
+            "avg_ms": round(histogram.sum_ms / histogram.count, 1) if histogram and histogram.count else None,
+            "max_ms": round(histogram.max_ms, 1) if histogram else None,
+        })
+    return {
+        "tiers": tiers,
+        "escalations": {reason: int(counters[f"escalations:{reason}"]) for reason in ESCALATION_REASONS if counters.get(f"escalations:{reason}")},
+    }
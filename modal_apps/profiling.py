@@ -0,0 +1,197 @@
+"""
+🔬 Request Profiling - opt-in profiles of single production requests
+A request sent with ?profile=cprofile (or ?profile=sample) and an
+X-Profile-Token header matching PROFILE_SECRET is profiled in every
+container it runs in: cProfile (deterministic, per function) or a stack
+sampler (every PROFILE_SAMPLE_INTERVAL, folded stacks for flame graphs),
+plus an event-loop lag probe that shows how long the loop was blocked.
+The artifacts come back with the response under "profiles" (and are logged
+in short). Without a profile mode nothing is started: request_profile()
+hands back a no-op context manager.
+
+Profiles cover the whole container while they run, so requests handled
+alongside show up as well; only one profile runs per container at a time.
+"""
+
+import asyncio
+import base64
+import cProfile
+import hmac
+import marshal
+import math
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException
+
+# Profiling is off unless this is set (requests must send it as X-Profile-Token).
+# The apps mount it from the "profiling" Modal secret: modal secret create profiling PROFILE_SECRET=...
+PROFILE_SECRET = os.environ.get("PROFILE_SECRET", "")
+PROFILE_MODES = ("cprofile", "sample")
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", "0.005"))
+# Functions (cprofile) or stacks (sample) kept in the artifact
+PROFILE_TOP = 40
+# Event-loop lag probe: a sleep of LAG_PROBE_INTERVAL that wakes this much late counts as a stall
+LAG_PROBE_INTERVAL = 0.05
+LAG_STALL_MS = 100
+MAX_STACK_DEPTH = 64
+
+_active: Optional["RequestProfiler"] = None
+
+
+def authorize_profile(mode: Optional[str], token: Optional[str]) -> Optional[str]:
+    """The profile mode a request asked for, once its token checks out (None: no profiling)"""
+    if not mode:
+        return None
+    if mode not in PROFILE_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown profile mode {mode!r}; use one of: {', '.join(PROFILE_MODES)}")
+    if not PROFILE_SECRET or not token or not hmac.compare_digest(token.encode("utf-8"), PROFILE_SECRET.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Profiling needs a valid X-Profile-Token")
+    return mode
+
+
+def request_profile(mode: Optional[str], label: str):
+    """
+    Async context manager profiling the block: a RequestProfiler, or a no-op
+    yielding None when no mode is set or another profile already runs here.
+    """
+    if not mode:
+        return nullcontext()
+    if _active is not None:
+        print(f"[profile] skipped label={label} reason=busy active={_active.label}")
+        return nullcontext()
+    return RequestProfiler(mode, label)
+
+
+def _frame_name(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class RequestProfiler:
+    """One profile (cprofile or sample) plus event-loop lag for the duration of an async with block"""
+
+    def __init__(self, mode: str, label: str):
+        self.mode = mode
+        self.label = label
+        self.lags: List[float] = []
+        self.stacks: Counter = Counter()
+        self._profile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._probe: Optional[asyncio.Task] = None
+        self._probe_due = 0.0
+        self.started = 0.0
+        self.elapsed = 0.0
+
+    async def __aenter__(self) -> "RequestProfiler":
+        global _active
+        _active = self
+        self.started = time.perf_counter()
+        self._probe_due = self.started + LAG_PROBE_INTERVAL
+        self._probe = asyncio.create_task(self._probe_loop())
+        if self.mode == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = threading.Thread(target=self._sample, args=(threading.get_ident(),), daemon=True)
+            self._sampler.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        global _active
+        if self._profile is not None:
+            self._profile.disable()
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+        # A stall right before the end delays the pending probe, which would otherwise go uncounted
+        late = time.perf_counter() - self._probe_due
+        if late > 0:
+            self.lags.append(late)
+        self._probe.cancel()
+        await asyncio.gather(self._probe, return_exceptions=True)
+        self.elapsed = time.perf_counter() - self.started
+        _active = None
+        print(self.log_line())
+
+    async def _probe_loop(self):
+        while True:
+            self._probe_due = time.perf_counter() + LAG_PROBE_INTERVAL
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            self.lags.append(max(0.0, time.perf_counter() - self._probe_due))
+
+    def _sample(self, thread_id: int):
+        """Sampler thread: record the profiled thread's stack (root first) every interval"""
+        while not self._stop.wait(PROFILE_SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def loop_lag(self) -> Dict[str, Any]:
+        """How late the probe woke up: the longest stretches the event loop could not run anything"""
+        ordered = sorted(self.lags)
+
+        def pct(p: float) -> float:
+            return round(ordered[max(1, math.ceil(p / 100 * len(ordered))) - 1] * 1000, 1) if ordered else 0.0
+
+        stalls = [lag for lag in ordered if lag * 1000 >= LAG_STALL_MS]
+        return {
+            "probes": len(ordered),
+            "p50_ms": pct(50),
+            "p99_ms": pct(99),
+            "max_ms": pct(100),
+            "stalls": len(stalls),
+            "stalled_ms": round(sum(stalls) * 1000, 1),
+        }
+
+    def _cprofile_artifact(self) -> Dict[str, Any]:
+        stats = pstats.Stats(self._profile).stats
+        ranked = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:PROFILE_TOP]
+        return {
+            # By time spent in the function itself
+            "top": [
+                {
+                    "function": f"{os.path.basename(filename)}:{line}({name})",
+                    "calls": calls,
+                    "self_ms": round(self_time * 1000, 2),
+                    "cumulative_ms": round(cumulative * 1000, 2),
+                }
+                for (filename, line, name), (_, calls, self_time, cumulative, _) in ranked
+            ],
+            # The full profile: base64-decode to a .prof file for pstats or snakeviz
+            "pstats_b64": base64.b64encode(marshal.dumps(stats)).decode("ascii"),
+        }
+
+    def _sample_artifact(self) -> Dict[str, Any]:
+        samples = sum(self.stacks.values())
+        leaves = Counter()
+        for stack, n in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += n
+        return {
+            "samples": samples,
+            "interval_ms": PROFILE_SAMPLE_INTERVAL * 1000,
+            # By samples with the function on top of the stack
+            "top": [{"function": name, "samples": n, "share": round(n / samples, 4)} for name, n in leaves.most_common(PROFILE_TOP)],
+            # "root;...;leaf count" lines, for flamegraph.pl or speedscope
+            "folded": [f"{stack} {n}" for stack, n in self.stacks.most_common()],
+        }
+
+    def artifact(self) -> Dict[str, Any]:
+        """The profile as a JSON-ready dict (call after the block has ended)"""
+        out = {"label": self.label, "mode": self.mode, "wall_ms": round(self.elapsed * 1000, 1), "loop_lag": self.loop_lag()}
+        out.update(self._cprofile_artifact() if self.mode == "cprofile" else self._sample_artifact())
+        return out
+
+    def log_line(self) -> str:
+        lag = self.loop_lag()
+        return f"[profile] label={self.label} mode={self.mode} wall_ms={self.elapsed * 1000:.0f} loop_lag_max_ms={lag['max_ms']} stalls={lag['stalls']}"
@@ -0,0 +1,200 @@
+"""
+⏱️ Request Metrics - per-stage timers and counters for the Modal apps
+Each request collects stage histograms (queue wait, rate-limiter wait,
+model/backend latency, parse, serialization) and counters (calls, retries,
+cache hits, tokens) in a RequestMetrics. Collectors from other containers
+(e.g. loop-over-rows workers) travel as plain dicts and merge losslessly.
+Finished requests fold into the per-container registry behind /metrics,
+rendered in the Prometheus text format.
+"""
+
+import math
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# Histogram bucket upper bounds, in milliseconds
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 120000, math.inf)
+METRIC_PREFIX = "frontand"
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; bucket counts are per bucket, not cumulative"""
+
+    __slots__ = ("buckets", "count", "sum_ms", "max_ms")
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS_MS)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float):
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.buckets[i] += 1
+                break
+        self.count += 1
+        self.sum_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def merge(self, data: Dict[str, Any]):
+        for i, n in enumerate(data["buckets"]):
+            self.buckets[i] += n
+        self.count += data["count"]
+        self.sum_ms += data["sum_ms"]
+        self.max_ms = max(self.max_ms, data["max_ms"])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"buckets": list(self.buckets), "count": self.count, "sum_ms": self.sum_ms, "max_ms": self.max_ms}
+
+
+class RequestMetrics:
+    """Stage timers and counters for one request (or one worker's share of it)"""
+
+    def __init__(self, app: str, endpoint: str = "process"):
+        self.app = app
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages: Dict[str, Histogram] = {}
+        self.counters: Dict[str, float] = {}
+        self._finished = False
+
+    def observe(self, stage: str, seconds: float):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = Histogram()
+        histogram.observe(seconds * 1000)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time a block (sync or async code) as one observation of a stage"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def count(self, name: str, n: float = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def count_usage(self, response: Any):
+        """Token counters from a Gemini response's usage_metadata, when the SDK reports it"""
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        for field, name in (("prompt_token_count", "prompt_tokens"), ("candidates_token_count", "output_tokens"), ("total_token_count", "tokens")):
+            value = getattr(usage, field, None)
+            if value:
+                self.count(name, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Picklable/JSON form, for returning a worker's metrics to its coordinator"""
+        return {
+            "stages": {name: histogram.to_dict() for name, histogram in self.stages.items()},
+            "counters": dict(self.counters),
+        }
+
+    def merge(self, data: Optional[Dict[str, Any]]):
+        if not data:
+            return
+        for name, histogram in data.get("stages", {}).items():
+            self.stages.setdefault(name, Histogram()).merge(histogram)
+        for name, n in data.get("counters", {}).items():
+            self.count(name, n)
+
+    def timings(self) -> Dict[str, Any]:
+        """Compact per-stage summary for the opt-in timings section of a response"""
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "stages": {
+                name: {
+                    "count": h.count,
+                    "total_ms": round(h.sum_ms, 1),
+                    "avg_ms": round(h.sum_ms / h.count, 1) if h.count else 0.0,
+                    "max_ms": round(h.max_ms, 1),
+                }
+                for name, h in self.stages.items()
+            },
+            "counters": dict(self.counters),
+        }
+
+    def finish(self, status: str = "ok"):
+        """Fold this request into the container's /metrics registry (once)"""
+        if self._finished:
+            return
+        self._finished = True
+        self.observe("total", time.perf_counter() - self.started)
+        REGISTRY.record(self, status)
+
+    def respond(self, payload: Any, status_code: int = 200):
+        """Serialize the response body (orjson, no re-validation) under the 'serialize' stage, then finish the request"""
+        from fastapi.responses import Response
+        from fast_json import dumps
+
+        with self.stage("serialize"):
+            body = dumps(payload)
+        self.finish()
+        return Response(content=body, status_code=status_code, media_type="application/json")
+
+
+class MetricsRegistry:
+    """Process-wide aggregation of finished requests, rendered for Prometheus"""
+
+    def __init__(self):
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+        self.counters: Dict[Tuple[str, str], float] = {}
+        self.requests: Dict[Tuple[str, str, str], int] = {}
+
+    def record(self, metrics: RequestMetrics, status: str = "ok"):
+        for name, histogram in metrics.stages.items():
+            self.histograms.setdefault((metrics.app, name), Histogram()).merge(histogram.to_dict())
+        for name, n in metrics.counters.items():
+            key = (metrics.app, name)
+            self.counters[key] = self.counters.get(key, 0) + n
+        key = (metrics.app, metrics.endpoint, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {METRIC_PREFIX}_requests_total Finished requests by app, endpoint and status.",
+            f"# TYPE {METRIC_PREFIX}_requests_total counter",
+        ]
+        for (app, endpoint, status), n in sorted(self.requests.items()):
+            lines.append(f'{METRIC_PREFIX}_requests_total{{app="{app}",endpoint="{endpoint}",status="{status}"}} {n}')
+
+        lines += [
+            f"# HELP {METRIC_PREFIX}_events_total Per-request counters (calls, retries, cache hits, tokens, ...).",
+            f"# TYPE {METRIC_PREFIX}_events_total counter",
+        ]
+        for (app, name), n in sorted(self.counters.items()):
+            lines.append(f'{METRIC_PREFIX}_events_total{{app="{app}",name="{name}"}} {n:g}')
+
+        lines += [
+            f"# HELP {METRIC_PREFIX}_stage_duration_seconds Time spent per request stage.",
+            f"# TYPE {METRIC_PREFIX}_stage_duration_seconds histogram",
+        ]
+        for (app, stage), histogram in sorted(self.histograms.items()):
+            labels = f'app="{app}",stage="{stage}"'
+            cumulative = 0
+            for bound, n in zip(BUCKETS_MS, histogram.buckets):
+                cumulative += n
+                le = "+Inf" if bound == math.inf else f"{bound / 1000:g}"
+                lines.append(f'{METRIC_PREFIX}_stage_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{METRIC_PREFIX}_stage_duration_seconds_sum{{{labels}}} {histogram.sum_ms / 1000:.6f}")
+            lines.append(f"{METRIC_PREFIX}_stage_duration_seconds_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def add_metrics_route(app):
+    """Expose GET /metrics (Prometheus text format) on a FastAPI app"""
+    from fastapi.responses import PlainTextResponse
+
+    @app.get("/metrics")
+    async def metrics():
+        return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+    return app
@@ -0,0 +1,121 @@
+"""
+🧮 Row Table - compact, column-wise storage for loop-over-rows sheets
+A 100k-row upload is held once, as one list per column with repeated cell
+values shared, and each row's prompt payload is rendered only when the row
+is processed. Sheets arrive as the legacy {row_key: values} mapping, as
+header-plus-rows arrays, or as raw CSV text.
+"""
+
+import csv
+import io
+import json
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+DEFAULT_KEY_PREFIX = "row_"
+
+
+class RowTable:
+    """
+    Sheet rows stored column-wise. Row keys default to row_1..row_n (the
+    frontend's own naming) and are then generated on demand, not stored.
+    """
+
+    __slots__ = ("headers", "columns", "_keys", "_size")
+
+    def __init__(self, headers: List[str], columns: List[List[Any]], keys: Optional[List[str]] = None):
+        self.headers = headers
+        self.columns = columns
+        self._keys = keys
+        self._size = len(keys) if keys is not None else (len(columns[0]) if columns else 0)
+
+    @classmethod
+    def from_rows(cls, headers: Sequence[str], rows: Iterator[Sequence[Any]], keys: Optional[List[str]] = None) -> "RowTable":
+        """Build from row arrays in one streaming pass; rows are padded/truncated to the headers"""
+        headers = list(headers)
+        columns: List[List[Any]] = [[] for _ in headers]
+        # Per-column value pools: CRM exports repeat the same cells (country, industry, owner...)
+        pools: List[Dict[Any, Any]] = [{} for _ in headers]
+        width = len(headers)
+        for row in rows:
+            for c in range(width):
+                value = row[c] if c < len(row) else None
+                if isinstance(value, str):
+                    value = pools[c].setdefault(value, value)
+                columns[c].append(value)
+        return cls(headers, columns, list(keys) if keys is not None else None)
+
+    @classmethod
+    def from_mapping(cls, headers: Sequence[str], data: Dict[str, List[Any]]) -> "RowTable":
+        return cls.from_rows(headers, iter(data.values()), list(data))
+
+    @classmethod
+    def from_csv(cls, text: str, headers: Optional[Sequence[str]] = None) -> "RowTable":
+        """Parse CSV text; the first line is the header row unless headers are given"""
+        reader = csv.reader(io.StringIO(text))
+        if not headers:
+            headers = next(reader, [])
+        return cls.from_rows(headers, (row for row in reader if any(cell.strip() for cell in row)))
+
+    def __len__(self) -> int:
+        return self._size
+
+    def key(self, i: int) -> str:
+        return self._keys[i] if self._keys is not None else f"{DEFAULT_KEY_PREFIX}{i + 1}"
+
+    def keys(self) -> Iterator[str]:
+        return (self.key(i) for i in range(self._size))
+
+    def values(self, i: int) -> List[Any]:
+        return [column[i] for column in self.columns]
+
+    def row(self, i: int) -> Dict[str, Any]:
+        return dict(zip(self.headers, self.values(i)))
+
+    def row_json(self, i: int) -> str:
+        return json.dumps(self.row(i))
+
+    def take(self, indices: Sequence[int]) -> Dict[str, Any]:
+        """Compact request fields (headers/rows/row_keys) for a subset of rows, e.g. one worker shard"""
+        return {
+            "headers": self.headers,
+            "rows": [self.values(i) for i in indices],
+            "row_keys": [self.key(i) for i in indices],
+        }
+
+
+class RowPromptTemplate:
+    """
+    Row-to-prompt template compiled once per request: the selected column
+    indices, their JSON-encoded keys and the text around the row are fixed
+    up front, so rendering a row only encodes its cell values.
+    """
+
+    def __init__(
+        self,
+        headers: Sequence[str],
+        instructions: str,
+        columns: Optional[Sequence[str]] = None,
+        exclude_columns: Optional[Sequence[str]] = None,
+        search_hint: str = ""
+    ):
+        wanted = list(columns) if columns else list(headers)
+        unknown = [c for c in wanted + list(exclude_columns or []) if c not in headers]
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+        excluded = set(exclude_columns or [])
+        # Like dict(zip(headers, values)): a repeated header keeps its first position and its last value
+        last_index = {h: i for i, h in enumerate(headers)}
+        selected = [h for h in dict.fromkeys(wanted) if h not in excluded]
+        self.columns = selected
+        self.indices = [last_index[h] for h in selected]
+        self.keys = [json.dumps(h) + ": " for h in selected]
+        self.suffix = f"\n\nInstructions: {instructions}{search_hint}\n\nReturn strict JSON only."
+
+    def row_json(self, table: RowTable, i: int) -> str:
+        """The selected cells of row i, encoded exactly as json.dumps of the row dict"""
+        dumps = json.dumps
+        columns = table.columns
+        return "{" + ", ".join(key + dumps(columns[c][i]) for key, c in zip(self.keys, self.indices)) + "}"
+
+    def render(self, table: RowTable, i: int) -> str:
+        return "Row: " + self.row_json(table, i) + self.suffix
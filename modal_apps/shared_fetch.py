@@ -0,0 +1,331 @@
+"""
+🕸️ Shared Fetch - page cache shared by the crawl wrappers
+crawl4logo, crawl4imprint and crawl4contacts fetch the same homepages for the
+same lead lists. Pages are cached by normalized URL with a TTL, in-process
+and (inside Modal) in a modal.Dict shared across the apps. Concurrent fetches
+of one URL are coalesced, and robots.txt / per-host politeness is applied.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from urllib.robotparser import RobotFileParser
+
+SHARED_STORE_NAME = "frontand-shared-fetch-cache"
+DEFAULT_TTL = 6 * 3600
+ROBOTS_TTL = 24 * 3600
+MAX_PAGE_BYTES = 2 * 1024 * 1024
+LOCAL_CACHE_ENTRIES = 2048
+USER_AGENT = "Mozilla/5.0 (compatible; FrontandBot/1.0)"
+
+TRACKING_PARAMS = frozenset({
+    "gclid", "dclid", "fbclid", "msclkid", "yclid", "mc_cid", "mc_eid", "_ga", "_gl", "igshid", "ref", "ref_src",
+})
+TRACKING_PREFIXES = ("utm_", "pk_", "hsa_")
+DEFAULT_PORTS = {"http": 80, "https": 443}
+# Client errors that mean "not now" (timeouts, rate limits) rather than "never"; like 5xx they are not cached
+TRANSIENT_STATUSES = frozenset({408, 429})
+
+
+class _LeaderGone(Exception):
+    """The fetch a coalesced caller joined was cancelled along with the caller that started it"""
+
+
+def normalize_url(url: str) -> str:
+    """
+    Cache key for a URL: scheme/host lowercased, default port and fragment
+    dropped, tracking params stripped, remaining params sorted, and the
+    trailing slash removed from non-root paths.
+    """
+    parts = urlsplit(url.strip())
+    scheme = (parts.scheme or "https").lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/") or "/"
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    )
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def is_cacheable(entry: Dict[str, Any]) -> bool:
+    """
+    Pages and permanent client errors (404, 410, ...) are cached; network
+    errors, 5xx, 408/429 and a 403 with Retry-After (bot protection or
+    throttling) are not, so one throttled fetch does not hide a site.
+    """
+    status = entry["status"]
+    if status == 200:
+        return True
+    if not 400 <= status < 500 or status in TRANSIENT_STATUSES:
+        return False
+    return not (status == 403 and entry.get("retry_after"))
+
+
+def origin_of(url: str) -> str:
+    parts = urlsplit(normalize_url(url))
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def shared_store():
+    """The cross-app modal.Dict when running inside Modal, else None"""
+    try:
+        import modal
+
+        if modal.is_local():
+            return None
+        return modal.Dict.from_name(SHARED_STORE_NAME, create_if_missing=True)
+    except Exception as e:
+        print(f"[shared_fetch] shared store unavailable err={e}")
+        return None
+
+
+class HostPoliteness:
+    """Caps concurrent requests and spaces out request starts per host"""
+
+    def __init__(self, max_concurrent: int = 2, min_interval: float = 0.5):
+        self.max_concurrent = max_concurrent
+        self.min_interval = min_interval
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._next_slot: Dict[str, float] = {}
+        self._intervals: Dict[str, float] = {}
+
+    def set_interval(self, host: str, interval: float):
+        """Per-host override, e.g. from a robots.txt Crawl-delay"""
+        self._intervals[host] = max(self.min_interval, interval)
+
+    @asynccontextmanager
+    async def slot(self, host: str):
+        semaphore = self._semaphores.setdefault(host, asyncio.Semaphore(self.max_concurrent))
+        async with semaphore:
+            now = asyncio.get_running_loop().time()
+            start = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = start + self._intervals.get(host, self.min_interval)
+            if start > now:
+                await asyncio.sleep(start - now)
+            yield
+
+
+class SharedFetcher:
+    """
+    Cached, coalesced, polite page fetcher. One instance per container (see
+    get_fetcher) so the local cache and politeness state outlive requests.
+    """
+
+    def __init__(
+        self,
+        ttl: float = DEFAULT_TTL,
+        store: Any = None,
+        politeness: Optional[HostPoliteness] = None,
+        respect_robots: bool = True,
+        max_bytes: int = MAX_PAGE_BYTES,
+        user_agent: str = USER_AGENT
+    ):
+        self.ttl = ttl
+        self.store = store
+        self.politeness = politeness or HostPoliteness()
+        self.respect_robots = respect_robots
+        self.max_bytes = max_bytes
+        self.user_agent = user_agent
+        self._local: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._robots: Dict[str, "asyncio.Future[Optional[RobotFileParser]]"] = {}
+        self.stats = {"hits": 0, "shared_hits": 0, "coalesced": 0, "fetches": 0, "robots_blocked": 0}
+
+    def _remember(self, key: str, entry: Dict[str, Any]):
+        self._local[key] = entry
+        self._local.move_to_end(key)
+        while len(self._local) > LOCAL_CACHE_ENTRIES:
+            self._local.popitem(last=False)
+
+    async def lookup(self, key: str, ttl: float) -> Optional[Dict[str, Any]]:
+        """Cached entry (any dict with a fetched_at timestamp) if fresher than ttl"""
+        entry = self._local.get(key)
+        if entry and time.time() - entry["fetched_at"] < ttl:
+            self._local.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry
+        if self.store is not None:
+            try:
+                entry = await self.store.get.aio(key)
+            except Exception as e:
+                print(f"[shared_fetch] store_get_error key={key} err={e}")
+                entry = None
+            if entry and time.time() - entry["fetched_at"] < ttl:
+                self._remember(key, entry)
+                self.stats["shared_hits"] += 1
+                return entry
+        return None
+
+    async def save(self, key: str, entry: Dict[str, Any]):
+        self._remember(key, entry)
+        if self.store is not None:
+            try:
+                await self.store.put.aio(key, entry)
+            except Exception as e:
+                print(f"[shared_fetch] store_put_error key={key} err={e}")
+
+    async def _robots_for(self, session, url: str) -> Optional[RobotFileParser]:
+        origin = origin_of(url)
+        task = self._robots.get(origin)
+        if task is None:
+            if len(self._robots) >= LOCAL_CACHE_ENTRIES:
+                self._robots.clear()
+            # One robots.txt download per origin, however many pages are requested at once
+            task = asyncio.ensure_future(self._load_robots(session, origin))
+            self._robots[origin] = task
+        return await asyncio.shield(task)
+
+    async def _load_robots(self, session, origin: str) -> Optional[RobotFileParser]:
+        key = f"robots::{origin}"
+        entry = await self.lookup(key, ROBOTS_TTL)
+        if entry is None:
+            entry = await self._download(session, f"{origin}/robots.txt", key, polite=False)
+        if entry["status"] != 200:
+            return None
+        parser = RobotFileParser()
+        parser.parse(entry["body"].decode("utf-8", errors="replace").splitlines())
+        delay = parser.crawl_delay(self.user_agent)
+        if delay:
+            self.politeness.set_interval(urlsplit(origin).netloc, float(delay))
+        return parser
+
+    async def _download(self, session, url: str, key: str, timeout: Optional[float] = None, polite: bool = True) -> Dict[str, Any]:
+        import aiohttp
+
+        entry = {"url": url, "final_url": url, "status": 0, "content_type": "", "body": b"", "fetched_at": time.time(), "error": None, "retry_after": None}
+        request_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else None
+        host = urlsplit(url).netloc.lower()
+        try:
+            if polite:
+                async with self.politeness.slot(host):
+                    await self._read_into(session, url, entry, request_timeout)
+            else:
+                await self._read_into(session, url, entry, request_timeout)
+        except Exception as e:
+            entry["error"] = str(e) or e.__class__.__name__
+        self.stats["fetches"] += 1
+        # Transient failures are not cached, so the next stage can retry them
+        if is_cacheable(entry):
+            await self.save(key, entry)
+        return entry
+
+    async def _read_into(self, session, url: str, entry: Dict[str, Any], request_timeout):
+        kwargs = {"allow_redirects": True, "headers": {"User-Agent": self.user_agent}}
+        if request_timeout:
+            kwargs["timeout"] = request_timeout
+        async with session.get(url, **kwargs) as response:
+            entry["status"] = response.status
+            entry["final_url"] = str(response.url)
+            entry["content_type"] = response.headers.get("Content-Type", "")
+            entry["retry_after"] = response.headers.get("Retry-After")
+            entry["body"] = await response.content.read(self.max_bytes)
+
+    async def fetch(self, session, url: str, timeout: Optional[float] = None, ttl: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Page entry for url (keys: url, final_url, status, content_type, body,
+        fetched_at, error, cached), from cache when fresher than ttl.
+        """
+        key = normalize_url(url)
+        entry = await self.lookup(key, self.ttl if ttl is None else ttl)
+        if entry is not None:
+            return {**entry, "cached": True}
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats["coalesced"] += 1
+            try:
+                return {**await asyncio.shield(inflight), "cached": True}
+            except _LeaderGone:
+                # Another caller's deadline is not ours: fetch it (or join the next flight) ourselves
+                return await self.fetch(session, url, timeout, ttl)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            if self.respect_robots:
+                robots = await self._robots_for(session, key)
+                if robots is not None and not robots.can_fetch(self.user_agent, key):
+                    self.stats["robots_blocked"] += 1
+                    entry = {"url": url, "final_url": url, "status": 0, "content_type": "", "body": b"",
+                             "fetched_at": time.time(), "error": "Disallowed by robots.txt"}
+                    future.set_result(entry)
+                    return {**entry, "cached": False}
+            entry = await self._download(session, url, key, timeout)
+            future.set_result(entry)
+            return {**entry, "cached": False}
+        except asyncio.CancelledError:
+            # Only this caller was cancelled; followers must not inherit its CancelledError
+            future.set_exception(_LeaderGone())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody else may be waiting; don't leave the exception unretrieved
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def fetch_text(self, session, url: str, timeout: Optional[float] = None) -> Optional[str]:
+        """Decoded HTML body, or None if the page is unavailable or not HTML"""
+        entry = await self.fetch(session, url, timeout)
+        if entry["status"] != 200 or "html" not in (entry["content_type"] or "html"):
+            return None
+        return entry["body"].decode("utf-8", errors="replace")
+
+
+_fetcher: Optional[SharedFetcher] = None
+
+
+def get_fetcher() -> SharedFetcher:
+    """Per-container SharedFetcher backed by the cross-app store when available"""
+    global _fetcher
+    if _fetcher is None:
+        _fetcher = SharedFetcher(store=shared_store())
+    return _fetcher
+
+
+if __name__ == "__main__":
+    # Spot check: python modal_apps/shared_fetch.py
+    class _SlowResponse:
+        status = 200
+        url = "https://example.com/"
+        headers = {"Content-Type": "text/html"}
+
+        async def __aenter__(self):
+            await asyncio.sleep(0.2)
+            self.content = self
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def read(self, limit):
+            return b"<html></html>"
+
+    class _Session:
+        def get(self, url, **kwargs):
+            return _SlowResponse()
+
+    async def follower_survives_cancelled_leader() -> bool:
+        fetcher = SharedFetcher(respect_robots=False, politeness=HostPoliteness(min_interval=0))
+        session = _Session()
+        leader = asyncio.create_task(fetcher.fetch(session, "https://example.com/"))
+        await asyncio.sleep(0.05)
+        follower = asyncio.create_task(fetcher.fetch(session, "https://example.com/"))
+        await asyncio.sleep(0.05)
+        leader.cancel()
+        entry = await follower
+        return leader.cancelled() and entry["status"] == 200 and fetcher.stats["coalesced"] == 1
+
+    ok = asyncio.run(follower_survives_cancelled_leader())
+    print("follower survives a cancelled leader:", "ok" if ok else "FAIL")
+    raise SystemExit(0 if ok else 1)
@@ -0,0 +1,254 @@
+"""
+🧾 Structured Output - schema-constrained Gemini answers for freestyle and Kombat
+An output schema (JSON Schema, or the frontend's "field: description" lines)
+is compiled once per process into a validator, and the Gemini-compatible part
+of it is passed to the model as response_schema with JSON mode on. Answers
+are decoded and validated locally; a row whose answer fails gets one repair
+call that quotes the answer and the exact validation errors, instead of being
+dropped or re-run from scratch.
+"""
+
+import json
+import re
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+# JSON mode without a schema: the model still answers with bare, parseable JSON
+JSON_MODE: Dict[str, Any] = {"response_mime_type": "application/json"}
+
+# Schema keys Gemini's response_schema understands; the rest is checked locally only
+MODEL_SCHEMA_KEYS = ("type", "format", "description", "nullable", "enum", "items", "properties", "required")
+
+MAX_REPORTED_ERRORS = 5
+
+_FIELD_LINE_RE = re.compile(r"^\s*[-*]?\s*([A-Za-z_][\w .-]*?)\s*:\s*(.*)$")
+
+Validator = Callable[[Any, str, List[str]], None]
+
+
+class OutputValidationError(ValueError):
+    """A model answer still invalid after its repair call; retrying the row would not help"""
+
+
+def _is_type(value: Any, name: str) -> bool:
+    if name == "string":
+        return isinstance(value, str)
+    if name == "integer":
+        return (isinstance(value, int) and not isinstance(value, bool)) or (isinstance(value, float) and value.is_integer())
+    if name == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if name == "boolean":
+        return isinstance(value, bool)
+    if name == "object":
+        return isinstance(value, dict)
+    if name == "array":
+        return isinstance(value, list)
+    if name == "null":
+        return value is None
+    raise ValueError(f"Unsupported schema type: {name}")
+
+
+def compile_validator(schema: Dict[str, Any]) -> Validator:
+    """
+    Compile a JSON Schema subset (type, nullable, enum, properties, required,
+    additionalProperties, items, minItems/maxItems, minimum/maximum) into
+    nested closures; validate(value, path, errors) appends one message per
+    violation.
+    """
+    if not isinstance(schema, dict):
+        raise ValueError("Schema nodes must be objects")
+    checks: List[Validator] = []
+
+    types = schema.get("type")
+    if types is not None:
+        types = [t.lower() for t in (types if isinstance(types, list) else [types])]
+        if schema.get("nullable"):
+            types.append("null")
+        for t in types:
+            _is_type(None, t)  # rejects unknown type names at compile time
+
+        def check_type(value, path, errors, types=types):
+            if not any(_is_type(value, t) for t in types):
+                errors.append(f"{path}: expected {' or '.join(types)}, got {type(value).__name__}")
+        checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = list(schema["enum"])
+
+        def check_enum(value, path, errors):
+            if value not in allowed:
+                errors.append(f"{path}: must be one of {allowed}")
+        checks.append(check_enum)
+
+    bounds = [(schema[k], k) for k in ("minimum", "maximum") if k in schema]
+    if bounds:
+        def check_bounds(value, path, errors):
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                return
+            for bound, kind in bounds:
+                if (kind == "minimum" and value < bound) or (kind == "maximum" and value > bound):
+                    errors.append(f"{path}: {value} is {'below the minimum' if kind == 'minimum' else 'above the maximum'} {bound}")
+        checks.append(check_bounds)
+
+    properties = {name: compile_validator(sub) for name, sub in (schema.get("properties") or {}).items()}
+    required = list(schema.get("required") or [])
+    closed = schema.get("additionalProperties") is False
+    if properties or required or closed:
+        def check_object(value, path, errors):
+            if not isinstance(value, dict):
+                return
+            for name in required:
+                if name not in value:
+                    errors.append(f"{path}: missing required field '{name}'")
+            for name, item in value.items():
+                if name in properties:
+                    properties[name](item, f"{path}.{name}", errors)
+                elif closed:
+                    errors.append(f"{path}: unexpected field '{name}'")
+        checks.append(check_object)
+
+    items = compile_validator(schema["items"]) if "items" in schema else None
+    min_items, max_items = schema.get("minItems"), schema.get("maxItems")
+    if items or min_items is not None or max_items is not None:
+        def check_array(value, path, errors):
+            if not isinstance(value, list):
+                return
+            if min_items is not None and len(value) < min_items:
+                errors.append(f"{path}: needs at least {min_items} items")
+            if max_items is not None and len(value) > max_items:
+                errors.append(f"{path}: allows at most {max_items} items")
+            if items:
+                for i, item in enumerate(value):
+                    items(item, f"{path}[{i}]", errors)
+        checks.append(check_array)
+
+    def validate(value, path, errors):
+        for check in checks:
+            check(value, path, errors)
+    return validate
+
+
+def model_schema(schema: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The part of the schema Gemini accepts as response_schema, or None if a node has no single type"""
+    node_type = schema.get("type")
+    if not isinstance(node_type, str):
+        return None
+    out = {k: v for k, v in schema.items() if k in MODEL_SCHEMA_KEYS and k not in ("items", "properties")}
+    if "items" in schema:
+        items = model_schema(schema["items"])
+        if items is None:
+            return None
+        out["items"] = items
+    if "properties" in schema:
+        properties = {}
+        for name, sub in schema["properties"].items():
+            properties[name] = model_schema(sub)
+            if properties[name] is None:
+                return None
+        out["properties"] = properties
+    return out
+
+
+def extract_json(text: str) -> Any:
+    """Parse a model answer, tolerating a ```json fence around it"""
+    text = (text or "").strip()
+    if "```" in text:
+        fenced = text.split("```json")[1] if "```json" in text else text.split("```")[1]
+        text = fenced.split("```")[0].strip()
+    return json.loads(text)
+
+
+def schema_from_fields(text: str) -> Dict[str, Any]:
+    """
+    The frontend's "name: description" lines as an object schema requiring
+    those fields, each a string (so Gemini can be constrained to it)
+    """
+    properties: Dict[str, Any] = {}
+    for line in text.splitlines():
+        match = _FIELD_LINE_RE.match(line)
+        if match:
+            field: Dict[str, Any] = {"type": "string"}
+            if match.group(2).strip():
+                field["description"] = match.group(2).strip()
+            properties[match.group(1).strip()] = field
+    if not properties:
+        raise ValueError("output_schema has no 'field: description' lines")
+    return {"type": "object", "properties": properties, "required": list(properties)}
+
+
+class OutputSchema:
+    """A compiled output schema plus the generation config that asks Gemini for it"""
+
+    def __init__(self, schema: Dict[str, Any]):
+        self.schema = schema
+        self._validate = compile_validator(schema)
+        response_schema = model_schema(schema)
+        self.constrained = response_schema is not None
+        # Without a Gemini-compatible schema the model gets JSON mode and the schema in the prompt
+        self.generation_config = {**JSON_MODE, "response_schema": response_schema} if self.constrained else dict(JSON_MODE)
+        self.prompt_hint = "" if self.constrained else "\nAnswer with a JSON object matching this JSON Schema: " + json.dumps(schema, ensure_ascii=False)
+
+    @classmethod
+    def parse(cls, value: Union[str, Dict[str, Any], None]) -> Optional["OutputSchema"]:
+        """A request's output_schema (JSON Schema object or string, or field lines); None when unset"""
+        if value is None or (isinstance(value, str) and not value.strip()):
+            return None
+        if isinstance(value, dict):
+            return _compiled(json.dumps(value, sort_keys=True))
+        return _compiled_text(value.strip())
+
+    def validate(self, value: Any) -> List[str]:
+        errors: List[str] = []
+        self._validate(value, "$", errors)
+        return errors
+
+    def decode(self, text: str) -> Tuple[Any, List[str]]:
+        """(value, errors) for a model answer; errors is empty when it parses and validates"""
+        try:
+            value = extract_json(text)
+        except (ValueError, IndexError) as e:
+            return None, [f"not valid JSON ({e})"]
+        return value, self.validate(value)
+
+    @staticmethod
+    def repair_prompt(prompt: str, answer: str, errors: List[str]) -> str:
+        shown = errors[:MAX_REPORTED_ERRORS] + ([f"... and {len(errors) - MAX_REPORTED_ERRORS} more"] if len(errors) > MAX_REPORTED_ERRORS else [])
+        return (
+            f"{prompt}\n\nYour previous answer was:\n{(answer or '').strip()[:4000]}\n\n"
+            "It is invalid:\n- " + "\n- ".join(shown) +
+            "\n\nReturn the corrected JSON only, keeping every correct value unchanged."
+        )
+
+
+def decode_answer(text: Optional[str], schema: Optional[OutputSchema] = None) -> Tuple[Any, List[str]]:
+    """(value, errors) for a model answer, validated against the schema if there is one"""
+    if schema is not None:
+        return schema.decode(text or "")
+    try:
+        return extract_json(text or "{}"), []
+    except (ValueError, IndexError) as e:
+        return None, [f"not valid JSON ({e})"]
+
+
+@lru_cache(maxsize=64)
+def _compiled(schema_json: str) -> OutputSchema:
+    return OutputSchema(json.loads(schema_json))
+
+
+@lru_cache(maxsize=64)
+def _compiled_text(text: str) -> OutputSchema:
+    if text.startswith("{"):
+        return _compiled(json.dumps(json.loads(text), sort_keys=True))
+    return OutputSchema(schema_from_fields(text))
+
+
+# Keyword Kombat's answer shape; scores outside 10-100 are clamped by the callers, not repaired
+KOMBAT_SCHEMA = OutputSchema({
+    "type": "object",
+    "properties": {
+        "Keyword": {"type": "string"},
+        "RelevanceScore": {"type": "integer", "description": "Relevance score from 10 to 100"},
+        "Rationale": {"type": "string", "description": "1-2 sentences"},
+    },
+    "required": ["Keyword", "RelevanceScore", "Rationale"],
+})
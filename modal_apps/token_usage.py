@@ -0,0 +1,129 @@
+"""
+🪙 Token Usage - token and cost accounting for the Gemini calls
+Every model response's usage_metadata is folded into a TokenUsage (per row
+and per request); a TokenBudget built from a request's max_tokens_budget /
+max_cost tells the schedulers when to stop starting new calls. Usage from
+other containers travels as plain dicts, like RequestMetrics.
+"""
+
+import math
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+DEFAULT_MODEL = "models/gemini-2.5-flash"
+
+# USD per 1M tokens (input, output); thinking tokens are billed as output
+MODEL_PRICES_PER_1M: Dict[str, Tuple[float, float]] = {
+    "models/gemini-2.5-flash": (0.30, 2.50),
+    "models/gemini-2.5-flash-lite": (0.10, 0.40),
+    "models/gemini-2.5-pro": (1.25, 10.00),
+}
+
+
+def usage_of(response: Any) -> Tuple[int, int]:
+    """(prompt_tokens, output_tokens) of one response; (0, 0) when the SDK reports no usage"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return 0, 0
+    prompt = getattr(usage, "prompt_token_count", 0) or 0
+    total = getattr(usage, "total_token_count", 0) or 0
+    # total includes thinking tokens, which candidates_token_count leaves out
+    output = total - prompt if total >= prompt and total else getattr(usage, "candidates_token_count", 0) or 0
+    return int(prompt), int(output)
+
+
+def cost_of(prompt_tokens: float, output_tokens: float, model: str = DEFAULT_MODEL) -> float:
+    input_price, output_price = MODEL_PRICES_PER_1M.get(model, MODEL_PRICES_PER_1M[DEFAULT_MODEL])
+    return (prompt_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+class TokenUsage:
+    """Running token and cost totals for a row, a worker or a whole request"""
+
+    __slots__ = ("model", "calls", "prompt_tokens", "output_tokens", "_cost")
+
+    def __init__(self, model: str = DEFAULT_MODEL):
+        self.model = model
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self._cost = 0.0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.output_tokens
+
+    @property
+    def cost(self) -> float:
+        return self._cost
+
+    def add(self, prompt_tokens: int, output_tokens: int, calls: int = 1, model: Optional[str] = None):
+        """Count tokens at the price of `model` (default: this usage's model, e.g. for a cascade tier)"""
+        self.calls += calls
+        self.prompt_tokens += prompt_tokens
+        self.output_tokens += output_tokens
+        self._cost += cost_of(prompt_tokens, output_tokens, model or self.model)
+
+    def add_response(self, response: Any, model: Optional[str] = None) -> Tuple[int, int]:
+        """Count one model response; returns its (prompt_tokens, output_tokens)"""
+        tokens = usage_of(response)
+        self.add(*tokens, model=model)
+        return tokens
+
+    def merge(self, data: Optional[Dict[str, Any]]):
+        if not data:
+            return
+        prompt_tokens, output_tokens = data.get("prompt_tokens", 0), data.get("output_tokens", 0)
+        self.calls += data.get("calls", 0)
+        self.prompt_tokens += prompt_tokens
+        self.output_tokens += output_tokens
+        # The sender's cost already prices each call at its own model
+        self._cost += data["cost_usd"] if "cost_usd" in data else cost_of(prompt_tokens, output_tokens, self.model)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "output_tokens": self.output_tokens,
+            "total_tokens": self.total_tokens,
+            "cost_usd": round(self.cost, 6),
+        }
+
+
+class TokenBudget:
+    """
+    A request's optional token and cost ceilings. Schedulers check exhausted()
+    before starting a call; calls already in flight still finish, so a run can
+    overshoot by at most its concurrency times the cost of one call.
+    """
+
+    def __init__(self, max_tokens: Optional[int] = None, max_cost: Optional[float] = None):
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+
+    def __bool__(self) -> bool:
+        return self.max_tokens is not None or self.max_cost is not None
+
+    def exhausted(self, usage: TokenUsage) -> bool:
+        if self.max_tokens is not None and usage.total_tokens >= self.max_tokens:
+            return True
+        return self.max_cost is not None and usage.cost >= self.max_cost
+
+    def share(self, spent: TokenUsage, reserved: Iterable["TokenBudget"], parts: int) -> "TokenBudget":
+        """
+        An equal slice of what is neither spent nor reserved by shares already
+        handed out, split over `parts` consumers (e.g. the free worker slots)
+        """
+        reserved = list(reserved)
+        parts = max(1, parts)
+        max_tokens = max_cost = None
+        if self.max_tokens is not None:
+            left = self.max_tokens - spent.total_tokens - sum(r.max_tokens or 0 for r in reserved)
+            max_tokens = max(0, math.floor(left / parts))
+        if self.max_cost is not None:
+            left = self.max_cost - spent.cost - sum(r.max_cost or 0 for r in reserved)
+            max_cost = max(0.0, left / parts)
+        return TokenBudget(max_tokens, max_cost)
+
+    def is_empty(self) -> bool:
+        return self.max_tokens == 0 or self.max_cost == 0.0
@@ -0,0 +1,204 @@
+"""
+🔔 Webhooks - signed job callbacks for the Modal apps
+Instead of polling /status, callers pass a callback_url (and optionally a
+progress_callback_url) and get the job's result POSTed when it finishes,
+plus one POST per completed chunk or batch. Each body is signed with
+HMAC-SHA256 and retried with jittered exponential backoff on network
+errors, 408/425/429 and 5xx.
+
+Signature header: X-Frontand-Signature: t=<unix ts>,v1=<hex hmac of "<t>." + body>
+The key is the request's callback_secret, else WEBHOOK_SIGNING_SECRET (from
+the "webhook-signing" Modal secret mounted on every app that sends callbacks).
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+WEBHOOK_SIGNING_SECRET = os.environ.get("WEBHOOK_SIGNING_SECRET", "")
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get("WEBHOOK_MAX_ATTEMPTS", "6"))
+WEBHOOK_TIMEOUT = 15.0
+# Jittered exponential backoff between delivery attempts (seconds)
+WEBHOOK_BACKOFF_BASE = 1.0
+WEBHOOK_BACKOFF_MAX = 60.0
+# Receivers should reject signatures older than this (seconds)
+SIGNATURE_TOLERANCE = 300
+
+SIGNATURE_HEADER = "X-Frontand-Signature"
+EVENT_HEADER = "X-Frontand-Event"
+DELIVERY_HEADER = "X-Frontand-Delivery"
+RETRYABLE_STATUS = {408, 425, 429}
+
+
+def sign(body: bytes, secret: str, timestamp: Optional[int] = None) -> str:
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    digest = hmac.new(secret.encode("utf-8"), f"{timestamp}.".encode("utf-8") + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+def verify(body: bytes, header: str, secret: str, tolerance: int = SIGNATURE_TOLERANCE) -> bool:
+    """Receiver-side check of a signature header (constant-time, with replay window)"""
+    try:
+        parts = dict(item.split("=", 1) for item in header.split(","))
+        timestamp = int(parts["t"])
+    except (KeyError, ValueError):
+        return False
+    if abs(time.time() - timestamp) > tolerance:
+        return False
+    return hmac.compare_digest(sign(body, secret, timestamp), f"t={timestamp},v1={parts.get('v1', '')}")
+
+
+async def post_webhook(
+    url: str,
+    event: str,
+    payload: Dict[str, Any],
+    secret: str = "",
+    max_attempts: int = WEBHOOK_MAX_ATTEMPTS,
+    delivery_id: Optional[str] = None
+) -> bool:
+    """POST one signed event, retrying transient failures; True once the receiver answers 2xx"""
+    import aiohttp
+
+    body = json.dumps(payload, default=str).encode("utf-8")
+    # Same delivery id on every attempt, so receivers can drop duplicates
+    delivery_id = delivery_id or uuid.uuid4().hex
+    error = ""
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=WEBHOOK_TIMEOUT)) as session:
+        for attempt in range(1, max(1, max_attempts) + 1):
+            headers = {"Content-Type": "application/json", EVENT_HEADER: event, DELIVERY_HEADER: delivery_id}
+            if secret:
+                # Re-signed per attempt, so a late retry still passes the receiver's replay window
+                headers[SIGNATURE_HEADER] = sign(body, secret)
+            retry_after = 0.0
+            try:
+                async with session.post(url, data=body, headers=headers) as resp:
+                    if resp.status < 300:
+                        print(f"[webhook] delivered event={event} delivery={delivery_id} attempt={attempt} status={resp.status}")
+                        return True
+                    error = f"HTTP {resp.status}"
+                    if resp.status not in RETRYABLE_STATUS and resp.status < 500:
+                        break
+                    header = resp.headers.get("Retry-After", "")
+                    retry_after = float(header) if header.isdigit() else 0.0
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            if attempt < max_attempts:
+                backoff = min(WEBHOOK_BACKOFF_MAX, WEBHOOK_BACKOFF_BASE * 2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+                await asyncio.sleep(min(WEBHOOK_BACKOFF_MAX, max(backoff, retry_after)))
+    print(f"[webhook] failed event={event} delivery={delivery_id} url={url} err={error}")
+    return False
+
+
+class WebhookNotifier:
+    """
+    Job callbacks for one request. callback_url makes the request asynchronous
+    (answered with 202 and a request_id); the frontend's config.webhook_url only
+    adds a completion POST to the normal response. Progress POSTs are sent in the
+    background and always settle before the completion POST.
+    """
+
+    def __init__(
+        self,
+        app: str,
+        callback_url: Optional[str] = None,
+        progress_callback_url: Optional[str] = None,
+        secret: Optional[str] = None,
+        request_id: Optional[str] = None,
+        asynchronous: bool = False
+    ):
+        self.app = app
+        self.callback_url = callback_url
+        self.progress_callback_url = progress_callback_url
+        self.secret = secret or WEBHOOK_SIGNING_SECRET
+        self.request_id = request_id or str(uuid.uuid4())
+        self.asynchronous = asynchronous and bool(callback_url)
+        self._sequence = 0
+        self._pending: List[asyncio.Task] = []
+
+    @classmethod
+    def from_request(cls, app: str, request: Any, request_id: Optional[str] = None) -> "WebhookNotifier":
+        config = getattr(request, "config", None) or {}
+        callback_url = getattr(request, "callback_url", None)
+        return cls(
+            app,
+            callback_url=callback_url or config.get("webhook_url"),
+            progress_callback_url=getattr(request, "progress_callback_url", None) or config.get("progress_webhook_url"),
+            secret=getattr(request, "callback_secret", None),
+            request_id=request_id or getattr(request, "request_id", None),
+            asynchronous=bool(callback_url),
+        )
+
+    def __bool__(self) -> bool:
+        return bool(self.callback_url or self.progress_callback_url)
+
+    def envelope(self, event: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        return {"event": event, "app": self.app, "request_id": self.request_id, "sent_at": time.time(), "data": data}
+
+    def accepted(self) -> Dict[str, Any]:
+        """Body of the 202 answer to an asynchronous request"""
+        return {"status": "accepted", "request_id": self.request_id, "callback_url": self.callback_url}
+
+    def progress(self, data: Dict[str, Any]):
+        """Queue a job.progress POST (one per finished chunk/batch) without blocking the job"""
+        if not self.progress_callback_url:
+            return
+        self._sequence += 1
+        payload = self.envelope("job.progress", {"sequence": self._sequence, **data})
+        self._pending.append(asyncio.create_task(post_webhook(self.progress_callback_url, "job.progress", payload, self.secret)))
+
+    async def drain(self):
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+            self._pending.clear()
+
+    async def complete(self, data: Dict[str, Any], failed: bool = False) -> bool:
+        await self.drain()
+        if not self.callback_url:
+            return False
+        event = "job.failed" if failed else "job.completed"
+        return await post_webhook(self.callback_url, event, self.envelope(event, data), self.secret)
+
+    async def deliver_response(self, work: Awaitable[Any]):
+        """Await an endpoint's response (or an already computed one) and POST its JSON body as the completion"""
+        from fastapi import HTTPException
+
+        try:
+            response = await work
+        except HTTPException as e:
+            await self.complete({"error": e.detail, "status_code": e.status_code}, failed=True)
+            return
+        except Exception as e:
+            await self.complete({"error": str(e), "status_code": 500}, failed=True)
+            return
+        body = getattr(response, "body", None)
+        data = json.loads(body) if body is not None else response
+        await self.complete(data, failed=getattr(response, "status_code", 200) >= 400)
+
+
+async def _completed(value: Any) -> Any:
+    return value
+
+
+async def respond_with_callbacks(notifier: WebhookNotifier, background_tasks: Any, work: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Run an endpoint's work according to the request's callbacks: asynchronous
+    requests get 202 now and the result POSTed after the response (FastAPI
+    background tasks run before the ASGI call returns, so the container stays
+    up); synchronous ones are answered normally and the body is POSTed too.
+    """
+    from fastapi.responses import JSONResponse
+
+    if notifier.asynchronous:
+        background_tasks.add_task(notifier.deliver_response, work())
+        return JSONResponse(notifier.accepted(), status_code=202)
+    response = await work()
+    if notifier.callback_url and getattr(response, "body", None) is not None:
+        background_tasks.add_task(notifier.deliver_response, _completed(response))
+    return response
+